@@ -0,0 +1,186 @@
+"""
+Compact preprocessed store of the airport coordinates.
+
+The airport CSV is converted once into a binary .npy file next to it, holding one contiguous float64 row
+per field: latitude and longitude in degrees and radians, cos(latitude) and the 3D unit vector of each
+airport. Airports are sorted by country and a small JSON header keeps the per-country offsets together
+with the size and modification time of the CSV. At startup the .npy file is memory-mapped, so the CSV is
+not parsed and every process using the store shares the same pages. The store is rebuilt automatically
+when the CSV changes.
+
+Usage:
+    python airport_store.py --airports data/gadb_country_declatlon.csv
+"""
+import argparse
+import json
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+
+FORMAT_VERSION = 1
+FIELDS = ('latitude', 'longitude', 'lat_rad', 'lon_rad', 'cos_lat', 'x', 'y', 'z')
+
+
+class AirportStore:
+    """
+    A class to hold airport coordinates in a memory-mapped array with a per-country offset table.
+    """
+    def __init__(self, table: np.ndarray, countries: list, offsets: list):
+        """
+        Initialize the AirportStore.
+
+        :param table: Array with one row per field in FIELDS and one column per airport.
+        :param countries: Country names in the order the airports are sorted.
+        :param offsets: Index of the first airport of each country, followed by the number of airports.
+        """
+        self.table = table
+        self.countries = list(countries)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        for row, field in enumerate(FIELDS):
+            setattr(self, field, table[row])
+        self.vectors = table[5:8].T
+
+    def __len__(self) -> int:
+        return self.table.shape[1]
+
+    @staticmethod
+    def paths(airports_file: str) -> tuple:
+        """
+        Get the paths of the binary file and the header of the store of an airport CSV file.
+        """
+        stem = os.path.splitext(airports_file)[0]
+        return f'{stem}.airports.npy', f'{stem}.airports.json'
+
+    @staticmethod
+    def source_signature(airports_file: str) -> dict:
+        """
+        Get the size and modification time of the airport CSV file, used to detect changes.
+        """
+        status = os.stat(airports_file)
+        return {'size': status.st_size, 'mtime_ns': status.st_mtime_ns}
+
+    @classmethod
+    def from_csv(cls, airports_file: str) -> 'AirportStore':
+        """
+        Build the store in memory from the airport CSV file.
+
+        :param airports_file: Path to the airports CSV file.
+        :return: The store.
+        :rtype: AirportStore
+        """
+        airports = pd.read_csv(airports_file).sort_values('COUNTRY', kind='stable')
+        latitudes = airports['LAT'].to_numpy(dtype=float)
+        longitudes = airports['LONG'].to_numpy(dtype=float)
+        lat_rad, lon_rad = np.radians(latitudes), np.radians(longitudes)
+        cos_lat = np.cos(lat_rad)
+        table = np.vstack((latitudes, longitudes, lat_rad, lon_rad, cos_lat,
+                           cos_lat * np.cos(lon_rad), cos_lat * np.sin(lon_rad), np.sin(lat_rad)))
+        countries, starts = np.unique(airports['COUNTRY'].to_numpy(dtype=str), return_index=True)
+        return cls(table, countries.tolist(), starts.tolist() + [len(airports)])
+
+    def save(self, airports_file: str):
+        """
+        Write the store next to the airport CSV file. Both files are written to temporary files first
+        and renamed into place, the header last, so a reader never sees a half-written store.
+
+        :param airports_file: Path to the airports CSV file the store was built from.
+        """
+        table_path, header_path = self.paths(airports_file)
+        directory = os.path.dirname(os.path.abspath(table_path))
+        header = {'format': FORMAT_VERSION, 'fields': list(FIELDS), 'countries': self.countries,
+                  'offsets': self.offsets.tolist(), 'source': self.source_signature(airports_file)}
+        for path, write in ((table_path, lambda file: np.save(file, np.ascontiguousarray(self.table))),
+                            (header_path, lambda file: file.write(json.dumps(header).encode()))):
+            handle, temporary = tempfile.mkstemp(suffix='.tmp', dir=directory)
+            try:
+                with os.fdopen(handle, 'wb') as file:
+                    write(file)
+                os.chmod(temporary, 0o644)
+                os.replace(temporary, path)
+            except BaseException:
+                if os.path.exists(temporary):
+                    os.remove(temporary)
+                raise
+
+    @classmethod
+    def load(cls, airports_file: str):
+        """
+        Memory-map the store of an airport CSV file.
+
+        :param airports_file: Path to the airports CSV file.
+        :return: The store, or None if it is missing or older than the CSV file.
+        :rtype: AirportStore
+        """
+        table_path, header_path = cls.paths(airports_file)
+        try:
+            with open(header_path) as file:
+                header = json.load(file)
+            if (header.get('format') != FORMAT_VERSION or
+                    header.get('source') != cls.source_signature(airports_file)):
+                return None
+            table = np.load(table_path, mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+        if table.shape != (len(FIELDS), header['offsets'][-1]):
+            return None
+        return cls(table, header['countries'], header['offsets'])
+
+    @classmethod
+    def open(cls, airports_file: str) -> 'AirportStore':
+        """
+        Memory-map the store of an airport CSV file, building it first if it is missing or out of date.
+        If the store cannot be written, it is built in memory.
+
+        :param airports_file: Path to the airports CSV file.
+        :return: The store.
+        :rtype: AirportStore
+        """
+        store = cls.load(airports_file)
+        if store is not None:
+            return store
+        store = cls.from_csv(airports_file)
+        try:
+            store.save(airports_file)
+        except OSError:
+            return store
+        return cls.load(airports_file) or store
+
+    def country_slice(self, country: str) -> slice:
+        """
+        Get the range of airports of a country.
+
+        :param country: The country name as written in the airport data, e.g. 'THAILAND'.
+        :return: The slice of the airports of the country (empty if the country is unknown).
+        :rtype: slice
+        """
+        index = np.searchsorted(self.countries, country)
+        if index == len(self.countries) or self.countries[index] != country:
+            return slice(0, 0)
+        return slice(int(self.offsets[index]), int(self.offsets[index + 1]))
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Get the airports as a DataFrame with the COUNTRY, LAT and LONG columns of the CSV file.
+
+        :rtype: pandas.DataFrame
+        """
+        return pd.DataFrame({'COUNTRY': np.repeat(self.countries, np.diff(self.offsets)),
+                             'LAT': np.array(self.latitude), 'LONG': np.array(self.longitude)})
+
+
+def main():
+    """
+    Build the airport store from the command line.
+    """
+    parser = argparse.ArgumentParser(description='Preprocess the airport CSV file into a memory-mapped store.')
+    parser.add_argument('--airports', default=os.path.join('data', 'gadb_country_declatlon.csv'))
+    args = parser.parse_args()
+    store = AirportStore.from_csv(args.airports)
+    store.save(args.airports)
+    table_path, header_path = AirportStore.paths(args.airports)
+    print(f'Wrote {len(store):,} airports in {len(store.countries)} countries to {table_path} and {header_path}')
+
+
+if __name__ == '__main__':
+    main()
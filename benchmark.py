@@ -0,0 +1,510 @@
+"""
+Benchmarks for UFODataProcessor and GraphGenerator.
+
+Runs headless on synthetic datasets, writes the timings as JSON and optionally compares them
+against a stored baseline.
+
+Usage:
+    python benchmark.py --sizes 1000 10000 100000 1000000 --output bench.json
+    python benchmark.py --baseline bench_baseline.json --threshold 0.25
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+import numpy as np
+import pandas as pd
+from chart_renderer import ChartRenderer
+from data_processor import DuplicateDetector, UFODataProcessor
+from exporter import ReportExporter
+from filter_expression import quote
+from graph_generator import DASHBOARD_CHARTS, GraphGenerator
+from heatmap import HeatmapRenderer
+from search_index import SearchIndex
+from spatial_index import GridIndex
+from synthetic_data import generate_reports
+from time_index import TimeIndex
+
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCHMARKS = {}
+# Shared by the dashboard benchmarks so the worker processes are started once
+CHART_RENDERER = ChartRenderer()
+
+
+def benchmark(name: str):
+    """
+    Register a benchmark.
+
+    The decorated function receives the benchmark context and returns a function that is timed.
+    Everything done before returning is setup and is not timed.
+
+    :param name: The name of the benchmark.
+    """
+    def register(function):
+        BENCHMARKS[name] = function
+        return function
+    return register
+
+
+class BenchmarkContext:
+    """
+    A synthetic dataset written to a temporary directory laid out like the application's data folder.
+    """
+    def __init__(self, size: int, directory: str, seed: int = 0):
+        """
+        Initialize the BenchmarkContext.
+
+        :param size: Number of reports in the synthetic dataset.
+        :param directory: Directory in which the data folder is created.
+        :param seed: Seed for the synthetic data.
+        """
+        self.size = size
+        self.directory = directory
+        self.reports_file = os.path.join(directory, 'data', 'nuforc_data.csv')
+        self.airports_file = os.path.join(directory, 'data', 'gadb_country_declatlon.csv')
+        os.makedirs(os.path.join(directory, 'data'), exist_ok=True)
+        generate_reports(size, seed).to_csv(self.reports_file, index=False)
+        pd.read_csv(os.path.join(SOURCE_DIR, 'data', 'gadb_country_declatlon.csv')).to_csv(
+            self.airports_file, index=False)
+        self._processor = None
+
+    @property
+    def processor(self) -> UFODataProcessor:
+        """
+        A UFODataProcessor over the synthetic dataset, created on first use.
+        """
+        if self._processor is None:
+            self._processor = UFODataProcessor(self.reports_file, self.airports_file)
+        return self._processor
+
+    def graph_generator(self) -> GraphGenerator:
+        """
+        Create a GraphGenerator with an empty derived-data cache.
+        """
+        self.processor._cache.clear()
+        return GraphGenerator(self.processor)
+
+
+def render(figure_and_axis):
+    """
+    Draw a generated figure with the Agg backend and close it.
+    """
+    fig, _ = figure_and_axis
+    fig.canvas.draw()
+    plt.close(fig)
+
+
+@benchmark('UFODataProcessor.__init__')
+def bench_init(context):
+    return lambda: UFODataProcessor(context.reports_file, context.airports_file)
+
+
+@benchmark('UFODataProcessor.find_nearest_airport')
+def bench_find_nearest_airport(context):
+    processor = context.processor
+    return lambda: processor.find_nearest_airport(13.75, 100.5, processor.airports)
+
+
+@benchmark('UFODataProcessor.save_to_csv')
+def bench_save_to_csv(context):
+    processor = context.processor
+    cwd = os.getcwd()
+
+    def run():
+        os.chdir(context.directory)
+        try:
+            processor.save_to_csv('05/01/2020 22:00', 'Thailand', 'Bangkok', 13.75, 100.5, 'Light',
+                                  120.0, 'Benchmark report.')
+        finally:
+            os.chdir(cwd)
+    return run
+
+
+@benchmark('UFODataProcessor.submit_report')
+def bench_submit_report(context):
+    processor = context.processor
+    processor.duplicate_detector
+    return lambda: processor.submit_report('05/01/2020 22:00', 'Thailand', 'Bangkok', 13.75, 100.5, 'Light',
+                                           120.0, 'Benchmark report.')[0].result()
+
+
+@benchmark('UFODataProcessor.calculate_statistics')
+def bench_calculate_statistics(context):
+    processor = context.processor
+    columns = processor.get_numerical_columns()
+    return lambda: [processor.calculate_statistics(column) for column in columns]
+
+
+@benchmark('UFODataProcessor.filter_reports')
+def bench_filter_reports(context):
+    data = context.processor.get_ufo_data()
+    return lambda: UFODataProcessor.filter_reports(data, 'Thailand', '2001-2010', 'Light')
+
+
+@benchmark('UFODataProcessor.filter_mask')
+def bench_filter_mask(context):
+    processor = context.processor
+    data = processor.get_ufo_data()
+    expression = ("country in ('Thailand', 'Vietnam') and 1990 <= year_found < 2000 "
+                  "and length_of_encounter_seconds > 60")
+    return lambda: processor.filter_mask(expression, data)
+
+
+@benchmark('SearchIndex.from_reports')
+def bench_search_index_build(context):
+    data = context.processor.get_ufo_data()
+    return lambda: SearchIndex.from_reports(data)
+
+
+@benchmark('UFODataProcessor.search')
+def bench_search(context):
+    processor = context.processor
+    return lambda: [processor.search(query, limit=100) for query in ('light', 'bright lig*', 'kuala lumpur')]
+
+
+@benchmark('TimeIndex.from_reports')
+def bench_time_index_build(context):
+    data = context.processor.get_ufo_data()
+    return lambda: TimeIndex.from_reports(data)
+
+
+@benchmark('UFODataProcessor.sightings_between')
+def bench_sightings_between(context):
+    processor = context.processor
+    return lambda: [processor.sightings_between(start, end) for start, end in
+                    (('1990-01-01', '2000-01-01'), ('2010-06-01', '2010-07-01'), (None, '1970-01-01'))]
+
+
+@benchmark('UFODataProcessor.sightings_within_radius')
+def bench_sightings_within_radius(context):
+    processor = context.processor
+    return lambda: [processor.sightings_within_radius(13.75, 100.5, radius) for radius in (10, 100, 500)]
+
+
+@benchmark('UFODataProcessor.nearest_sightings')
+def bench_nearest_sightings(context):
+    processor = context.processor
+    return lambda: processor.nearest_sightings(13.75, 100.5, 10)
+
+
+@benchmark('GridIndex.add')
+def bench_grid_index_add(context):
+    reports = context.processor.ufo_reports
+    latitudes = pd.to_numeric(reports['latitude'], errors='coerce').to_numpy(dtype=float)
+    longitudes = pd.to_numeric(reports['longitude'], errors='coerce').to_numpy(dtype=float)
+    added = min(1000, len(reports))
+
+    def run():
+        index = GridIndex(latitudes[:-added], longitudes[:-added], cell_size=0.25)
+        extent = index.row_range, index.column_range
+        # Reports synced without a position must not stretch the range a ring search has to cover
+        index.add(np.nan, np.nan)
+        if (index.row_range, index.column_range) != extent:
+            raise AssertionError('A point without a position changed the extent of the grid')
+        for latitude, longitude in zip(latitudes[-added:], longitudes[-added:]):
+            index.add(latitude, longitude)
+        return index.nearest(13.75, 100.5, 10)
+    return run
+
+
+@benchmark('DuplicateDetector.find_clusters')
+def bench_find_duplicate_clusters(context):
+    data = context.processor.get_ufo_data()
+    return lambda: DuplicateDetector.from_reports(data).find_clusters()
+
+
+@benchmark('HeatmapRenderer.render')
+def bench_heatmap_render(context):
+    data = context.processor.get_ufo_data()
+    renderer = HeatmapRenderer(data['latitude'], data['longitude'])
+
+    def run():
+        # A 600x500 view around Bangkok at a country-wide, a regional and a city zoom level
+        for zoom in (5, 8, 12):
+            x, y = (value * renderer.scale(zoom) for value in HeatmapRenderer.project(13.75, 100.5))
+            renderer.render(zoom, renderer.region_for(zoom, (x - 300, y - 250, x + 300, y + 250)))
+    return run
+
+
+@benchmark('ReportExporter.export')
+def bench_export(context):
+    data = context.processor.get_ufo_data()
+    positions = np.flatnonzero(data['country'].to_numpy() == 'Thailand')
+    path = os.path.join(context.directory, 'export.csv')
+    return lambda: ReportExporter(data, positions).export(path)
+
+
+@benchmark('GraphGenerator.remove_all_outliers')
+def bench_remove_all_outliers(context):
+    data = context.processor.get_ufo_data()
+    return lambda: GraphGenerator.remove_all_outliers(data)
+
+
+@benchmark('UFODataProcessor.clean_reports_after_append')
+def bench_clean_reports_after_append(context):
+    processor = context.processor
+    report = processor.ufo_reports.iloc[[0]]
+    processor.clean_reports()
+
+    def run():
+        processor.append_reports(report)
+        processor.record_change('append', [len(processor.ufo_reports) - 1])
+        processor.clean_reports()
+    return run
+
+
+@benchmark('GraphGenerator.generate_histogram')
+def bench_generate_histogram(context):
+    graph_gen = context.graph_generator()
+    return lambda: render(graph_gen.generate_histogram('hour', 'hour', 'Frequency', 'Histogram', 'blue'))
+
+
+@benchmark('GraphGenerator.generate_pie_chart')
+def bench_generate_pie_chart(context):
+    graph_gen = context.graph_generator()
+    return lambda: render(graph_gen.generate_pie_chart('UFO_shape', 'Pie Chart', legend=True))
+
+
+@benchmark('GraphGenerator.generate_line_graph')
+def bench_generate_line_graph(context):
+    graph_gen = context.graph_generator()
+    return lambda: render(graph_gen.generate_line_graph('latitude', 'length_of_encounter_seconds',
+                                                        'Line Graph', 'x', 'y', 'blue'))
+
+
+@benchmark('GraphGenerator.generate_scatter_plot')
+def bench_generate_scatter_plot(context):
+    graph_gen = context.graph_generator()
+    return lambda: render(graph_gen.generate_scatter_plot('latitude', 'longitude',
+                                                          'Scatter Plot', 'x', 'y', 'blue'))
+
+
+@benchmark('GraphGenerator.generate_bar_graph')
+def bench_generate_bar_graph(context):
+    graph_gen = context.graph_generator()
+    return lambda: render(graph_gen.generate_bar_graph('country', 'length_of_encounter_seconds',
+                                                       'Bar Graph', 'x', 'y', 'blue'))
+
+
+@benchmark('GraphGenerator.preview_reused_figure')
+def bench_preview_reused_figure(context):
+    graph_gen = context.graph_generator()
+    # Like the custom graph page: one figure is cleared and redrawn for every preview
+    fig = Figure()
+    FigureCanvasAgg(fig)
+
+    def run():
+        for color in ('blue', 'green', 'red'):
+            fig.clear()
+            graph_gen.generate_bar_graph('country', 'length_of_encounter_seconds', 'Bar Graph', 'x', 'y', color,
+                                         ax=fig.add_subplot())
+            fig.canvas.draw()
+    return run
+
+
+@benchmark('GraphGenerator.generate_histogram1')
+def bench_generate_histogram1(context):
+    graph_gen = context.graph_generator()
+
+    def run():
+        context.processor._cache.clear()
+        render(graph_gen.generate_histogram1())
+    return run
+
+
+@benchmark('GraphGenerator.generate_histogram2')
+def bench_generate_histogram2(context):
+    graph_gen = context.graph_generator()
+
+    def run():
+        context.processor._cache.clear()
+        render(graph_gen.generate_histogram2())
+    return run
+
+
+@benchmark('GraphGenerator.generate_year_line')
+def bench_generate_year_line(context):
+    graph_gen = context.graph_generator()
+    return lambda: render(graph_gen.generate_year_line())
+
+
+@benchmark('GraphGenerator.generate_top_cities_bar_chart')
+def bench_generate_top_cities_bar_chart(context):
+    graph_gen = context.graph_generator()
+    return lambda: render(graph_gen.generate_top_cities_bar_chart())
+
+
+@benchmark('GraphGenerator.generate_pie_chart_ufo_shape')
+def bench_generate_pie_chart_ufo_shape(context):
+    graph_gen = context.graph_generator()
+    return lambda: render(graph_gen.generate_pie_chart_ufo_shape())
+
+
+@benchmark('GraphsPage.dashboard_sequential')
+def bench_dashboard_sequential(context):
+    graph_gen = context.graph_generator()
+
+    def run():
+        context.processor._cache.clear()
+        for generate in (graph_gen.generate_histogram1, graph_gen.generate_histogram2,
+                         graph_gen.generate_pie_chart_ufo_shape, graph_gen.generate_top_cities_bar_chart,
+                         graph_gen.generate_year_line):
+            render(generate())
+    return run
+
+
+@benchmark('GraphsPage.dashboard_parallel')
+def bench_dashboard_parallel(context):
+    graph_gen = context.graph_generator()
+    # One render first, so the worker processes are started and have imported the plotting modules
+    for future in CHART_RENDERER.render(graph_gen).values():
+        future.result()
+
+    def run():
+        context.processor._cache.clear()
+        for future in CHART_RENDERER.render(graph_gen).values():
+            future.result()
+    return run
+
+
+@benchmark('GraphsPage.dashboard_cross_filter')
+def bench_dashboard_cross_filter(context):
+    processor = context.processor
+    GraphGenerator(processor).dashboard_inputs('pie_chart_ufo_shape')
+    for column in ('UFO_shape', 'location', 'year_found'):
+        processor.column_codes(column)
+    # A different map selection on every run, as when the user switches filters; aggregation only
+    selections = itertools.cycle([processor.filter_mask(f'UFO_shape == {quote(shape)}')
+                                  for shape in processor.ufo_reports['UFO_shape'].dropna().unique()])
+
+    def run():
+        graph_gen = GraphGenerator(processor, selection=next(selections))
+        for name in DASHBOARD_CHARTS:
+            graph_gen.dashboard_inputs(name)
+    return run
+
+
+@benchmark('GraphGenerator.generate_correlation_graph')
+def bench_generate_correlation_graph(context):
+    graph_gen = context.graph_generator()
+
+    def run():
+        context.processor._cache.clear()
+        render(graph_gen.generate_correlation_graph(sample_size=5000))
+    return run
+
+
+def time_benchmark(function, context, repeat: int) -> dict:
+    """
+    Time one benchmark.
+
+    :param function: The registered benchmark function.
+    :param context: The BenchmarkContext to run it on.
+    :param repeat: Number of timed runs.
+    :return: Median, minimum and maximum wall time in seconds.
+    :rtype: dict
+    """
+    run = function(context)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    return {'median': statistics.median(timings), 'min': min(timings), 'max': max(timings), 'repeat': repeat}
+
+
+def run_benchmarks(sizes: list, repeat: int = 3, selected: list = None, seed: int = 0) -> dict:
+    """
+    Run the benchmarks on synthetic datasets of the given sizes.
+
+    :param sizes: Dataset sizes in rows.
+    :param repeat: Number of timed runs per benchmark.
+    :param selected: Substrings selecting which benchmarks to run (default is all).
+    :param seed: Seed for the synthetic data.
+    :return: The results keyed by '<benchmark>@<size>', plus metadata.
+    :rtype: dict
+    """
+    results = {}
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            context = BenchmarkContext(size, directory, seed)
+            for name, function in BENCHMARKS.items():
+                if selected and not any(part in name for part in selected):
+                    continue
+                results[f'{name}@{size}'] = time_benchmark(function, context, repeat)
+                print(f"{name:<50} {size:>9,} rows {results[f'{name}@{size}']['median'] * 1000:>12.2f} ms")
+    return {'meta': {'python': platform.python_version(), 'platform': platform.platform(),
+                     'numpy': np.__version__, 'pandas': pd.__version__, 'matplotlib': matplotlib.__version__,
+                     'sizes': sizes, 'repeat': repeat, 'seed': seed, 'created': time.strftime('%Y-%m-%dT%H:%M:%S')},
+            'results': results}
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """
+    Compare results against a baseline.
+
+    :param results: Output of run_benchmarks.
+    :param baseline: A previously saved output of run_benchmarks.
+    :param threshold: Allowed relative slowdown of the median, e.g. 0.25 for 25%.
+    :return: The regressions as (key, baseline median, new median, ratio) tuples.
+    :rtype: list
+    """
+    regressions = []
+    for key, result in results['results'].items():
+        reference = baseline['results'].get(key)
+        if reference is None or reference['median'] <= 0:
+            continue
+        ratio = result['median'] / reference['median']
+        marker = 'REGRESSION' if ratio > 1 + threshold else ''
+        print(f"{key:<60} {reference['median'] * 1000:>10.2f} -> {result['median'] * 1000:>10.2f} ms "
+              f"({ratio:>5.2f}x) {marker}")
+        if marker:
+            regressions.append((key, reference['median'], result['median'], ratio))
+    return regressions
+
+
+def main():
+    """
+    Run the benchmark suite from the command line.
+    """
+    parser = argparse.ArgumentParser(description='Benchmark UFODataProcessor and GraphGenerator.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--only', nargs='*', help='Run only benchmarks whose name contains one of these.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--baseline', help='Baseline JSON file to compare against.')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='Allowed relative slowdown before a result counts as a regression.')
+    args = parser.parse_args()
+
+    warnings.simplefilter(action='ignore', category=FutureWarning)
+    results = run_benchmarks(args.sizes, args.repeat, args.only, args.seed)
+    CHART_RENDERER.close()
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=2)
+    print(f'Results written to {args.output}')
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f'{len(regressions)} benchmark(s) slower than the baseline by more than {args.threshold:.0%}.')
+            sys.exit(1)
+        print('No regressions.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+
+
+class DataChange:
+    """
+    A change of the reports held by a UFODataProcessor.
+
+    Kinds:
+        'append': Reports were added at the end; positions are their row positions.
+        'update': Values of existing reports changed, e.g. the final report number of a written report.
+        'reload': The reports were read again from the file or reports were removed; positions is empty and
+            everything may differ.
+    """
+    KINDS = ('append', 'update', 'reload')
+
+    def __init__(self, kind: str, version: int, positions, reports: pd.DataFrame, columns: list = None):
+        """
+        Initialize the DataChange.
+
+        :param kind: One of KINDS.
+        :param version: The data version after the change.
+        :param positions: Row positions of the added or changed reports.
+        :param reports: All reports after the change.
+        :param columns: The columns whose values changed (default is all columns).
+        """
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown change '{kind}', use one of {', '.join(self.KINDS)}")
+        self.kind = kind
+        self.version = version
+        self.positions = np.asarray(positions, dtype=np.intp)
+        self.reports = reports
+        self.columns = list(reports.columns) if columns is None else list(columns)
+
+    def __repr__(self) -> str:
+        return f'DataChange({self.kind!r}, version={self.version}, rows={len(self.positions)})'
+
+    @property
+    def rows(self) -> pd.DataFrame:
+        """
+        The added or changed reports.
+        """
+        return self.reports.iloc[self.positions]
+
+
+class ChangeFeed:
+    """
+    A publish/subscribe feed of DataChange events.
+
+    Subscribers are called in the order they subscribed, on the thread that changed the data. An error of
+    one subscriber does not keep the others from being called; the first error is raised afterwards.
+    """
+    def __init__(self):
+        """
+        Initialize the ChangeFeed.
+        """
+        self.subscribers = []
+
+    def subscribe(self, callback):
+        """
+        Call a function with every change from now on.
+
+        :param callback: A function taking a DataChange.
+        :return: A function without arguments that unsubscribes the callback.
+        """
+        self.subscribers.append(callback)
+        return lambda: self.unsubscribe(callback)
+
+    def unsubscribe(self, callback):
+        """
+        Stop calling a function with changes. Does nothing if it is not subscribed.
+        """
+        if callback in self.subscribers:
+            self.subscribers.remove(callback)
+
+    def publish(self, change: DataChange):
+        """
+        Call every subscriber with a change.
+
+        :param change: The change.
+        """
+        error = None
+        for callback in list(self.subscribers):
+            try:
+                callback(change)
+            except Exception as callback_error:
+                error = error or callback_error
+        if error is not None:
+            raise error
@@ -0,0 +1,170 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from matplotlib import rcParams
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from graph_generator import DASHBOARD_CHARTS, GraphGenerator
+from instrumentation import span
+
+
+def render_chart(name: str, inputs, dpi: float) -> tuple:
+    """
+    Draw one of the charts of the graphs page with the Agg backend. Runs in a worker process.
+
+    :param name: A key of DASHBOARD_CHARTS.
+    :param inputs: The result of GraphGenerator.dashboard_inputs.
+    :param dpi: Resolution of the image in pixels per inch.
+    :return: The name, (width, height) of the image in pixels and its RGBA bytes.
+    :rtype: tuple
+    """
+    with span(f'render_chart.{name}'):
+        fig = Figure(figsize=DASHBOARD_CHARTS[name], dpi=dpi, tight_layout=True)
+        canvas = FigureCanvasAgg(fig)
+        GraphGenerator.draw_dashboard_chart(name, fig.add_subplot(), inputs)
+        canvas.draw()
+        return name, canvas.get_width_height(), bytes(canvas.buffer_rgba())
+
+
+def warm_up():
+    """
+    Do nothing; submitted to start a worker process and import the plotting modules in it.
+    """
+
+
+class ChartRenderer:
+    """
+    A class to rasterize the charts of the graphs page outside the Tk thread.
+
+    The data of every chart is aggregated in this process on a helper thread, so only small inputs are
+    sent to the worker processes, which draw the charts with Agg and send back RGBA images. Every chart
+    gets its own Future, so the page can show each chart as soon as it is done. Workers are started with
+    'spawn', which is safe next to the Tk thread on every platform, and kept for later renders. With a single
+    worker, or if the pool cannot be used, the charts are drawn on the helper thread instead.
+    """
+    def __init__(self, workers: int = None, dpi: float = None):
+        """
+        Initialize the ChartRenderer.
+
+        :param workers: Number of worker processes (default is one per chart, up to the number of CPUs).
+        :param dpi: Resolution of the images in pixels per inch (default is matplotlib's figure.dpi).
+        """
+        self.workers = workers if workers is not None else min(len(DASHBOARD_CHARTS), os.cpu_count() or 1)
+        self.dpi = dpi or rcParams['figure.dpi']
+        self.pool = None
+        self.closed = False
+        self.lock = threading.Lock()
+
+    def size(self, name: str) -> tuple:
+        """
+        Get the size in pixels of the image of a chart.
+
+        :param name: A key of DASHBOARD_CHARTS.
+        :return: (width, height)
+        :rtype: tuple
+        """
+        width, height = DASHBOARD_CHARTS[name]
+        return round(width * self.dpi), round(height * self.dpi)
+
+    def executor(self) -> ProcessPoolExecutor:
+        """
+        Get the process pool, starting it on first use. Returns None if charts are drawn on the helper thread.
+        """
+        with self.lock:
+            if self.pool is None and self.workers > 1 and not self.closed:
+                self.pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                mp_context=multiprocessing.get_context('spawn'))
+            return self.pool
+
+    def start(self):
+        """
+        Start the worker processes in the background, so the first render does not wait for them.
+        """
+        pool = self.executor()
+        if pool is not None:
+            for _ in range(self.workers):
+                pool.submit(warm_up)
+
+    def render(self, graph_gen: GraphGenerator, names=tuple(DASHBOARD_CHARTS)) -> dict:
+        """
+        Rasterize charts of the graphs page in the background.
+
+        :param graph_gen: The GraphGenerator holding the data of the charts.
+        :param names: Keys of DASHBOARD_CHARTS.
+        :return: A Future per name, resolved with the result of render_chart. A chart whose Future is
+            cancelled before its turn is not drawn.
+        :rtype: dict
+        """
+        futures = {name: Future() for name in names}
+        threading.Thread(target=self.run, args=(graph_gen, futures), name='ChartRenderer', daemon=True).start()
+        return futures
+
+    def run(self, graph_gen: GraphGenerator, futures: dict):
+        """
+        Aggregate the inputs of the charts and hand them to the workers, in order.
+        """
+        for name, future in futures.items():
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                inputs = graph_gen.dashboard_inputs(name)
+                if not self.submit(name, inputs, future):
+                    future.set_result(render_chart(name, inputs, self.dpi))
+            except BaseException as error:
+                future.set_exception(error)
+
+    def submit(self, name: str, inputs, future: Future) -> bool:
+        """
+        Send a chart to the process pool and resolve future with its result.
+
+        :return: False if the chart has to be drawn here because there is no usable pool.
+        :rtype: bool
+        """
+        try:
+            pool = self.executor()
+            if pool is None:
+                return False
+            rendered = pool.submit(render_chart, name, inputs, self.dpi)
+        except (BrokenProcessPool, OSError, RuntimeError):
+            self.fall_back()
+            return False
+
+        def done(result: Future):
+            if self.closed:
+                future.set_exception(RuntimeError('The chart renderer was closed'))
+                return
+            error = None if result.cancelled() else result.exception()
+            if result.cancelled() or isinstance(error, BrokenProcessPool):
+                self.fall_back()
+                try:
+                    future.set_result(render_chart(name, inputs, self.dpi))
+                except BaseException as render_error:
+                    future.set_exception(render_error)
+            elif error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result.result())
+        rendered.add_done_callback(done)
+        return True
+
+    def fall_back(self):
+        """
+        Stop using a process pool that failed, drawing the charts on the helper thread from now on.
+        """
+        with self.lock:
+            pool, self.pool = self.pool, None
+            self.workers = 1
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def close(self):
+        """
+        Stop the worker processes. Charts still being drawn are cancelled.
+        """
+        with self.lock:
+            pool, self.pool = self.pool, None
+            self.closed = True
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
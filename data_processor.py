@@ -1,14 +1,33 @@
+import contextlib
 import enum
-import os
 import datetime
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
 from math import radians, sin, cos, sqrt, atan2
+import numpy as np
 import pandas as pd
+from airport_store import AirportStore
+from change_feed import ChangeFeed, DataChange
+from file_lock import FileLock
+from filter_expression import compile_filter, quote
+from instrumentation import traced
+from outlier_filter import OutlierFilter
+from report_writer import ReportWriter, file_signature
+from search_index import SearchIndex
+from spatial_index import GridIndex, ReverseGeocoder, haversine_km
+from time_index import FOUND_FORMAT, TimeIndex, parse_datetimes
+
+LOCK_TIMEOUT = 30.0
+# Number of filters and selections whose derived values are cached, the least recently used are dropped
+SCOPE_CACHE_SIZE = 8
 
 
 class UFODataProcessor:
     """
     A class for processing UFO data.
     """
+    @traced(rows=lambda self, *args, **kwargs: len(self.ufo_reports))
     def __init__(self, ufo_reports_file, airports_file):
         """
         Initialize UFODataProcessor class.
@@ -18,9 +37,98 @@ class UFODataProcessor:
         :param airports_file: Path to the airports CSV file.
         :type airports_file: pd.Dataframe
         """
-        self.ufo_reports = pd.read_csv(ufo_reports_file)
-        self.airports = pd.read_csv(airports_file)
+        self.ufo_reports_file = ufo_reports_file
+        self.airport_store = AirportStore.open(airports_file)
+        self._airports = None
         self.new_row = {}
+        self.data_version = 0
+        # Odd while the reports are being changed, see begin_change
+        self._change_stamp = 0
+        self.changes = ChangeFeed()
+        self._cache = {}
+        self._cache_updaters = {}
+        self._scopes = OrderedDict()
+        self._scopes_lock = threading.Lock()
+        self._duplicate_detector = None
+        self._detector_thread = None
+        self._report_writer = None
+        self._pending = {}
+        self._outlier_filters = {}
+        self.load_reports()
+
+    def load_reports(self, loaded: dict = None):
+        """
+        Read the reports file under a shared file lock and build the indexes over the reports.
+
+        :param loaded: The result of read_reports run on another thread (default is reading the file now).
+        """
+        loaded = self.read_reports() if loaded is None else loaded
+        self.ufo_reports = loaded['reports']
+        self._file_signature = loaded['signature']
+        self._file_max_report_no = loaded['max_report_no']
+        self.build_indexes(loaded['indexes'])
+
+    def read_reports(self) -> dict:
+        """
+        Read the reports file under a shared file lock and build the indexes over its reports without changing
+        the data, so it can run on a background thread (see load_reports).
+
+        :return: The reports, the file_signature and the highest report number of the file, and the indexes.
+        :rtype: dict
+        """
+        # Holding the writer's lock keeps it from appending until it knows which rows were loaded
+        writer = self._report_writer
+        with writer.sync_lock if writer else contextlib.nullcontext(), \
+                FileLock(f'{self.ufo_reports_file}.lock', shared=True, timeout=LOCK_TIMEOUT):
+            signature = file_signature(self.ufo_reports_file)
+            reports = pd.read_csv(self.ufo_reports_file)
+            max_report_no = int(reports['report_no'].max()) if len(reports) else 0
+            if writer:
+                writer.reset(signature, max_report_no)
+        return {'reports': reports, 'signature': signature, 'max_report_no': max_report_no,
+                'indexes': self.index_reports(reports)}
+
+    @staticmethod
+    def index_reports(reports: pd.DataFrame) -> dict:
+        """
+        Build the search, spatial and time indexes over reports.
+
+        :param reports: DataFrame containing UFO sighting data.
+        :return: The indexes, keyed by the attribute of the processor holding them.
+        :rtype: dict
+        """
+        time_index = TimeIndex.from_reports(reports)
+        return {'search_index': SearchIndex.from_reports(reports),
+                'spatial_index': GridIndex(pd.to_numeric(reports['latitude'], errors='coerce'),
+                                           pd.to_numeric(reports['longitude'], errors='coerce'), cell_size=0.25),
+                'time_index': time_index,
+                'time_mismatches': time_index.mismatches(reports)}
+
+    def build_indexes(self, indexes: dict = None):
+        """
+        Build the indexes over the reports in memory.
+
+        :param indexes: The result of index_reports run on another thread (default is building them now).
+        """
+        indexes = self.index_reports(self.ufo_reports) if indexes is None else indexes
+        self.search_index = indexes['search_index']
+        self.spatial_index = indexes['spatial_index']
+        self.time_index = indexes['time_index']
+        self.time_mismatches = indexes['time_mismatches']
+        if self._detector_thread is not None:
+            self._detector_thread.join()
+            self._detector_thread = None
+        self._duplicate_detector = None
+        self._outlier_filters = {}
+
+    @property
+    def airports(self) -> pd.DataFrame:
+        """
+        The airport data as a DataFrame, created from the airport store on first use.
+        """
+        if self._airports is None:
+            self._airports = self.airport_store.to_frame()
+        return self._airports
 
     def get_ufo_data(self) -> pd.DataFrame:
         """
@@ -31,6 +139,307 @@ class UFODataProcessor:
         """
         return self.ufo_reports.copy()
 
+    def clean_reports(self, strategy: str = 'iqr', deduplicate: bool = False) -> pd.DataFrame:
+        """
+        Get the reports without outliers, shared by every caller until the data changes. The returned
+        DataFrame must not be modified.
+
+        The reports to keep are tracked per strategy by an OutlierFilter that is updated with every appended
+        report, so a new report does not refit the bounds on all reports (see OutlierFilter).
+
+        :param strategy: The outlier strategy, one of OutlierFilter.STRATEGIES.
+        :param deduplicate: Keep only the first report of each cluster of likely duplicate reports before
+            removing the outliers.
+        :return: The reports without outliers.
+        :rtype: pandas.DataFrame
+        """
+        return self.get_cached(('clean_reports', strategy, deduplicate),
+                               lambda: self.ufo_reports[self.clean_mask(strategy, deduplicate)])
+
+    def clean_mask(self, strategy: str = 'iqr', deduplicate: bool = False) -> np.ndarray:
+        """
+        Mark the reports that clean_reports keeps. The returned array must not be modified.
+
+        :param strategy: The outlier strategy, one of OutlierFilter.STRATEGIES.
+        :param deduplicate: Drop all but the first report of each cluster of likely duplicate reports.
+        :return: True for the kept reports.
+        :rtype: numpy.ndarray
+        """
+        if deduplicate:
+            def compute():
+                kept = ~self.duplicate_mask()
+                outlier_filter = OutlierFilter(strategy)
+                outlier_filter.fit(self.ufo_reports[kept])
+                mask = np.zeros(len(self.ufo_reports), dtype=bool)
+                mask[kept] = outlier_filter.mask
+                return mask
+            return self.get_cached(('clean_mask', strategy, True), compute)
+        if strategy not in self._outlier_filters:
+            self._outlier_filters[strategy] = OutlierFilter(strategy)
+        return self._outlier_filters[strategy].mask_for(self.ufo_reports)
+
+    def column_codes(self, column: str) -> tuple:
+        """
+        Encode the values of a column as integer codes, kept per data version and extended with appended
+        reports, so the values of any selection of reports can be counted with numpy.bincount.
+
+        :param column: The column.
+        :return: The code of every report (-1 for a missing value) and the distinct values in order of
+            first appearance.
+        :rtype: tuple
+        """
+        def update(encoded, change):
+            if change.kind == 'update' and column not in change.columns:
+                return encoded
+            if change.kind != 'append':
+                return None
+            codes, uniques = encoded
+            values = change.rows[column]
+            appended = uniques.get_indexer(values)
+            unseen = pd.unique(values[(appended < 0) & values.notna().to_numpy()])
+            if len(unseen):
+                uniques = uniques.append(pd.Index(unseen))
+                appended = uniques.get_indexer(values)
+            return np.concatenate([codes, appended]), uniques
+        return self.get_cached(('column_codes', column), lambda: pd.factorize(self.ufo_reports[column]),
+                               update=update)
+
+    def appended_clean_reports(self, change: DataChange, strategy: str = 'iqr'):
+        """
+        Get the reports of an append that clean_reports keeps, without computing clean_reports again.
+
+        :param change: An 'append' change.
+        :param strategy: The outlier strategy, one of OutlierFilter.STRATEGIES.
+        :return: The kept reports, or None if the bounds of the strategy have to be fitted again first.
+        :rtype: pandas.DataFrame
+        """
+        outlier_filter = self._outlier_filters.get(strategy)
+        if outlier_filter is None or outlier_filter.stale(len(self.ufo_reports)):
+            return None
+        return change.rows[outlier_filter.mask[change.positions]]
+
+    def get_cached(self, key, compute, version: int = None, update=None, scope=None):
+        """
+        Get a value derived from the UFO data, computing it only once per data version.
+
+        Values derived from a filter or a selection of the reports are given a scope naming it. Every typed
+        filter and every selection on the map makes a new scope, so only the values of the SCOPE_CACHE_SIZE
+        most recently used scopes are kept.
+
+        :param key: A hashable key naming the derived value.
+        :param compute: A function without arguments that computes the value.
+        :param version: The data version the value belongs to (default is the current version).
+        :type version: int
+        :param update: A function taking the value and an 'append' or 'update' DataChange that returns the
+            value for the new data, or None if it has to be computed again. Without it the value is dropped on
+            every change.
+        :param scope: A hashable naming the filter or selection the value is derived from (default is none).
+        :return: The cached or newly computed value.
+        """
+        version = self.data_version if version is None else version
+        if update is not None:
+            self._cache_updaters[key] = update
+        # Read and filled without a check first, so a clear from another thread cannot fail the lookup
+        try:
+            value = self._cache[(version, key)]
+        except KeyError:
+            stamp = self._change_stamp
+            value = compute()
+            # A value computed on another thread while the reports changed may hold the new reports already,
+            # and the update function would add them a second time
+            if stamp % 2 == 0 and stamp == self._change_stamp and version == self.data_version:
+                self._cache[(version, key)] = value
+        if scope is not None:
+            self.use_scope(scope, key)
+        return value
+
+    def use_scope(self, scope, key):
+        """
+        Mark a scope of get_cached as the most recently used and drop the values of the least recently used
+        scopes beyond SCOPE_CACHE_SIZE, in all data versions.
+
+        :param scope: The scope.
+        :param key: The key of a value derived in the scope.
+        """
+        with self._scopes_lock:
+            self._scopes.setdefault(scope, set()).add(key)
+            self._scopes.move_to_end(scope)
+            dropped = set()
+            while len(self._scopes) > SCOPE_CACHE_SIZE:
+                dropped.update(self._scopes.popitem(last=False)[1])
+            # A key shared with a kept scope stays
+            dropped.difference_update(*self._scopes.values())
+        if dropped:
+            for version, key in list(self._cache):
+                if key in dropped:
+                    self._cache.pop((version, key), None)
+            for key in dropped:
+                self._cache_updaters.pop(key, None)
+
+    def subscribe(self, callback):
+        """
+        Call a function with every change of the reports from now on (see ChangeFeed).
+
+        :param callback: A function taking a DataChange.
+        :return: A function without arguments that unsubscribes the callback.
+        """
+        return self.changes.subscribe(callback)
+
+    def begin_change(self):
+        """
+        Mark the reports as being changed until record_change, so values computed from them on other threads
+        meanwhile are not cached (see get_cached).
+        """
+        self._change_stamp |= 1
+
+    def record_change(self, kind: str, positions=(), columns: list = None) -> DataChange:
+        """
+        Move to a new data version after the reports changed and publish the change. Unless the reports were
+        reloaded, the cached values that have an update function are brought up to date; every other cached
+        value is dropped.
+
+        :param kind: One of DataChange.KINDS.
+        :param positions: Row positions of the added or changed reports.
+        :param columns: The columns whose values changed (default is all columns).
+        :return: The published change.
+        :rtype: DataChange
+        """
+        self.data_version += 1
+        self._change_stamp += self._change_stamp % 2
+        change = DataChange(kind, self.data_version, positions, self.ufo_reports, columns)
+        cache, self._cache = self._cache, {}
+        if kind != 'reload':
+            for (version, key), value in cache.items():
+                update = self._cache_updaters.get(key)
+                if version == self.data_version - 1 and update is not None:
+                    value = update(value, change)
+                    if value is not None:
+                        self._cache[(self.data_version, key)] = value
+        self.changes.publish(change)
+        return change
+
+    def search(self, query: str, limit: int = None) -> np.ndarray:
+        """
+        Search the descriptions and locations of the reports.
+
+        :param query: Keywords separated by spaces; 'lig*' matches every word starting with 'lig'.
+        :param limit: Maximum number of results (default is all).
+        :return: Row positions of the matching reports, best matches first.
+        :rtype: numpy.ndarray
+        """
+        return self.search_index.search(query, limit)
+
+    def sightings_within_radius(self, latitude: float, longitude: float, radius_km: float) -> np.ndarray:
+        """
+        Find the reports within a distance of a position.
+
+        :param latitude: Latitude in degrees.
+        :param longitude: Longitude in degrees.
+        :param radius_km: Radius in kilometers.
+        :return: Row positions of the reports, nearest first.
+        :rtype: numpy.ndarray
+        """
+        return self.spatial_index.within_radius(latitude, longitude, radius_km)[0]
+
+    def sightings_in_bbox(self, lat_min: float, lat_max: float, lon_min: float, lon_max: float) -> np.ndarray:
+        """
+        Find the reports inside a latitude/longitude box.
+
+        :return: Sorted row positions of the reports.
+        :rtype: numpy.ndarray
+        """
+        return self.spatial_index.within_bbox(lat_min, lat_max, lon_min, lon_max)
+
+    def nearest_sightings(self, latitude: float, longitude: float, k: int = 10) -> tuple:
+        """
+        Find the k reports nearest to a position.
+
+        :param latitude: Latitude in degrees.
+        :param longitude: Longitude in degrees.
+        :param k: Number of reports.
+        :return: Row positions and distances in kilometers, nearest first.
+        :rtype: tuple
+        """
+        return self.spatial_index.nearest(latitude, longitude, k)
+
+    def sightings_between(self, start=None, end=None) -> np.ndarray:
+        """
+        Find the reports seen in a time range.
+
+        :param start: The first time of the range, e.g. '1990-01-01' (default is no limit).
+        :param end: The time the range ends before (default is no limit).
+        :return: Sorted row positions of the reports.
+        :rtype: numpy.ndarray
+        """
+        return self.time_index.between(start, end)
+
+    def found_times(self) -> pd.Series:
+        """
+        Get the parsed sighting times of the reports.
+
+        :return: The date_time_found of every report as datetime64, NaT where it cannot be parsed.
+        :rtype: pandas.Series
+        """
+        return pd.Series(self.time_index.found, index=self.ufo_reports.index, name='date_time_found')
+
+    @property
+    def duplicate_detector(self) -> 'DuplicateDetector':
+        """
+        The DuplicateDetector over the reports, built on first use and updated by save_to_csv.
+        """
+        if self._detector_thread is not None:
+            self._detector_thread.join()
+            self._detector_thread = None
+        if self._duplicate_detector is None:
+            self._duplicate_detector = DuplicateDetector.from_reports(self.ufo_reports, self.time_index.seconds())
+        return self._duplicate_detector
+
+    def prepare_duplicate_detector(self):
+        """
+        Start building the DuplicateDetector on a background thread, so that the first report added
+        does not wait for it. Reports are only added after the build has finished.
+        """
+        if self._duplicate_detector is None and self._detector_thread is None:
+            reports, times = self.ufo_reports, self.time_index.seconds()
+
+            def build():
+                self._duplicate_detector = DuplicateDetector.from_reports(reports, times)
+            self._detector_thread = threading.Thread(target=build, name='DuplicateDetector', daemon=True)
+            self._detector_thread.start()
+
+    def find_duplicate_clusters(self) -> list:
+        """
+        Find the clusters of reports that are likely the same sighting.
+
+        :return: Sorted arrays of row positions, one per cluster of two or more reports.
+        :rtype: list
+        """
+        return self.get_cached('duplicate_clusters', self.duplicate_detector.find_clusters)
+
+    def duplicate_mask(self) -> np.ndarray:
+        """
+        Mark every report of a duplicate cluster except the first one.
+
+        :return: True for the reports that duplicate an earlier report.
+        :rtype: numpy.ndarray
+        """
+        mask = np.zeros(len(self.ufo_reports), dtype=bool)
+        for cluster in self.find_duplicate_clusters():
+            mask[cluster[1:]] = True
+        return mask
+
+    def reverse_geocode(self, latitude: float, longitude: float) -> dict:
+        """
+        Find the country and the nearest known location of a position from the reports.
+
+        :param latitude: Latitude in degrees.
+        :param longitude: Longitude in degrees.
+        :return: The country, location and distance in kilometers to the location (each None if unknown).
+        :rtype: dict
+        """
+        geocoder = self.get_cached('reverse_geocoder', lambda: ReverseGeocoder.from_reports(self.ufo_reports))
+        return geocoder.reverse(latitude, longitude)
+
     def get_ufo_columns(self) -> list:
         return self.ufo_reports.columns.tolist()
 
@@ -40,12 +449,81 @@ class UFODataProcessor:
         """
         return self.ufo_reports.select_dtypes(include='float').columns.tolist()
 
+    @traced(rows=lambda self, *args, **kwargs: len(self.ufo_reports))
     def calculate_statistics(self, column) -> str:
         """
         Calculates summary statistics for a given column in the DataFrame.
         """
         return self.ufo_reports[column].describe().to_string()
 
+    def filter_mask(self, expression: str, reports: pd.DataFrame = None) -> np.ndarray:
+        """
+        Find the reports matching a filter expression such as
+        "country in ('Thailand', 'Vietnam') and 1990 <= year_found < 2000 and length_of_encounter_seconds > 60".
+        The mask over all reports is kept per data version and extended with appended reports.
+
+        :param expression: The filter expression (see filter_expression.compile_filter).
+        :param reports: The reports to check (default is all reports).
+        :return: True for the matching reports.
+        :rtype: numpy.ndarray
+        :raises FilterError: If the expression is invalid or does not fit the reports.
+        """
+        plan = compile_filter(expression)
+        if reports is not None:
+            return plan(reports)
+
+        def update(mask, change):
+            if change.kind == 'update' and plan.columns.isdisjoint(change.columns):
+                return mask
+            if change.kind != 'append':
+                return None
+            return np.concatenate([mask, plan(change.rows)])
+        return self.get_cached(('filter_mask', plan.expression),
+                               lambda: plan(self.ufo_reports, self.get_cached('column_arrays', dict)), update=update,
+                               scope=('filter', plan.expression))
+
+    @staticmethod
+    def selection_expression(country: str = 'All', year_range: str = 'All', shape: str = 'All') -> str:
+        """
+        Write a selection of country, year range and UFO shape as a filter expression.
+
+        :param country: Country name, or 'All'.
+        :param year_range: Year range such as '1960-1970', or 'All'.
+        :param shape: UFO shape, or 'All'.
+        :return: The filter expression, empty if nothing is selected.
+        :rtype: str
+        """
+        conditions = []
+        if country != 'All':
+            conditions.append(f'country == {quote(country)}')
+        if year_range != 'All':
+            start_year, end_year = map(int, year_range.split('-'))
+            conditions.append(f'{start_year} <= year_found <= {end_year}')
+        if shape != 'All':
+            conditions.append(f'UFO_shape == {quote(shape)}')
+        return ' and '.join(conditions)
+
+    @staticmethod
+    @traced(rows=lambda data, *args, **kwargs: len(data))
+    def filter_reports(data: pd.DataFrame, country: str = 'All', year_range: str = 'All',
+                       shape: str = 'All') -> pd.DataFrame:
+        """
+        Filter reports by country, year range and UFO shape.
+
+        :param data: DataFrame containing UFO sighting data.
+        :type data: pandas.DataFrame
+        :param country: Country name, or 'All'.
+        :type country: str
+        :param year_range: Year range such as '1960-1970', or 'All'.
+        :type year_range: str
+        :param shape: UFO shape, or 'All'.
+        :type shape: str
+        :return: The matching reports.
+        :rtype: pandas.DataFrame
+        """
+        return data[compile_filter(UFODataProcessor.selection_expression(country, year_range, shape))(data)]
+
+    @traced(rows=lambda self, latitude, longitude, airport_data: len(airport_data))
     def find_nearest_airport(self, latitude: float, longitude: float, airport_data: pd.DataFrame) -> float:
         """
         Find the nearest airport to a given location.
@@ -69,13 +547,307 @@ class UFODataProcessor:
                 min_distance = distance
         return min_distance
 
+    def nearest_airport_distances(self, latitudes, longitudes, cell_size: float = 1.0,
+                                  margin: float = 2.0) -> np.ndarray:
+        """
+        Find the distance to the nearest airport for many locations at once.
+
+        :param latitudes: Latitudes of the locations in degrees.
+        :param longitudes: Longitudes of the locations in degrees.
+        :param cell_size: Size of the grid cells in degrees.
+        :param margin: Margin around each cell in which airports are considered, in degrees.
+        :return: Distances to the nearest airport in kilometers.
+        :rtype: numpy.ndarray
+        """
+        return self.airport_distances(self.airport_store, latitudes, longitudes, cell_size, margin)
+
+    @classmethod
+    @traced(rows=lambda cls, airport_data, latitudes, *args, **kwargs: len(latitudes))
+    def airport_distances(cls, airport_data, latitudes, longitudes, cell_size: float = 1.0,
+                          margin: float = 2.0) -> np.ndarray:
+        """
+        Find the distance to the nearest of the given airports for many locations at once.
+
+        Locations are grouped into grid cells of cell_size degrees. Each cell is only compared with the
+        airports within margin degrees of it: the nearest airport on the sphere is the one whose unit vector
+        has the largest dot product with the location's unit vector. A location whose nearest candidate is
+        farther away than the margin is guaranteed to cover is compared with every airport instead,
+        so the result is exact.
+
+        :param airport_data: An AirportStore, or a DataFrame containing airport data.
+        :param latitudes: Latitudes of the locations in degrees.
+        :param longitudes: Longitudes of the locations in degrees.
+        :param cell_size: Size of the grid cells in degrees.
+        :param margin: Margin around each cell in which airports are considered, in degrees.
+        :return: Distances to the nearest airport in kilometers.
+        :rtype: numpy.ndarray
+        """
+        latitudes = np.asarray(latitudes, dtype=float)
+        longitudes = np.asarray(longitudes, dtype=float)
+        if isinstance(airport_data, AirportStore):
+            airport_lat, airport_lon = airport_data.latitude, airport_data.longitude
+            airport_vectors = airport_data.vectors
+        else:
+            airport_lat = airport_data['LAT'].to_numpy(dtype=float)
+            airport_lon = airport_data['LONG'].to_numpy(dtype=float)
+            airport_vectors = cls.unit_vectors(np.radians(airport_lat), np.radians(airport_lon))
+        distances = np.full(len(latitudes), np.inf)
+
+        cells = np.floor(latitudes / cell_size).astype(np.int64) * 1000 + np.floor(longitudes / cell_size)
+        order = np.argsort(cells, kind='stable')
+        boundaries = np.flatnonzero(np.diff(cells[order])) + 1
+        for group in np.split(order, boundaries):
+            if len(group) == 0:
+                continue
+            lat_low = np.floor(latitudes[group[0]] / cell_size) * cell_size - margin
+            lat_high = lat_low + cell_size + 2 * margin
+            lon_center = (np.floor(longitudes[group[0]] / cell_size) + 0.5) * cell_size
+            lon_offset = np.abs((airport_lon - lon_center + 180) % 360 - 180)
+            candidates = np.flatnonzero((airport_lat >= lat_low) & (airport_lat <= lat_high) &
+                                        (lon_offset <= cell_size / 2 + margin))
+            if len(candidates) == 0:
+                continue
+            distances[group] = cls._nearest_among(latitudes[group], longitudes[group], candidates,
+                                                   airport_lat, airport_lon, airport_vectors)
+            max_lat = np.radians(min(max(abs(lat_low), abs(lat_high)), 90))
+            safe = 6371.0 * min(np.radians(margin), 2 * np.arcsin(np.cos(max_lat) * np.sin(np.radians(margin) / 2)))
+            distances[group[distances[group] > safe]] = np.inf
+
+        unresolved = np.flatnonzero(np.isinf(distances))
+        everything = np.arange(len(airport_lat))
+        for start in range(0, len(unresolved), 2048):
+            chunk = unresolved[start:start + 2048]
+            distances[chunk] = cls._nearest_among(latitudes[chunk], longitudes[chunk], everything,
+                                                   airport_lat, airport_lon, airport_vectors)
+        return distances
+
+    @classmethod
+    def _nearest_among(cls, latitudes, longitudes, candidates, airport_lat, airport_lon, airport_vectors):
+        """
+        Find the Haversine distance to the nearest of the candidate airports.
+        """
+        vectors = cls.unit_vectors(np.radians(latitudes), np.radians(longitudes))
+        nearest = candidates[np.argmax(vectors @ airport_vectors[candidates].T, axis=1)]
+        return cls.haversine_vectorized(np.radians(latitudes), np.radians(longitudes),
+                                         np.radians(airport_lat[nearest]), np.radians(airport_lon[nearest]))
+
+    @staticmethod
+    def unit_vectors(latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+        """
+        Convert latitudes and longitudes in radians to 3D unit vectors.
+        """
+        cos_lat = np.cos(latitudes)
+        return np.column_stack((cos_lat * np.cos(longitudes), cos_lat * np.sin(longitudes), np.sin(latitudes)))
+
+    @staticmethod
+    def haversine_vectorized(lat1: np.ndarray, lon1: np.ndarray, lat2: np.ndarray, lon2: np.ndarray) -> np.ndarray:
+        """
+        Calculate the Haversine distance between arrays of points given in radians.
+
+        :return: Distances in kilometers.
+        :rtype: numpy.ndarray
+        """
+        a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+        return 6371.0 * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+    @traced(rows=lambda self, *args, **kwargs: len(self.ufo_reports))
     def save_to_csv(self, date_time_found: str, country: str, location: str, latitude: float,
                     longitude: float, ufo_shape: str, length_of_encounter_seconds: float, description: str):
         """
-        Save UFO sighting data to a CSV file.
+        Save UFO sighting data to a CSV file and wait until it is written.
+
+        :return: Report numbers of the existing reports that the new report likely duplicates.
+        :rtype: list
+        """
+        saved, duplicate_report_nos = self.submit_report(date_time_found, country, location, latitude, longitude,
+                                                         ufo_shape, length_of_encounter_seconds, description)
+        saved.result()
+        self.sync()
+        return duplicate_report_nos
+
+    @traced(rows=lambda self, *args, **kwargs: len(self.ufo_reports))
+    def submit_report(self, date_time_found: str, country: str, location: str, latitude: float,
+                      longitude: float, ufo_shape: str, length_of_encounter_seconds: float, description: str) -> tuple:
+        """
+        Add a UFO sighting report to the data right away and queue it to be appended to the reports file
+        by the background ReportWriter.
+
+        :return: A Future resolved with the written row once the report is in the file, and the report
+            numbers of the existing reports that the new report likely duplicates. The report number is
+            only final once it is written; sync updates it in the data.
+        :rtype: tuple
+        """
+        row, duplicate_report_nos = self.add_report(date_time_found, country, location, latitude, longitude,
+                                                    ufo_shape, length_of_encounter_seconds, description)
+        saved = self.report_writer.submit(row)
+        self._pending[saved] = (len(self.ufo_reports) - 1, row)
+        return saved, duplicate_report_nos
+
+    @property
+    def report_writer(self) -> ReportWriter:
+        """
+        The ReportWriter appending submitted reports to the reports file, created on first use.
+        """
+        if self._report_writer is None:
+            self._report_writer = ReportWriter(self.ufo_reports_file, self.get_ufo_columns(),
+                                               self._file_signature, self._file_max_report_no,
+                                               lock_timeout=LOCK_TIMEOUT)
+        return self._report_writer
+
+    @traced()
+    def sync(self, changes: tuple = None) -> bool:
+        """
+        Bring the data in line with the reports file: give written reports their final report numbers, remove
+        the reports that could not be written and add the reports appended by other processes. If another
+        process rewrote the file, it is reloaded.
+
+        :param changes: The result of fetch_changes run on another thread (default is looking at the file now,
+            which waits for the file lock).
+        :return: Whether the data changed.
+        :rtype: bool
+        """
+        reports, rewritten, loaded = self.fetch_changes() if changes is None else changes
+        if rewritten:
+            waiting, self._pending = self._pending, {}
+            self.begin_change()
+            self.load_reports(loaded)
+            for saved, (_, row) in waiting.items():
+                # Reports written before the reload are in the file already
+                if saved.done() and (saved.exception() is not None or
+                                     saved.result()['report_no'] <= self._file_max_report_no):
+                    continue
+                self.append_reports(pd.DataFrame([row], columns=self.get_ufo_columns()))
+                self._pending[saved] = (len(self.ufo_reports) - 1, row)
+            self.record_change('reload')
+        elif reports is not None:
+            start = len(self.ufo_reports)
+            self.append_reports(reports)
+            self.record_change('append', range(start, len(self.ufo_reports)))
+        # After a reload, so the reports written since the file was read are added again first
+        changed = self.update_written()
+        return changed or rewritten or reports is not None
+
+    def fetch_changes(self) -> tuple:
+        """
+        Look for the reports appended to the reports file by other processes, and read the file again if
+        another process rewrote it. The data is not changed, so this can run on a background thread while
+        the file lock is waited for (see start_sync).
+
+        :return: The appended reports (None if there are none), whether the file was rewritten, and the
+            result of read_reports if it was.
+        :rtype: tuple
+        """
+        self.report_writer.poll()
+        reports, rewritten = self.report_writer.take_changes()
+        return reports, rewritten, self.read_reports() if rewritten else None
+
+    def start_sync(self) -> Future:
+        """
+        Run fetch_changes on a background thread. Its result is passed to sync on the thread that changes
+        the data.
+
+        :return: A Future resolved with the result of fetch_changes, or failing with its error.
+        :rtype: concurrent.futures.Future
+        """
+        # The writer is created on this thread, before the background thread uses it
+        self.report_writer
+        future = Future()
+
+        def run():
+            try:
+                future.set_result(self.fetch_changes())
+            except BaseException as error:
+                future.set_exception(error)
+        threading.Thread(target=run, name='ReportSync', daemon=True).start()
+        return future
+
+    def update_written(self) -> bool:
+        """
+        Give the submitted reports that were written their final report numbers and remove those that could
+        not be written. Does not look at the file.
+
+        :return: Whether the data changed.
+        :rtype: bool
+        """
+        updated, failed = [], []
+        for saved, (position, row) in list(self._pending.items()):
+            if saved.done():
+                del self._pending[saved]
+                if saved.exception() is None:
+                    self.begin_change()
+                    self.ufo_reports.at[position, 'report_no'] = saved.result()['report_no']
+                    updated.append(position)
+                else:
+                    failed.append(position)
+        if failed:
+            self.remove_reports(failed)
+        elif updated:
+            self.record_change('update', updated, ['report_no'])
+        return bool(updated or failed)
+
+    def remove_reports(self, positions):
+        """
+        Remove reports from the data in memory, e.g. submitted reports that could not be written. The indexes
+        are built again and the change is published as a reload.
+
+        :param positions: Row positions of the reports.
+        """
+        positions = np.unique(np.asarray(positions, dtype=np.intp))
+        self.begin_change()
+        self.ufo_reports = self.ufo_reports.drop(index=self.ufo_reports.index[positions]).reset_index(drop=True)
+        # Reports still being written move up by the number of removed reports before them
+        self._pending = {saved: (position - int(np.searchsorted(positions, position)), row)
+                         for saved, (position, row) in self._pending.items()}
+        self.build_indexes()
+        self.record_change('reload')
+
+    def append_reports(self, reports: pd.DataFrame):
+        """
+        Add reports to the data in memory and update the indexes.
+
+        :param reports: DataFrame with the columns of the reports.
+        """
+        start = len(self.ufo_reports)
+        self.begin_change()
+        self.ufo_reports = pd.concat([self.ufo_reports, reports], ignore_index=True)
+        for outlier_filter in self._outlier_filters.values():
+            outlier_filter.extend(reports)
+        self.time_index.add(reports)
+        for column, positions in self.time_index.mismatches(reports, start).items():
+            self.time_mismatches[column] = np.concatenate([self.time_mismatches[column], positions])
+        latitudes = pd.to_numeric(reports['latitude'], errors='coerce').to_numpy(dtype=float)
+        longitudes = pd.to_numeric(reports['longitude'], errors='coerce').to_numpy(dtype=float)
+        times = self.time_index.seconds(start)
+        descriptions = reports['description'].fillna('').astype(str).tolist()
+        locations = reports['location'].fillna('').astype(str).tolist()
+        # The duplicate detector is only updated if it was built or is being built
+        built = self._detector_thread is not None or self._duplicate_detector is not None
+        detector = self.duplicate_detector if built else None
+        for i in range(len(reports)):
+            self.search_index.add(start + i, descriptions[i], locations[i])
+            self.spatial_index.add(latitudes[i], longitudes[i])
+            if detector is not None:
+                detector.add(latitudes[i], longitudes[i], times[i], descriptions[i])
+
+    def close(self, timeout: float = None):
+        """
+        Write the submitted reports that are still queued.
+
+        :param timeout: Seconds to wait for the pending writes (default is no limit).
+        """
+        if self._report_writer is not None:
+            self._report_writer.close(timeout)
+
+    def add_report(self, date_time_found: str, country: str, location: str, latitude: float,
+                   longitude: float, ufo_shape: str, length_of_encounter_seconds: float, description: str) -> tuple:
+        """
+        Add a UFO sighting report to the data in memory and update the indexes.
+
+        :return: The new row, and the report numbers of the existing reports that it likely duplicates.
+        :rtype: tuple
         """
         report_no = self.ufo_reports.loc[len(self.ufo_reports)-1]['report_no'] + 1
-        min_distance = self.find_nearest_airport(float(latitude), float(longitude), self.airports)
+        min_distance = float(self.nearest_airport_distances([float(latitude)], [float(longitude)])[0])
         year_found, month, hour = self.separate_datetime(date_time_found)
         season = self.month_to_season(month)
         date_documented = datetime.date.today().strftime('%m/%d/%Y')
@@ -90,17 +862,20 @@ class UFODataProcessor:
                         'country_code': country_code,
                         'country': country,
                         'location': location,
-                        'latitude': latitude,
-                        'longitude': longitude,
+                        'latitude': float(latitude),
+                        'longitude': float(longitude),
                         'UFO_shape': ufo_shape,
                         'length_of_encounter_seconds': length_of_encounter_seconds,
                         'distance_to_nearest_airport_km': min_distance,
                         'description': description.strip()
                         }
-        self.ufo_reports.loc[len(self.ufo_reports)] = self.new_row
-        current_dir = os.getcwd()
-        ufo_data = os.path.join(current_dir, 'data', 'nuforc_data.csv')
-        self.ufo_reports.to_csv(ufo_data, mode='w', index=False)
+        found_time = DuplicateDetector.parse_times([date_time_found])[0]
+        duplicates = self.duplicate_detector.check(float(latitude), float(longitude), found_time,
+                                                   self.new_row['description'])
+        duplicate_report_nos = self.ufo_reports['report_no'].iloc[duplicates].tolist()
+        self.append_reports(pd.DataFrame([self.new_row], columns=self.get_ufo_columns()))
+        self.record_change('append', [len(self.ufo_reports) - 1])
+        return self.new_row, duplicate_report_nos
 
     @staticmethod
     def separate_datetime(date_time) -> tuple:
@@ -112,7 +887,7 @@ class UFODataProcessor:
         :return: Year, month, and hour.
         :rtype: tuple
         """
-        date_time = pd.to_datetime(date_time)
+        date_time = pd.Timestamp(parse_datetimes([date_time], FOUND_FORMAT)[0])
         year_found = date_time.year
         month_found = date_time.month
         hour_of_the_day = date_time.hour
@@ -173,6 +948,217 @@ class UFODataProcessor:
         return distance
 
 
+class DuplicateDetector:
+    """
+    A class to find reports that are likely the same sighting filed more than once.
+
+    Two reports are duplicates if they are at most max_distance_km apart, at most max_hours apart
+    and, when min_similarity is set, the Jaccard similarity of their description words is at least
+    min_similarity. Duplicates are grouped into clusters transitively. Candidate pairs only come from
+    neighbouring space-time buckets, and a single new report is checked against the reports in its
+    time window or, when that window is crowded, against the reports within reach on the spatial grid.
+    """
+    def __init__(self, latitudes, longitudes, times, descriptions=None, max_distance_km: float = 5.0,
+                 max_hours: float = 2.0, min_similarity: float = None):
+        """
+        Initialize the DuplicateDetector.
+
+        :param latitudes: Latitudes of the reports in degrees.
+        :param longitudes: Longitudes of the reports in degrees.
+        :param times: Times the sightings were found, in seconds since the epoch (NaN if unknown).
+        :param descriptions: Descriptions of the reports, needed when min_similarity is set.
+        :param max_distance_km: Maximum distance between duplicates in kilometers.
+        :param max_hours: Maximum time between duplicates in hours.
+        :param min_similarity: Minimum Jaccard similarity of the description words, or None to ignore descriptions.
+        """
+        self.max_distance_km = max_distance_km
+        self.max_seconds = max_hours * 3600
+        self.min_similarity = min_similarity
+        self.times = np.asarray(times, dtype=float)
+        self.descriptions = list(descriptions) if descriptions is not None else [''] * len(self.times)
+        self.grid = GridIndex(latitudes, longitudes, cell_size=0.25)
+        known = np.flatnonzero(~np.isnan(self.times))
+        self.time_order = known[np.argsort(self.times[known], kind='stable')]
+        self.sorted_times = self.times[self.time_order]
+
+    @property
+    def latitudes(self) -> np.ndarray:
+        return self.grid.latitudes
+
+    @property
+    def longitudes(self) -> np.ndarray:
+        return self.grid.longitudes
+
+    @classmethod
+    @traced(rows=lambda cls, reports, *args, **kwargs: len(reports))
+    def from_reports(cls, reports: pd.DataFrame, times=None, **kwargs) -> 'DuplicateDetector':
+        """
+        Build the detector from UFO sighting reports.
+
+        :param reports: DataFrame containing UFO sighting data.
+        :param times: The sighting times in seconds since the epoch, if already parsed (default is to parse
+            date_time_found).
+        :return: The detector.
+        :rtype: DuplicateDetector
+        """
+        times = cls.parse_times(reports['date_time_found']) if times is None else times
+        return cls(pd.to_numeric(reports['latitude'], errors='coerce'),
+                   pd.to_numeric(reports['longitude'], errors='coerce'),
+                   times, reports['description'].fillna('').astype(str), **kwargs)
+
+    @staticmethod
+    def parse_times(values) -> np.ndarray:
+        """
+        Parse sighting times such as '4/1/1966 22:00' into seconds since the epoch.
+
+        :param values: The date and time strings.
+        :return: Seconds since the epoch, NaN where a value cannot be parsed.
+        :rtype: numpy.ndarray
+        """
+        times = parse_datetimes(values, FOUND_FORMAT)
+        seconds = times.astype('datetime64[s]').astype(np.int64).astype(float)
+        seconds[np.isnat(times)] = np.nan
+        return seconds
+
+    @staticmethod
+    def similarity(first: str, second: str) -> float:
+        """
+        Calculate the Jaccard similarity of the words of two descriptions.
+        """
+        first, second = set(SearchIndex.tokenize(first)), set(SearchIndex.tokenize(second))
+        if not first and not second:
+            return 1.0
+        return len(first & second) / len(first | second)
+
+    def candidate_pairs(self) -> tuple:
+        """
+        Get the pairs of reports that share or neighbour a space-time bucket.
+
+        Buckets are at least max_distance_km wide and max_hours long, so every duplicate pair
+        lies in the same or in neighbouring buckets.
+
+        :return: Row positions (first, second) of each pair with first < second.
+        :rtype: tuple
+        """
+        valid = np.flatnonzero(~np.isnan(self.latitudes) & ~np.isnan(self.longitudes) & ~np.isnan(self.times))
+        if len(valid) < 2:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+        widest = np.radians(min(np.abs(self.latitudes[valid]).max(), 89.0))
+        cell = np.degrees(self.max_distance_km / 6371.0) / np.cos(widest)
+        buckets = pd.DataFrame({'row': np.floor(self.latitudes[valid] / cell).astype(np.int64),
+                                'column': np.floor(self.longitudes[valid] / cell).astype(np.int64),
+                                'slot': np.floor(self.times[valid] / max(self.max_seconds, 1)).astype(np.int64),
+                                'position': valid})
+        firsts, seconds = [], []
+        # Half of the neighbouring buckets, so that each unordered pair is found once
+        offsets = [(dr, dc, dt) for dr in (-1, 0, 1) for dc in (-1, 0, 1) for dt in (-1, 0, 1)]
+        for dr, dc, dt in [offset for offset in offsets if offset >= (0, 0, 0)]:
+            shifted = buckets.assign(row=buckets['row'] + dr, column=buckets['column'] + dc, slot=buckets['slot'] + dt)
+            pairs = buckets.merge(shifted, on=['row', 'column', 'slot'], suffixes=('', '_other'))
+            first, second = pairs['position'].to_numpy(), pairs['position_other'].to_numpy()
+            if (dr, dc, dt) == (0, 0, 0):
+                keep = first < second
+                first, second = first[keep], second[keep]
+            firsts.append(np.minimum(first, second))
+            seconds.append(np.maximum(first, second))
+        return np.concatenate(firsts), np.concatenate(seconds)
+
+    def is_duplicate(self, first: np.ndarray, second: np.ndarray) -> np.ndarray:
+        """
+        Check which candidate pairs are duplicates.
+        """
+        distances = UFODataProcessor.haversine_vectorized(
+            np.radians(self.latitudes[first]), np.radians(self.longitudes[first]),
+            np.radians(self.latitudes[second]), np.radians(self.longitudes[second]))
+        matched = ((distances <= self.max_distance_km) &
+                   (np.abs(self.times[first] - self.times[second]) <= self.max_seconds))
+        if self.min_similarity is not None:
+            for k in np.flatnonzero(matched):
+                matched[k] = self.similarity(self.descriptions[first[k]],
+                                             self.descriptions[second[k]]) >= self.min_similarity
+        return matched
+
+    @traced(rows=lambda self: len(self.times))
+    def find_clusters(self) -> list:
+        """
+        Find the clusters of duplicate reports in the whole dataset.
+
+        :return: Sorted arrays of row positions, one per cluster of two or more reports.
+        :rtype: list
+        """
+        first, second = self.candidate_pairs()
+        matched = self.is_duplicate(first, second)
+        first, second = first[matched], second[matched]
+        labels = np.arange(len(self.times))
+        while True:
+            previous = labels.copy()
+            np.minimum.at(labels, second, labels[first])
+            np.minimum.at(labels, first, labels[second])
+            labels = labels[labels]
+            if np.array_equal(labels, previous):
+                break
+        members = np.flatnonzero(np.bincount(labels, minlength=len(labels))[labels] > 1)
+        order = members[np.argsort(labels[members], kind='stable')]
+        boundaries = np.flatnonzero(np.diff(labels[order])) + 1
+        return [group for group in np.split(order, boundaries) if len(group)]
+
+    def duplicate_mask(self) -> np.ndarray:
+        """
+        Mark every report of a duplicate cluster except the first one.
+
+        :return: True for the reports that duplicate an earlier report.
+        :rtype: numpy.ndarray
+        """
+        mask = np.zeros(len(self.times), dtype=bool)
+        for cluster in self.find_clusters():
+            mask[cluster[1:]] = True
+        return mask
+
+    def check(self, latitude: float, longitude: float, time: float, description: str = '') -> np.ndarray:
+        """
+        Find the existing reports that a new report duplicates.
+
+        :param latitude: Latitude of the new report in degrees.
+        :param longitude: Longitude of the new report in degrees.
+        :param time: Time of the new sighting in seconds since the epoch.
+        :param description: Description of the new report.
+        :return: Row positions of the duplicated reports, nearest first.
+        :rtype: numpy.ndarray
+        """
+        if np.isnan(time):
+            return np.array([], dtype=np.int64)
+        start = np.searchsorted(self.sorted_times, time - self.max_seconds, side='left')
+        stop = np.searchsorted(self.sorted_times, time + self.max_seconds, side='right')
+        if stop - start > 256:
+            found, _ = self.grid.within_radius(latitude, longitude, self.max_distance_km)
+            found = found[np.abs(self.times[found] - time) <= self.max_seconds]
+        else:
+            found = self.time_order[start:stop]
+        distances = haversine_km(latitude, longitude, self.latitudes[found], self.longitudes[found])
+        keep = distances <= self.max_distance_km
+        found, distances = found[keep], distances[keep]
+        if self.min_similarity is not None:
+            similar = [self.similarity(description, self.descriptions[k]) >= self.min_similarity for k in found]
+            found, distances = found[similar], distances[similar]
+        return found[np.argsort(distances, kind='stable')]
+
+    def add(self, latitude: float, longitude: float, time: float, description: str = '') -> int:
+        """
+        Add a new report to the detector.
+
+        :return: Row position of the new report.
+        :rtype: int
+        """
+        position = self.grid.add(latitude, longitude)
+        self.times = np.append(self.times, time)
+        self.descriptions.append(description)
+        if not np.isnan(time):
+            index = np.searchsorted(self.sorted_times, time, side='right')
+            self.sorted_times = np.insert(self.sorted_times, index, time)
+            self.time_order = np.insert(self.time_order, index, position)
+        return position
+
+
 class Country(enum.Enum):
     """A class representing countries with their information."""
     BRUNEI = ['Brunei', 'BRN', 4.5, 114.6667]
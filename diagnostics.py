@@ -0,0 +1,222 @@
+"""
+Memory diagnostics for page navigation in UFORadarSEA.
+
+Set the UFORADAR_MEMORY environment variable before starting the application to take a tracemalloc
+snapshot and count live objects (matplotlib figures and canvases, PhotoImages, map views and Tk widgets)
+every time a page is shown. A per-page growth report is printed on exit.
+
+    UFORADAR_MEMORY=1 python main.py
+
+The stress scenario cycles through every page with the main window withdrawn and fails if memory or the
+number of live figures keeps growing. Tk still needs a display server, so on a machine without one run
+it under a virtual display, e.g. ``xvfb-run python diagnostics.py --cycles 50``.
+"""
+import argparse
+import atexit
+import functools
+import gc
+import os
+import sys
+import tkinter as tk
+import tracemalloc
+import warnings
+
+ENABLED = os.environ.get('UFORADAR_MEMORY', '') not in ('', '0')
+TRACKED_TYPES = {
+    'matplotlib.figure.Figure': 'figures',
+    'matplotlib.backends.backend_tkagg.FigureCanvasTkAgg': 'figure_canvases',
+    'PIL.ImageTk.PhotoImage': 'photo_images',
+    'tkinter.PhotoImage': 'photo_images',
+    'tkintermapview.map_widget.TkinterMapView': 'map_views',
+}
+
+
+class MemoryMonitor:
+    """
+    A class to take memory snapshots on page navigation and report the growth per page.
+    """
+    def __init__(self, frames: int = 5, top: int = 5):
+        """
+        Initialize the MemoryMonitor.
+
+        :param frames: Number of stack frames tracemalloc keeps per allocation.
+        :param top: Number of allocation sites listed per page in the report.
+        """
+        self.frames = frames
+        self.top = top
+        self.records = []
+        self.last_visit = {}
+        self.growth = {}
+
+    def start(self):
+        """
+        Start tracing allocations.
+        """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+
+    @staticmethod
+    def live_objects() -> dict:
+        """
+        Count live figures, canvases, PhotoImages, map views and Tk widgets.
+
+        :return: Object counts by kind.
+        :rtype: dict
+        """
+        import matplotlib.pyplot as plt
+        counts = {kind: 0 for kind in set(TRACKED_TYPES.values())}
+        counts['tk_widgets'] = 0
+        for obj in gc.get_objects():
+            kind = TRACKED_TYPES.get(f'{type(obj).__module__}.{type(obj).__qualname__}')
+            if kind:
+                counts[kind] += 1
+            if isinstance(obj, tk.Misc):
+                counts['tk_widgets'] += 1
+        counts['pyplot_figures'] = len(plt.get_fignums())
+        return counts
+
+    def record(self, page: str) -> dict:
+        """
+        Take a snapshot after showing a page and compare it with the previous visit of the same page.
+
+        :param page: The name of the page that was shown.
+        :return: The recorded entry.
+        :rtype: dict
+        """
+        self.start()
+        gc.collect()
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        entry = {'page': page, 'traced_bytes': current, 'peak_bytes': peak, **self.live_objects()}
+        previous = self.last_visit.get(page)
+        if previous is not None:
+            previous_entry, previous_snapshot = previous
+            delta = {key: value - previous_entry[key] for key, value in entry.items() if key != 'page'}
+            sites = [stat for stat in snapshot.compare_to(previous_snapshot, 'traceback') if stat.size_diff > 0]
+            self.growth.setdefault(page, []).append((delta, sites[:self.top]))
+        self.last_visit[page] = (entry, snapshot)
+        self.records.append(entry)
+        return entry
+
+    def report(self) -> str:
+        """
+        Build a report of the memory and object growth between visits of each page.
+
+        :return: The report.
+        :rtype: str
+        """
+        lines = [f"{'page':<28} {'visits':>6} {'KiB/visit':>10} {'figures':>8} {'canvases':>9} "
+                 f"{'photos':>7} {'maps':>5} {'widgets':>8}"]
+        for page, (entry, _) in self.last_visit.items():
+            deltas = [delta for delta, _ in self.growth.get(page, [])]
+            visits = len(deltas) + 1
+            mean = (sum(delta['traced_bytes'] for delta in deltas) / len(deltas) / 1024) if deltas else 0.0
+            lines.append(f"{page:<28} {visits:>6} {mean:>10.1f} {entry['figures']:>8} "
+                         f"{entry['figure_canvases']:>9} {entry['photo_images']:>7} {entry['map_views']:>5} "
+                         f"{entry['tk_widgets']:>8}")
+        for page, visits in self.growth.items():
+            _, sites = visits[-1]
+            if sites:
+                lines.append(f'\nLargest growth on the last visit of {page}:')
+                for stat in sites:
+                    frame = stat.traceback[-1]
+                    lines.append(f'  +{stat.size_diff / 1024:>9.1f} KiB  {frame.filename}:{frame.lineno}')
+        return '\n'.join(lines)
+
+
+MONITOR = MemoryMonitor()
+if ENABLED:
+    MONITOR.start()
+    atexit.register(lambda: print(MONITOR.report()))
+
+
+def track_navigation(page: str):
+    """
+    Decorate a navigation method so that a memory snapshot is taken after the page is shown.
+
+    :param page: The name of the page.
+    :return: The decorator. When diagnostics are disabled it returns the method unchanged.
+    """
+    def decorate(function):
+        if not ENABLED:
+            return function
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            result = function(*args, **kwargs)
+            MONITOR.record(page)
+            return result
+        return wrapper
+    return decorate
+
+
+def run_stress(data_processor, cycles: int = 30, warmup: int = 5, max_growth_kib: float = 256.0,
+               max_figures: int = 20) -> MemoryMonitor:
+    """
+    Cycle through every page and check that memory stays bounded.
+
+    :param data_processor: An instance of UFODataProcessor.
+    :param cycles: Number of times every page is visited.
+    :param warmup: Number of cycles before the memory baseline is taken.
+    :param max_growth_kib: Allowed traced memory growth per cycle after the warmup, in KiB.
+    :param max_figures: Allowed number of live matplotlib figures at the end.
+    :return: The MemoryMonitor with the recorded snapshots.
+    :raises AssertionError: If memory or the number of live figures is not bounded.
+    """
+    from uforadar_ui import UFOApp
+    monitor = MemoryMonitor()
+    monitor.start()
+    app = UFOApp(data_processor)
+    app.withdraw()
+    steps = [('map', app.show_map_page), ('main_menu', app.show_main_menu),
+             ('graphs', app.show_graphs_page), ('create_graph', app.show_user_create_graph_page),
+             ('graphs', app.show_graphs_page), ('main_menu', app.show_main_menu),
+             ('report', app.show_report_page), ('main_menu', app.show_main_menu)]
+    baseline = None
+    try:
+        for cycle in range(cycles):
+            for page, step in steps:
+                step()
+                app.update()
+                monitor.record(page)
+            if cycle == warmup - 1:
+                baseline = tracemalloc.get_traced_memory()[0]
+        final = tracemalloc.get_traced_memory()[0]
+        print(monitor.report())
+        if baseline is not None and cycles > warmup:
+            growth = (final - baseline) / (cycles - warmup) / 1024
+            print(f'Traced memory growth after warmup: {growth:.1f} KiB per cycle')
+            assert growth <= max_growth_kib, f'Memory grows by {growth:.1f} KiB per cycle'
+        figures = monitor.records[-1]['figures']
+        assert figures <= max_figures, f'{figures} matplotlib figures are still alive'
+    finally:
+        app.destroy()
+    return monitor
+
+
+def main():
+    """
+    Run the navigation stress scenario from the command line.
+    """
+    from data_processor import UFODataProcessor
+    parser = argparse.ArgumentParser(description='Cycle through the pages and check that memory is bounded.')
+    parser.add_argument('--cycles', type=int, default=30)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--max-growth-kib', type=float, default=256.0)
+    parser.add_argument('--max-figures', type=int, default=20)
+    args = parser.parse_args()
+
+    warnings.simplefilter(action='ignore', category=FutureWarning)
+    current_dir = os.getcwd()
+    data_processor = UFODataProcessor(os.path.join(current_dir, 'data', 'nuforc_data.csv'),
+                                      os.path.join(current_dir, 'data', 'gadb_country_declatlon.csv'))
+    try:
+        run_stress(data_processor, args.cycles, args.warmup, args.max_growth_kib, args.max_figures)
+    except AssertionError as error:
+        print(f'FAILED: {error}')
+        sys.exit(1)
+    print('Memory is bounded.')
+
+
+if __name__ == '__main__':
+    main()
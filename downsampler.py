@@ -0,0 +1,165 @@
+import numpy as np
+import pandas as pd
+
+
+class Downsampler:
+    """
+    A class to reduce the number of points drawn by large line, scatter and bar graphs.
+    """
+    MODES = ('auto', 'sample', 'none')
+
+    def __init__(self, mode: str = 'auto', point_budget: int = 5000, bar_budget: int = 500, seed: int = 0):
+        """
+        Initialize the Downsampler.
+
+        :param mode: 'auto' uses LTTB for lines, a hexbin density for numerical scatter plots and
+            pre-aggregation for bars. 'sample' draws a seeded random sample instead of LTTB and hexbin.
+            'none' passes every point through for exact rendering.
+        :type mode: str
+        :param point_budget: Maximum number of points drawn before downsampling switches on.
+        :type point_budget: int
+        :param bar_budget: Maximum number of bars drawn before bar graphs are pre-aggregated.
+        :type bar_budget: int
+        :param seed: Seed used when a random sample is needed.
+        :type seed: int
+        """
+        if mode not in self.MODES:
+            raise ValueError(f'Unknown downsampling mode: {mode}')
+        self.mode = mode
+        self.point_budget = max(int(point_budget), 3)
+        self.bar_budget = max(int(bar_budget), 1)
+        self.seed = seed
+
+    def is_active(self, size: int, bars: bool = False) -> bool:
+        """
+        Check whether a series of the given size should be downsampled.
+
+        :param size: Number of points (or bars) that would be drawn.
+        :type size: int
+        :param bars: Compare against the bar budget instead of the point budget.
+        :type bars: bool
+        :return: True if the data exceeds the budget and downsampling is enabled.
+        :rtype: bool
+        """
+        return self.mode != 'none' and size > (self.bar_budget if bars else self.point_budget)
+
+    def line(self, x: pd.Series, y: pd.Series) -> tuple:
+        """
+        Downsample a line series with Largest-Triangle-Three-Buckets (or a random sample).
+
+        Numerical x values are sorted first, otherwise the row order is kept.
+
+        :param x: Values for the x-axis.
+        :param y: Values for the y-axis.
+        :return: The x and y values to plot.
+        :rtype: tuple
+        """
+        x_values = np.asarray(x)
+        y_values = np.asarray(y)
+        if pd.api.types.is_numeric_dtype(x):
+            order = np.argsort(x_values, kind='stable')
+            x_values, y_values = x_values[order], y_values[order]
+            position = x_values.astype(float)
+        else:
+            position = np.arange(len(x_values), dtype=float)
+        if pd.api.types.is_numeric_dtype(y):
+            height = y_values.astype(float)
+        else:
+            height = pd.factorize(y_values)[0].astype(float)
+        if self.mode == 'sample':
+            keep = self.sample_indices(len(x_values))
+        else:
+            keep = self.lttb_indices(position, height, self.point_budget)
+        return x_values[keep], y_values[keep]
+
+    def scatter_sample(self, x: pd.Series, y: pd.Series) -> tuple:
+        """
+        Take a seeded random sample of a scatter series that fits in the point budget.
+
+        :param x: Values for the x-axis.
+        :param y: Values for the y-axis.
+        :return: The sampled x and y values.
+        :rtype: tuple
+        """
+        keep = self.sample_indices(len(x))
+        return np.asarray(x)[keep], np.asarray(y)[keep]
+
+    def sample_indices(self, size: int) -> np.ndarray:
+        """
+        Pick sorted row positions for a seeded random sample of at most the point budget.
+
+        :param size: Number of rows to sample from.
+        :return: Sorted row positions.
+        :rtype: numpy.ndarray
+        """
+        if size <= self.point_budget:
+            return np.arange(size)
+        rng = np.random.default_rng(self.seed)
+        return np.sort(rng.choice(size, size=self.point_budget, replace=False))
+
+    def bars(self, x: pd.Series, y: pd.Series) -> tuple:
+        """
+        Pre-aggregate one-bar-per-row data into one bar per x value.
+
+        Overlapping bars are drawn as the union of their extents, so the result looks the same
+        as drawing every row. Numerical x values with more unique values than the bar budget
+        are grouped into equal-width bins.
+
+        :param x: Values for the x-axis.
+        :param y: Numerical values for the y-axis.
+        :return: The x positions, bar heights, bar bottoms and bar width (None for the default).
+        :rtype: tuple
+        """
+        frame = pd.DataFrame({'x': np.asarray(x), 'y': np.asarray(y, dtype=float)})
+        width = None
+        if pd.api.types.is_numeric_dtype(frame['x']) and frame['x'].nunique() > self.bar_budget:
+            edges = np.linspace(frame['x'].min(), frame['x'].max(), self.bar_budget + 1)
+            bins = np.clip(np.searchsorted(edges, frame['x'], side='right') - 1, 0, self.bar_budget - 1)
+            frame['x'] = (edges[bins] + edges[bins + 1]) / 2
+            width = (edges[1] - edges[0]) * 0.8
+        grouped = frame.groupby('x', sort=False)['y']
+        top = grouped.max().clip(lower=0)
+        bottom = grouped.min().clip(upper=0)
+        return top.index.to_numpy(), (top - bottom).to_numpy(), bottom.to_numpy(), width
+
+    @staticmethod
+    def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+        """
+        Select the indices kept by the Largest-Triangle-Three-Buckets algorithm.
+
+        :param x: Sorted numerical x values.
+        :param y: Numerical y values.
+        :param threshold: Number of points to keep.
+        :return: Indices of the points to keep.
+        :rtype: numpy.ndarray
+        """
+        size = len(x)
+        if threshold >= size or threshold < 3:
+            return np.arange(size)
+        edges = np.linspace(1, size - 1, threshold - 1).astype(int)
+        keep = np.empty(threshold, dtype=int)
+        keep[0], keep[-1] = 0, size - 1
+        previous = 0
+        for i in range(threshold - 2):
+            start, stop = edges[i], edges[i + 1]
+            next_start, next_stop = edges[i + 1], edges[i + 2] if i + 2 < len(edges) else size
+            avg_x = x[next_start:next_stop].mean()
+            avg_y = y[next_start:next_stop].mean()
+            area = np.abs((x[previous] - avg_x) * (y[start:stop] - y[previous]) -
+                          (x[previous] - x[start:stop]) * (avg_y - y[previous]))
+            previous = start + int(np.argmax(area))
+            keep[i + 1] = previous
+        return keep
+
+    @staticmethod
+    def mark(fig, shown: int, total: int, method: str):
+        """
+        Add a note to the figure saying that it was downsampled.
+
+        :param fig: The figure to mark.
+        :param shown: Number of points or bins drawn.
+        :param total: Number of rows in the data.
+        :param method: Name of the downsampling method used.
+        """
+        fig.text(0.99, 0.01, f'Downsampled ({method}): {shown:,} of {total:,} points',
+                 ha='right', va='bottom', fontsize=7, color='gray')
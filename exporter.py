@@ -0,0 +1,182 @@
+import json
+import os
+import tempfile
+import threading
+from concurrent.futures import Future
+import numpy as np
+import pandas as pd
+from instrumentation import span
+
+FORMATS = {'.csv': 'csv', '.parquet': 'parquet', '.geojson': 'geojson', '.json': 'geojson'}
+
+
+class ExportCancelled(Exception):
+    """
+    Raised when an export is cancelled before it finished.
+    """
+
+
+class ReportExporter:
+    """
+    A class to write a selection of reports to CSV, Parquet or GeoJSON.
+
+    The selection is given as positions into the reports instead of a filtered DataFrame. The reports are
+    taken and written chunk by chunk, so only one chunk is copied at a time. The file is written to a
+    temporary file next to the destination and renamed once complete, so a failed or cancelled export
+    leaves no partial file behind.
+    """
+    def __init__(self, reports: pd.DataFrame, positions, chunk_size: int = 50000):
+        """
+        Initialize the ReportExporter.
+
+        :param reports: DataFrame containing UFO sighting data.
+        :param positions: Positions of the selected reports, in the order they are written.
+        :param chunk_size: Number of reports written at once.
+        """
+        self.reports = reports
+        self.positions = np.asarray(positions, dtype=np.intp)
+        self.chunk_size = max(int(chunk_size), 1)
+        self.written = 0
+        self.cancelled = threading.Event()
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    @staticmethod
+    def format_of(path: str) -> str:
+        """
+        Get the export format from the extension of a file name.
+
+        :param path: Path of the file.
+        :return: 'csv', 'parquet' or 'geojson'.
+        :rtype: str
+        :raises ValueError: If the extension is not supported.
+        """
+        extension = os.path.splitext(path)[1].lower()
+        if extension not in FORMATS:
+            raise ValueError(f"Unsupported export format '{extension}', use one of {', '.join(FORMATS)}")
+        return FORMATS[extension]
+
+    def chunks(self):
+        """
+        Yield the selected reports chunk by chunk, counting the written reports.
+        """
+        for start in range(0, len(self.positions), self.chunk_size):
+            if self.cancelled.is_set():
+                raise ExportCancelled('The export was cancelled')
+            chunk = self.reports.iloc[self.positions[start:start + self.chunk_size]]
+            yield chunk
+            self.written = start + len(chunk)
+
+    def export(self, path: str, file_format: str = None):
+        """
+        Write the selected reports to a file.
+
+        :param path: Path of the file.
+        :param file_format: 'csv', 'parquet' or 'geojson' (default is taken from the extension of path).
+        """
+        file_format = file_format or self.format_of(path)
+        write = {'csv': self.write_csv, 'parquet': self.write_parquet, 'geojson': self.write_geojson}[file_format]
+        self.written = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        handle, temporary = tempfile.mkstemp(prefix='.export-', suffix='.tmp', dir=directory)
+        os.close(handle)
+        try:
+            with span(f'ReportExporter.write_{file_format}', rows=len(self)):
+                write(temporary)
+            os.chmod(temporary, 0o644)
+            os.replace(temporary, path)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+
+    def write_csv(self, path: str):
+        """
+        Write the selected reports as CSV with the columns of the reports file.
+        """
+        with open(path, 'w', newline='', encoding='utf-8') as file:
+            file.write(','.join(self.reports.columns) + '\n')
+            for chunk in self.chunks():
+                chunk.to_csv(file, header=False, index=False, lineterminator='\n')
+
+    def write_parquet(self, path: str):
+        """
+        Write the selected reports as Parquet, one row group per chunk. Needs pyarrow.
+        """
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError('Exporting to Parquet needs pyarrow: pip install pyarrow') from None
+        # Text columns are fixed to strings so a chunk with only missing values does not change the schema
+        text = [column for column, dtype in self.reports.dtypes.items()
+                if pd.api.types.is_string_dtype(dtype) or pd.api.types.is_object_dtype(dtype)]
+        schema = pa.Schema.from_pandas(self.reports.head(0), preserve_index=False)
+        for column in text:
+            schema = schema.set(schema.get_field_index(column), pa.field(column, pa.string()))
+        with pq.ParquetWriter(path, schema) as writer:
+            for chunk in self.chunks():
+                if text:
+                    chunk = chunk.assign(**{column: chunk[column].where(chunk[column].isna(),
+                                                                        chunk[column].astype(str))
+                                            for column in text})
+                writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+
+    def write_geojson(self, path: str):
+        """
+        Write the selected reports as a GeoJSON FeatureCollection of points. Reports without a position get
+        a null geometry.
+        """
+        properties = [column for column in self.reports.columns if column not in ('latitude', 'longitude')]
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write('{"type": "FeatureCollection", "features": [')
+            first = True
+            for chunk in self.chunks():
+                latitudes = pd.to_numeric(chunk['latitude'], errors='coerce').to_numpy(dtype=float)
+                longitudes = pd.to_numeric(chunk['longitude'], errors='coerce').to_numpy(dtype=float)
+                # JSON has no NaN, missing values are written as null
+                records = chunk[properties].astype(object).where(chunk[properties].notna(), None)
+                for latitude, longitude, values in zip(latitudes, longitudes, records.itertuples(index=False)):
+                    geometry = ({'type': 'Point', 'coordinates': [longitude, latitude]}
+                                if np.isfinite(latitude) and np.isfinite(longitude) else None)
+                    feature = {'type': 'Feature', 'geometry': geometry,
+                               'properties': dict(zip(properties, (self.to_json(value) for value in values)))}
+                    file.write(('\n' if first else ',\n') + json.dumps(feature, ensure_ascii=False))
+                    first = False
+            file.write('\n]}\n')
+
+    @staticmethod
+    def to_json(value):
+        """
+        Convert a NumPy scalar to the matching Python value for json.
+        """
+        return value.item() if isinstance(value, np.generic) else value
+
+    def start(self, path: str, file_format: str = None) -> Future:
+        """
+        Write the selected reports to a file on a background thread. The progress can be followed with
+        written and len, and the export stopped with cancel.
+
+        :param path: Path of the file.
+        :param file_format: 'csv', 'parquet' or 'geojson' (default is taken from the extension of path).
+        :return: A Future resolved with the path once the file is written, or failing with the error.
+        :rtype: concurrent.futures.Future
+        """
+        future = Future()
+
+        def run():
+            try:
+                self.export(path, file_format)
+            except BaseException as error:
+                future.set_exception(error)
+            else:
+                future.set_result(path)
+        threading.Thread(target=run, name='ReportExporter', daemon=True).start()
+        return future
+
+    def cancel(self):
+        """
+        Stop a running export after the current chunk.
+        """
+        self.cancelled.set()
@@ -0,0 +1,90 @@
+import os
+import time
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+
+class FileLock:
+    """
+    An advisory lock on a lock file, shared between processes.
+
+    On POSIX systems flock is used and shared locks are supported. On Windows msvcrt byte-range locking
+    is used and every lock is exclusive. Waiting for the lock is bounded by a timeout.
+
+        with FileLock('data/nuforc_data.csv.lock'):
+            ...
+    """
+    def __init__(self, path: str, shared: bool = False, timeout: float = 10.0, poll_interval: float = 0.005):
+        """
+        Initialize the FileLock.
+
+        :param path: Path of the lock file. It is created if needed.
+        :param shared: Take a shared (read) lock instead of an exclusive (write) lock.
+        :param timeout: Maximum number of seconds to wait for the lock.
+        :param poll_interval: Initial number of seconds between attempts; it doubles up to 0.1 s.
+        """
+        self.path = path
+        self.shared = shared
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.file = None
+        self.waited = 0.0
+
+    def acquire(self):
+        """
+        Take the lock, waiting at most timeout seconds.
+
+        :raises TimeoutError: If the lock could not be taken in time.
+        """
+        self.file = open(self.path, 'a+b')
+        start = time.perf_counter()
+        interval = self.poll_interval
+        while not self._try_lock():
+            if time.perf_counter() - start >= self.timeout:
+                self.file.close()
+                self.file = None
+                raise TimeoutError(f'Timed out after {self.timeout} s waiting for the lock on {self.path}')
+            time.sleep(interval)
+            interval = min(interval * 2, 0.1)
+        self.waited = time.perf_counter() - start
+
+    def _try_lock(self) -> bool:
+        """
+        Try to take the lock without waiting.
+        """
+        try:
+            if os.name == 'nt':
+                self.file.seek(0)
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                fcntl.flock(self.file.fileno(), (fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX) | fcntl.LOCK_NB)
+        except OSError:
+            return False
+        return True
+
+    def release(self):
+        """
+        Release the lock.
+        """
+        if self.file is None:
+            return
+        try:
+            if os.name == 'nt':
+                self.file.seek(0)
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        finally:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+        return False
@@ -0,0 +1,343 @@
+import re
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+TOKEN_PATTERN = re.compile(r"""\s*(?:
+    (?P<number>-?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+    |(?P<string>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")
+    |(?P<name>[A-Za-z_][A-Za-z0-9_]*)
+    |(?P<operator><=|>=|==|!=|=|<|>|\(|\)|,)
+    )""", re.VERBOSE)
+KEYWORDS = ('and', 'or', 'not', 'in')
+COMPARISONS = {'==': np.equal, '!=': np.not_equal, '<': np.less, '<=': np.less_equal,
+               '>': np.greater, '>=': np.greater_equal}
+# The operator that gives the same result with the operands swapped, for comparisons like 1990 <= year_found
+SWAPPED = {'==': '==', '!=': '!=', '<': '>', '<=': '>=', '>': '<', '>=': '<='}
+PLAN_CACHE_SIZE = 128
+
+
+class FilterError(ValueError):
+    """
+    Raised when a filter expression cannot be parsed or does not fit the reports.
+    """
+
+
+def quote(value) -> str:
+    """
+    Write a value as a literal of a filter expression.
+
+    :param value: A string or a number.
+    :return: The literal, e.g. 'Thailand' or 1990.
+    :rtype: str
+    """
+    if isinstance(value, str):
+        return "'" + value.replace('\\', '\\\\').replace("'", "\\'") + "'"
+    return repr(value.item() if isinstance(value, np.generic) else value)
+
+
+def tokenize(expression: str) -> list:
+    """
+    Split a filter expression into (kind, value) tokens. Keywords are lowercased and literals converted.
+
+    :param expression: The filter expression.
+    :return: The tokens, kind is 'number', 'string', 'name', 'keyword' or 'operator'.
+    :rtype: list
+    :raises FilterError: If the expression holds something that is not a token.
+    """
+    tokens = []
+    position, end = 0, len(expression.rstrip())
+    while position < end:
+        match = TOKEN_PATTERN.match(expression, position)
+        if match is None or match.end() == position:
+            raise FilterError(f'Unexpected text at position {position}: {expression[position:position + 10]!r}')
+        kind, text = match.lastgroup, match.group(match.lastgroup)
+        if kind == 'number':
+            tokens.append((kind, int(text) if text.lstrip('-').isdigit() else float(text)))
+        elif kind == 'string':
+            tokens.append((kind, re.sub(r'\\(.)', r'\1', text[1:-1])))
+        elif kind == 'name' and text.lower() in KEYWORDS:
+            tokens.append(('keyword', text.lower()))
+        else:
+            tokens.append((kind, '==' if text == '=' else text))
+        position = match.end()
+    return tokens
+
+
+def normalize(expression: str) -> str:
+    """
+    Write a filter expression in a normal form: keywords in lowercase, literals quoted the same way and one
+    space between tokens. Expressions that only differ in these respects have the same normal form.
+
+    :param expression: The filter expression.
+    :return: The normalized expression.
+    :rtype: str
+    """
+    return render(tokenize(expression))
+
+
+def render(tokens: list) -> str:
+    """
+    Write tokens back as an expression in the normal form of normalize.
+    """
+    return ' '.join(quote(value) if kind in ('number', 'string') else value for kind, value in tokens)
+
+
+class Parser:
+    """
+    A recursive descent parser turning the tokens of a filter expression into a FilterPlan tree.
+
+    Grammar:
+        expression := conjunction ('or' conjunction)*
+        conjunction := negation ('and' negation)*
+        negation := 'not' negation | '(' expression ')' | comparison
+        comparison := operand ('not'? 'in' '(' literal (',' literal)* ')' | (operator operand)+)
+        operand := column | number | string
+    """
+    def __init__(self, tokens: list):
+        """
+        Initialize the Parser.
+
+        :param tokens: The result of tokenize.
+        """
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self) -> tuple:
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def take(self, kind: str = None, value=None) -> tuple:
+        """
+        Consume the next token, checking its kind and value if given.
+        """
+        token = self.peek()
+        if token[0] is None:
+            raise FilterError('The filter expression ends too early')
+        if (kind is not None and token[0] != kind) or (value is not None and token[1] != value):
+            raise FilterError(f'Expected {value or kind} but found {token[1]!r}')
+        self.position += 1
+        return token
+
+    def parse(self) -> 'FilterPlan':
+        """
+        Parse the whole expression.
+        """
+        if not self.tokens:
+            return FilterPlan('all')
+        plan = self.expression()
+        if self.position < len(self.tokens):
+            raise FilterError(f'Unexpected {self.peek()[1]!r}')
+        return plan
+
+    def expression(self) -> 'FilterPlan':
+        plans = [self.conjunction()]
+        while self.peek() == ('keyword', 'or'):
+            self.take()
+            plans.append(self.conjunction())
+        return plans[0] if len(plans) == 1 else FilterPlan('or', plans)
+
+    def conjunction(self) -> 'FilterPlan':
+        plans = [self.negation()]
+        while self.peek() == ('keyword', 'and'):
+            self.take()
+            plans.append(self.negation())
+        return plans[0] if len(plans) == 1 else FilterPlan('and', plans)
+
+    def negation(self) -> 'FilterPlan':
+        if self.peek() == ('keyword', 'not'):
+            self.take()
+            return FilterPlan('not', [self.negation()])
+        if self.peek() == ('operator', '('):
+            self.take()
+            plan = self.expression()
+            self.take('operator', ')')
+            return plan
+        return self.comparison()
+
+    def operand(self) -> tuple:
+        kind, value = self.take()
+        if kind not in ('name', 'number', 'string'):
+            raise FilterError(f'Expected a column or a value but found {value!r}')
+        return kind, value
+
+    def comparison(self) -> 'FilterPlan':
+        left = self.operand()
+        negated = self.peek() == ('keyword', 'not')
+        if negated or self.peek() == ('keyword', 'in'):
+            if negated:
+                self.take()
+            self.take('keyword', 'in')
+            if left[0] != 'name':
+                raise FilterError(f"Expected a column before 'in' but found {left[1]!r}")
+            self.take('operator', '(')
+            values = [self.literal()]
+            while self.peek() == ('operator', ','):
+                self.take()
+                values.append(self.literal())
+            self.take('operator', ')')
+            plan = FilterPlan('in', column=left[1], values=values)
+            return FilterPlan('not', [plan]) if negated else plan
+        plans = []
+        while self.peek()[0] == 'operator' and self.peek()[1] in COMPARISONS:
+            operator = self.take()[1]
+            right = self.operand()
+            plans.append(self.compare(left, operator, right))
+            left = right
+        if not plans:
+            raise FilterError(f'Expected a comparison after {left[1]!r}')
+        return plans[0] if len(plans) == 1 else FilterPlan('and', plans)
+
+    def literal(self):
+        kind, value = self.take()
+        if kind not in ('number', 'string'):
+            raise FilterError(f'Expected a value but found {value!r}')
+        return value
+
+    @staticmethod
+    def compare(left: tuple, operator: str, right: tuple) -> 'FilterPlan':
+        """
+        Build a comparison of two operands, with the column on the left where there is one.
+        """
+        if left[0] != 'name' and right[0] == 'name':
+            left, operator, right = right, SWAPPED[operator], left
+        if left[0] != 'name':
+            raise FilterError(f'Compare a column, not {quote(left[1])} {operator} {quote(right[1])}')
+        return FilterPlan('compare', column=left[1], operator=operator, value=right)
+
+
+class FilterPlan:
+    """
+    A compiled filter expression, evaluated to a boolean mask over reports with vectorized operations.
+
+    Kinds:
+        'all': Keep every report.
+        'and', 'or', 'not': Combine the masks of the plans in children.
+        'compare': Compare column with value, a ('name', column) or a ('number' or 'string', literal) token.
+        'in': Keep the reports whose column holds one of values.
+
+    Text columns support ==, != and in; number columns every comparison. Reports with a missing value do
+    not match a comparison, except for !=.
+    """
+    def __init__(self, kind: str, children: list = (), column: str = None, operator: str = None, value=None,
+                 values: list = None):
+        """
+        Initialize the FilterPlan.
+
+        :param kind: One of the kinds above.
+        :param children: The combined plans of 'and', 'or' and 'not'.
+        :param column: The compared column.
+        :param operator: The comparison operator, a key of COMPARISONS.
+        :param value: The token compared with.
+        :param values: The literals of 'in'.
+        """
+        self.kind = kind
+        self.children = list(children)
+        self.column = column
+        self.operator = operator
+        self.value = value
+        self.values = values
+        self.expression = None
+
+    @property
+    def columns(self) -> set:
+        """
+        The columns the plan reads.
+        """
+        columns = set().union(*(child.columns for child in self.children))
+        if self.column is not None:
+            columns.add(self.column)
+        if self.kind == 'compare' and self.value[0] == 'name':
+            columns.add(self.value[1])
+        return columns
+
+    def __call__(self, reports: pd.DataFrame, arrays: dict = None) -> np.ndarray:
+        """
+        Evaluate the plan.
+
+        :param reports: DataFrame containing UFO sighting data.
+        :param arrays: A dict to take the arrays of the columns from and to keep them in, so plans evaluated
+            on the same reports convert each column only once (default is a new dict).
+        :return: True for the matching reports.
+        :rtype: numpy.ndarray
+        :raises FilterError: If a column does not exist or is compared with a value of the wrong type.
+        """
+        missing = self.columns.difference(reports.columns)
+        if missing:
+            raise FilterError(f"Unknown column {', '.join(sorted(missing))}")
+        return self.evaluate(reports, {} if arrays is None else arrays)
+
+    def evaluate(self, reports: pd.DataFrame, arrays: dict) -> np.ndarray:
+        """
+        Evaluate the plan, taking the array of each column only once.
+
+        :param reports: DataFrame containing UFO sighting data.
+        :param arrays: The arrays of the columns taken so far.
+        """
+        if self.kind == 'all':
+            return np.ones(len(reports), dtype=bool)
+        if self.kind == 'not':
+            return ~self.children[0].evaluate(reports, arrays)
+        if self.kind in ('and', 'or'):
+            combine = np.logical_and if self.kind == 'and' else np.logical_or
+            mask = self.children[0].evaluate(reports, arrays)
+            for child in self.children[1:]:
+                mask = combine(mask, child.evaluate(reports, arrays))
+            return mask
+        numeric = pd.api.types.is_numeric_dtype(reports[self.column])
+        if self.kind == 'in':
+            if numeric and any(isinstance(value, str) for value in self.values):
+                raise FilterError(f'{self.column} holds numbers, compare it with numbers')
+            return reports[self.column].isin(self.values).to_numpy()
+        values = self.array(reports, self.column, arrays)
+        if self.value[0] == 'name':
+            other = self.array(reports, self.value[1], arrays)
+            if numeric != pd.api.types.is_numeric_dtype(reports[self.value[1]]):
+                raise FilterError(f'Cannot compare {self.column} with {self.value[1]}')
+        else:
+            other = self.value[1]
+            if numeric and isinstance(other, str):
+                raise FilterError(f'{self.column} holds numbers, compare it with a number')
+            if not numeric and not isinstance(other, str):
+                raise FilterError(f'{self.column} holds text, compare it with a quoted value')
+        if not numeric and self.operator not in ('==', '!='):
+            raise FilterError(f'{self.column} holds text, use ==, != or in')
+        return COMPARISONS[self.operator](values, other)
+
+    @staticmethod
+    def array(reports: pd.DataFrame, column: str, arrays: dict) -> np.ndarray:
+        if column not in arrays:
+            series = reports[column]
+            arrays[column] = (series.to_numpy(dtype=float, na_value=np.nan)
+                              if pd.api.types.is_numeric_dtype(series) else series.to_numpy(dtype=object))
+        return arrays[column]
+
+
+_plans = OrderedDict()
+_plans_lock = threading.Lock()
+
+
+def compile_filter(expression: str) -> FilterPlan:
+    """
+    Compile a filter expression such as "country in ('Thailand', 'Vietnam') and 1990 <= year_found < 2000".
+    The PLAN_CACHE_SIZE most recently used plans are kept per normalized expression.
+
+    :param expression: The filter expression; an empty expression keeps every report.
+    :return: The plan, called with a DataFrame of reports to get the mask of the matching reports.
+    :rtype: FilterPlan
+    :raises FilterError: If the expression cannot be parsed.
+    """
+    tokens = tokenize(expression or '')
+    key = render(tokens)
+    with _plans_lock:
+        plan = _plans.get(key)
+        if plan is not None:
+            _plans.move_to_end(key)
+            return plan
+    plan = Parser(tokens).parse()
+    plan.expression = key
+    with _plans_lock:
+        _plans[key] = plan
+        while len(_plans) > PLAN_CACHE_SIZE:
+            _plans.popitem(last=False)
+    return plan
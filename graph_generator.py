@@ -1,23 +1,136 @@
+from statistics import NormalDist
 import matplotlib.pyplot as plt
+import numpy as np
 import seaborn as sns
 import matplotlib.ticker as ticker
+from matplotlib.colors import LinearSegmentedColormap, to_rgba
+import pandas as pd
 from data_processor import UFODataProcessor
-
+from filter_expression import compile_filter
+from downsampler import Downsampler
+from instrumentation import traced
+from outlier_filter import OutlierFilter
+
+# Charts of the graphs page and their figure sizes in inches
+DASHBOARD_CHARTS = {
+    'histogram1': (4, 2),
+    'histogram2': (4, 2),
+    'pie_chart_ufo_shape': (8.5, 3),
+    'top_cities_bar_chart': (4, 3),
+    'year_line': (4, 3),
+}
 
 class GraphGenerator:
     """
     A class to generate various types of graphs using matplotlib.
     """
-    def __init__(self, data_processor: UFODataProcessor):
+    def __init__(self, data_processor: UFODataProcessor, downsample_mode: str = 'auto', point_budget: int = 5000,
+                 deduplicate: bool = False, outliers: str = 'iqr', where: str = '', selection=None):
         """
         Initialize the GraphGenerator.
+
+        :param data_processor: An instance of UFODataProcessor.
+        :param downsample_mode: 'auto', 'sample' or 'none' for exact rendering (see Downsampler).
+        :param point_budget: Number of points above which line and scatter graphs are downsampled.
+        :param deduplicate: Keep only the first report of each cluster of likely duplicate reports.
+        :param outliers: How outliers are removed, one of OutlierFilter.STRATEGIES.
+        :param where: A filter expression the drawn reports have to match (default is all reports, see
+            UFODataProcessor.filter_mask).
+        :param selection: Row positions or a boolean mask of the reports to draw, e.g. the reports selected on
+            the map (default is all reports, see select).
         """
 
         self.data_processor = data_processor
-        self.data = self.data_processor.get_ufo_data()
-        self.data = self.remove_all_outliers(self.data)
+        self.deduplicate = deduplicate
+        self.outliers = outliers
+        self.where = where
+        self.downsampler = Downsampler(downsample_mode, point_budget)
+        self.select(selection)
+
+    def select(self, selection=None):
+        """
+        Draw only some of the reports. Values aggregated from a selection are cached like those of all reports,
+        keyed by a hash of the selected positions, so switching back to a recent selection does not count again
+        (see scope).
+
+        :param selection: Row positions or a boolean mask of the reports, or None for all reports.
+        """
+        if selection is not None:
+            selection = np.asarray(selection)
+            selection = np.flatnonzero(selection) if selection.dtype == bool else selection.astype(np.intp)
+        self.selection = selection
+        self.selection_key = None if selection is None else (len(selection), hash(selection.tobytes()))
+
+    @property
+    def data(self) -> pd.DataFrame:
+        """
+        The current reports without outliers that match the filter expression and the selection, shared with
+        the other generators (see UFODataProcessor.clean_reports). Must not be modified.
+        """
+        if not self.where and self.selection is None:
+            return self.data_processor.clean_reports(self.outliers, self.deduplicate)
+        return self.data_processor.get_cached(('filtered_reports',) + self.data_key,
+                                              lambda: self.data_processor.ufo_reports[self.row_mask()],
+                                              scope=self.scope)
+
+    @property
+    def data_key(self) -> tuple:
+        """
+        What selects the reports of data, part of the keys of the values cached from them.
+        """
+        return self.deduplicate, self.outliers, compile_filter(self.where).expression, self.selection_key
+
+    @property
+    def scope(self):
+        """
+        The filter expression and selection the values cached from data are derived from, so the processor
+        keeps those of the recently used ones only (see UFODataProcessor.get_cached). None for all reports.
+        """
+        if not self.where and self.selection is None:
+            return None
+        return 'graphs', compile_filter(self.where).expression, self.selection_key
+
+    def row_mask(self) -> np.ndarray:
+        """
+        Mark the reports of data among all reports of the processor.
 
-    def generate_histogram(self, attribute, xlabel, ylabel, title, color):
+        :return: True for the reports without outliers that match the filter expression and the selection.
+        :rtype: numpy.ndarray
+        """
+        def compute():
+            mask = self.data_processor.clean_mask(self.outliers, self.deduplicate)
+            if self.where:
+                mask = mask & self.data_processor.filter_mask(self.where)
+            if self.selection is not None:
+                selected = np.zeros(len(mask), dtype=bool)
+                selected[self.selection[self.selection < len(mask)]] = True
+                mask = mask & selected
+            return mask
+        return self.data_processor.get_cached(('row_mask',) + self.data_key, compute, scope=self.scope)
+
+    @property
+    def data_version(self) -> int:
+        """
+        The version of the data of the processor.
+        """
+        return self.data_processor.data_version
+
+    @staticmethod
+    def axes(ax=None, **kwargs) -> tuple:
+        """
+        Get the figure and axis to draw on: the figure of the given axis, or a new pyplot figure.
+
+        :param ax: The axis to draw on, or None.
+        :param kwargs: Passed on to plt.subplots when a new figure is created.
+        :return: The figure and axis objects.
+        :rtype: tuple
+        """
+        if ax is None:
+            return plt.subplots(**kwargs)
+        return ax.figure, ax
+
+    @traced(rows=lambda self, *args, **kwargs: len(self.data))
+    def generate_histogram(self, attribute, xlabel, ylabel, title, color, ax=None):
         """
         Generate a histogram.
 
@@ -26,27 +139,30 @@ class GraphGenerator:
         :param ylabel: The label for the y-axis.
         :param title: The title of the graph.
         :param color: The color of the bars.
+        :param ax: The axis to draw on (default is a new figure).
         :return: The figure and axis objects.
         """
-        fig, ax = plt.subplots()
+        fig, ax = self.axes(ax)
         ax.hist(self.data[attribute], color=color)
         ax.set_xlabel(xlabel)
         ax.set_ylabel(ylabel)
         ax.set_title(title)
         return fig, ax
 
-    def generate_pie_chart(self, attribute, title, legend=False):
+    @traced(rows=lambda self, *args, **kwargs: len(self.data))
+    def generate_pie_chart(self, attribute, title, legend=False, ax=None):
         """
         Generate a pie chart.
 
         :param attribute: The attribute to plot.
         :param title: The title of the graph.
         :param legend: Whether to display the legend (default is False).
+        :param ax: The axis to draw on (default is a new figure).
         :return: The figure and axis objects.
         """
         def autopct_more_than_4(pct):
             return ('%1.f%%' % pct) if pct > 4 else ''
-        fig, ax = plt.subplots()
+        fig, ax = self.axes(ax)
         count = self.data[attribute].value_counts()
         ax.pie(count, labels=count.index, autopct=autopct_more_than_4, startangle=90)
         ax.set_title(title)
@@ -54,7 +170,8 @@ class GraphGenerator:
             ax.legend(labels=count.index, loc='best')
         return fig, ax
 
-    def generate_line_graph(self, x_column, y_column, title, xlabel, ylabel, color):
+    @traced(rows=lambda self, *args, **kwargs: len(self.data))
+    def generate_line_graph(self, x_column, y_column, title, xlabel, ylabel, color, ax=None):
         """
         Generate a line graph.
 
@@ -64,15 +181,24 @@ class GraphGenerator:
         :param xlabel: The label for the x-axis.
         :param ylabel: The label for the y-axis.
         :param color: The color of the markers.
+        :param ax: The axis to draw on (default is a new figure).
         :return: The figure and axis objects.
         """
-        fig, ax = plt.subplots()
+        fig, ax = self.axes(ax)
         if y_column is None:
             counts = self.data[x_column].value_counts().sort_index()
             ax.plot(counts.index, counts.values, marker='o', color=color)
             ax.set_title(title)
             ax.set_xlabel(xlabel)
             ax.set_ylabel(ylabel)
+        elif self.downsampler.is_active(len(self.data)):
+            x_values, y_values = self.downsampler.line(self.data[x_column], self.data[y_column])
+            ax.plot(x_values, y_values, marker='o', color=color)
+            self.downsampler.mark(fig, len(x_values), len(self.data),
+                                  'sample' if self.downsampler.mode == 'sample' else 'LTTB')
+            ax.set_title(title)
+            ax.set_xlabel(xlabel)
+            ax.set_ylabel(ylabel)
         else:
             ax.plot(self.data[x_column], self.data[y_column], marker='o', color=color)
             ax.set_title(title)
@@ -80,7 +206,8 @@ class GraphGenerator:
             ax.set_ylabel(ylabel)
         return fig, ax
 
-    def generate_scatter_plot(self, x_column, y_column, title, xlabel, ylabel, color):
+    @traced(rows=lambda self, *args, **kwargs: len(self.data))
+    def generate_scatter_plot(self, x_column, y_column, title, xlabel, ylabel, color, ax=None):
         """
         Generate a scatter plot.
 
@@ -90,14 +217,27 @@ class GraphGenerator:
         :param xlabel: The label for the x-axis.
         :param ylabel: The label for the y-axis.
         :param color: The color of the markers.
+        :param ax: The axis to draw on (default is a new figure).
         :return: The figure and axis objects.
         """
-        plt.tight_layout()
-        fig, ax = plt.subplots()
+        if ax is None:
+            plt.tight_layout()
+        fig, ax = self.axes(ax)
         if y_column is None:
             y_column = self.data[x_column].value_counts().index
             counts = self.data[x_column].value_counts().sort_index()
             ax.scatter(counts.index, counts.values, c=color[0])
+        elif self.downsampler.is_active(len(self.data)):
+            x_values, y_values = self.data[x_column], self.data[y_column]
+            if (self.downsampler.mode == 'auto' and pd.api.types.is_numeric_dtype(x_values)
+                    and pd.api.types.is_numeric_dtype(y_values)):
+                cmap = LinearSegmentedColormap.from_list('density', ['white', color[0]])
+                hexes = ax.hexbin(x_values, y_values, gridsize=60, mincnt=1, cmap=cmap)
+                self.downsampler.mark(fig, len(hexes.get_offsets()), len(self.data), 'hexbin density')
+            else:
+                x_values, y_values = self.downsampler.scatter_sample(x_values, y_values)
+                ax.scatter(x_values, y_values, c=color[0])
+                self.downsampler.mark(fig, len(x_values), len(self.data), 'sample')
         else:
             ax.scatter(self.data[x_column], self.data[y_column], c=color[0])
 
@@ -106,7 +246,8 @@ class GraphGenerator:
         ax.set_ylabel(ylabel)
         return fig, ax
 
-    def generate_bar_graph(self, x_column, y_column, title, xlabel, ylabel, color):
+    @traced(rows=lambda self, *args, **kwargs: len(self.data))
+    def generate_bar_graph(self, x_column, y_column, title, xlabel, ylabel, color, ax=None):
         """
         Generate a bar graph.
 
@@ -116,12 +257,19 @@ class GraphGenerator:
         :param xlabel: The label for the x-axis.
         :param ylabel: The label for the y-axis.
         :param color: The color of the bars.
+        :param ax: The axis to draw on (default is a new figure).
         :return: The figure and axis objects.
         """
-        fig, ax = plt.subplots()
+        fig, ax = self.axes(ax)
         if y_column is None:
             counts = self.data[x_column].value_counts()
             ax.bar(counts.index, counts.values, color=color)
+        elif (self.downsampler.is_active(len(self.data), bars=True)
+              and pd.api.types.is_numeric_dtype(self.data[y_column])):
+            # Only bars with numerical heights can be pre-aggregated, text heights are drawn as categories
+            x_values, heights, bottoms, width = self.downsampler.bars(self.data[x_column], self.data[y_column])
+            ax.bar(x_values, heights, bottom=bottoms, color=color, **({'width': width} if width else {}))
+            self.downsampler.mark(fig, len(x_values), len(self.data), 'pre-aggregated')
         else:
             ax.bar(self.data[x_column], self.data[y_column], color=color)
         ax.set_title(title)
@@ -129,115 +277,392 @@ class GraphGenerator:
         ax.set_ylabel(ylabel)
         return fig, ax
 
+    @traced(rows=lambda self, *args, **kwargs: len(self.data))
     def generate_histogram1(self):
         """
         Generate a histogram of Length of encounter seconds.
         """
-        fig, ax = plt.subplots(figsize=(4, 2), tight_layout=True)
-        sns.histplot(data=self.data, x='length_of_encounter_seconds', kde=True, color='pink')
-        ax.set_xlabel('Length of Encounter (seconds)')
-        ax.set_ylabel('Frequency')
-        ax.set_title('')
-        return fig, ax
+        return self.generate_dashboard_chart('histogram1')
 
+    @traced(rows=lambda self, *args, **kwargs: len(self.data))
     def generate_histogram2(self):
         """
         Generate a histogram of most time of the day UFO sighting was found.
         """
-        fig, ax = plt.subplots(figsize=(4, 2), tight_layout=True)
-        sns.histplot(data=self.data, x='hour', kde=True, color='skyblue')
-        ax.set_xlabel('Hour of the Day')
-        ax.set_ylabel('Frequency')
-        ax.set_title('')
+        return self.generate_dashboard_chart('histogram2')
+
+    def generate_dashboard_chart(self, name: str) -> tuple:
+        """
+        Generate one of the charts of the graphs page in a new pyplot figure.
+
+        :param name: A key of DASHBOARD_CHARTS.
+        :return: The figure and axis objects.
+        :rtype: tuple
+        """
+        fig, ax = plt.subplots(figsize=DASHBOARD_CHARTS[name], tight_layout=True)
+        self.draw_dashboard_chart(name, ax, self.dashboard_inputs(name))
         return fig, ax
 
-    def generate_year_line(self):
+    @traced(rows=lambda self, *args, **kwargs: len(self.data))
+    def dashboard_inputs(self, name: str):
         """
-        Generate a line graph of Trends of sighting.
+        Aggregate the data drawn by one of the charts of the graphs page. The result is small, so it can
+        be sent to another process to draw the chart there.
+
+        :param name: A key of DASHBOARD_CHARTS.
+        :return: The input of draw_dashboard_chart.
         """
-        self.data['year_found'] = self.data['year_found'].astype(str)
-        counts = self.data['year_found'].value_counts().sort_index()
+        if name == 'histogram1':
+            return self.histogram_bins('length_of_encounter_seconds')
+        if name == 'histogram2':
+            return self.histogram_bins('hour')
+        if name == 'year_line':
+            counts = self.value_counts('year_found')
+            return counts.set_axis(counts.index.astype(str)).sort_index()
+        if name == 'top_cities_bar_chart':
+            return self.value_counts('location').head(5)
+        if name == 'pie_chart_ufo_shape':
+            return self.value_counts('UFO_shape')
+        raise ValueError(f'Unknown dashboard chart: {name}')
 
-        fig, ax = plt.subplots(figsize=(4, 3), tight_layout=True)
-        sns.lineplot(data=counts, marker='o', ax=ax)
+    @staticmethod
+    def draw_dashboard_chart(name: str, ax, inputs):
+        """
+        Draw one of the charts of the graphs page from its aggregated input.
 
-        ax.set_xlabel('Year')
-        ax.set_ylabel('Frequency')
+        :param name: A key of DASHBOARD_CHARTS.
+        :param ax: The axis to draw on.
+        :param inputs: The result of dashboard_inputs.
+        """
+        counts = inputs[1] if isinstance(inputs, tuple) else inputs
+        if not counts.sum():
+            GraphGenerator.draw_no_reports(ax)
+        elif name == 'histogram1':
+            GraphGenerator.draw_histogram(ax, 'length_of_encounter_seconds', inputs, 'pink')
+            ax.set_xlabel('Length of Encounter (seconds)')
+            ax.set_ylabel('Frequency')
+        elif name == 'histogram2':
+            GraphGenerator.draw_histogram(ax, 'hour', inputs, 'skyblue')
+            ax.set_xlabel('Hour of the Day')
+            ax.set_ylabel('Frequency')
+        elif name == 'year_line':
+            sns.lineplot(data=inputs, marker='o', ax=ax)
+            ax.set_xlabel('Year')
+            ax.set_ylabel('Frequency')
+            ax.xaxis.set_major_locator(ticker.MultipleLocator(base=5))
+        elif name == 'top_cities_bar_chart':
+            inputs.plot(kind='bar', ax=ax, color='slateblue')
+            ax.set_xlabel('City')
+            ax.set_ylabel('Number of Reports')
+            ax.tick_params(rotation=20)
+        elif name == 'pie_chart_ufo_shape':
+            def autopct_more_than_4(pct):
+                return ('%1.f%%' % pct) if pct > 4 else ''
+            percentages = 100 * inputs / inputs.sum()
+            labels_with_percentage = [f'{label} ({percentage:.0f}%)'
+                                      for label, percentage in zip(inputs.index, percentages)]
+            with sns.axes_style('whitegrid'):
+                wedges, _, autotexts = ax.pie(inputs, autopct=autopct_more_than_4, startangle=90)
+                ax.legend(wedges, labels_with_percentage, loc='center right', bbox_to_anchor=(2.2, 0.5), ncol=2)
+        else:
+            raise ValueError(f'Unknown dashboard chart: {name}')
         ax.set_title('')
-        ax.xaxis.set_major_locator(ticker.MultipleLocator(base=5))
 
-        return fig, ax
+    @staticmethod
+    def draw_no_reports(ax):
+        """
+        Say in place of a graph that no reports are selected.
 
-    def generate_top_cities_bar_chart(self):
+        :param ax: The axis to draw on.
         """
-        Generate a bar chart for the top 5 cities with the most reports.
+        ax.set_axis_off()
+        ax.text(0.5, 0.5, 'No reports selected', color='grey', ha='center', va='center', transform=ax.transAxes)
+
+    def value_counts(self, column: str) -> pd.Series:
+        """
+        Count the values of a column of the data, most frequent first. The counts of all reports are kept up to
+        date with appended reports instead of being counted again; those of a filter or selection are counted
+        from the encoded column (see count_values).
+
+        :param column: The column.
+        :return: The number of reports per value.
+        :rtype: pandas.Series
         """
-        # Count occurrences of each city
-        city_counts = self.data['location'].value_counts()
+        if self.where or self.selection is not None:
+            return self.data_processor.get_cached(('value_counts', column) + self.data_key,
+                                                  lambda: self.count_values(column, self.row_mask()),
+                                                  scope=self.scope)
+
+        def update(counts, change):
+            if change.kind == 'update' and column not in change.columns:
+                return counts
+            if change.kind != 'append' or self.deduplicate:
+                return None
+            appended = self.data_processor.appended_clean_reports(change, self.outliers)
+            if appended is None:
+                return None
+            counts = counts.add(appended[column].value_counts(), fill_value=0).astype(counts.dtype)
+            return counts.sort_values(ascending=False, kind='stable')
+        return self.data_processor.get_cached(('value_counts', column) + self.data_key,
+                                              lambda: self.data[column].value_counts(), self.data_version, update)
+
+    def count_values(self, column: str, mask: np.ndarray) -> pd.Series:
+        """
+        Count the values of a column among some of the reports with numpy.bincount over the codes of the column
+        (see UFODataProcessor.column_codes).
 
-        # Select the top 5 cities
-        top_cities = city_counts.head(5)
+        :param column: The column.
+        :param mask: True for the counted reports, over all reports of the processor.
+        :return: The number of reports per value, most frequent first.
+        :rtype: pandas.Series
+        """
+        codes, uniques = self.data_processor.column_codes(column)
+        selected = codes[mask]
+        counts = np.bincount(selected[selected >= 0], minlength=len(uniques))
+        counts = pd.Series(counts, index=uniques.rename(column), name='count')
+        return counts[counts > 0].sort_values(ascending=False, kind='stable')
 
-        # Plot the bar chart
-        fig, ax = plt.subplots(figsize=(4, 3), tight_layout=True)
-        top_cities.plot(kind='bar', ax=ax, color='slateblue')
+    def draw_prebinned_histogram(self, ax, attribute, color):
+        """
+        Draw a histogram with a KDE line from cached, precomputed arrays.
 
-        # Set labels and title
-        ax.set_xlabel('City')
-        ax.set_ylabel('Number of Reports')
-        ax.set_title('')
-        ax.tick_params(rotation=20)
-        return fig, ax
+        :param ax: The axis to draw on.
+        :param attribute: The attribute to plot.
+        :param color: The color of the bars and the KDE line.
+        """
+        self.draw_histogram(ax, attribute, self.histogram_bins(attribute), color)
 
+    def histogram_bins(self, attribute) -> tuple:
+        """
+        Get the histogram and KDE of an attribute, computed once per data version (see compute_histogram).
+        """
+        def compute():
+            if self.where or self.selection is not None:
+                # Taken from the column, without building the selected reports
+                return self.compute_histogram(self.data_processor.ufo_reports[attribute].to_numpy()[self.row_mask()])
+            return self.compute_histogram(self.data[attribute])
+        return self.data_processor.get_cached(('histogram', attribute) + self.data_key, compute, self.data_version,
+                                              scope=self.scope)
+
+    @staticmethod
+    def draw_histogram(ax, attribute, histogram: tuple, color):
+        """
+        Draw a histogram with a KDE line from precomputed arrays.
+
+        Looks the same as ``sns.histplot(..., kde=True)`` but only the bins are passed to seaborn.
+
+        :param ax: The axis to draw on.
+        :param attribute: The attribute to plot.
+        :param histogram: Bin edges, bin counts, KDE support and KDE values (see compute_histogram).
+        :param color: The color of the bars and the KDE line.
+        """
+        edges, heights, support, density = histogram
+        centers = (edges[:-1] + edges[1:]) / 2
+        bins = pd.DataFrame({attribute: centers, 'count': heights})
+        sns.histplot(data=bins, x=attribute, weights='count', bins=len(centers),
+                     binrange=(edges[0], edges[-1]), color=color, alpha=.5, ax=ax)
+        if density is not None:
+            line, = ax.plot(support, density, color=to_rgba(color, 1))
+            line.sticky_edges.y[:] = (0, np.inf)
+
+    @staticmethod
+    @traced(rows=lambda values, *args, **kwargs: len(values))
+    def compute_histogram(values, gridsize: int = 200, kde_gridsize: int = 1024) -> tuple:
+        """
+        Compute histogram counts and a binned KDE scaled to the counts.
+
+        Bins match seaborn's defaults ('auto' edges over the data range). Integer data is counted
+        with ``numpy.bincount`` first. The KDE uses Scott's bandwidth and is computed by linear
+        binning onto a regular grid followed by an FFT convolution with the Gaussian kernel.
+
+        :param values: The values to bin.
+        :param gridsize: Number of points the KDE is evaluated at.
+        :param kde_gridsize: Number of points of the grid the samples are binned onto.
+        :return: Bin edges, bin counts, KDE support and KDE values (None if the data has no spread).
+        :rtype: tuple
+        """
+        values = pd.Series(values).dropna().to_numpy()
+        if len(values) == 0:
+            return np.array([0.0, 1.0]), np.zeros(1), None, None
+        low, high = values.min(), values.max()
+        edges = np.histogram_bin_edges(values, 'auto', (low, high))
+        if np.issubdtype(values.dtype, np.integer) and high - low <= 1_000_000:
+            weights = np.bincount(values - low).astype(float)
+            positions = np.arange(low, high + 1, dtype=float)
+        else:
+            weights = None
+            positions = values.astype(float)
+        heights = np.histogram(positions, edges, weights=weights)[0].astype(float)
+
+        count = len(values)
+        spread = values.std(ddof=1) if count > 1 else 0.0
+        if count < 2 or np.isclose(spread, 0) or high == low:
+            return edges, heights, None, None
+        bandwidth = spread * count ** (-1 / 5)
+
+        # Linear binning onto a regular grid spanning the data range
+        delta = (high - low) / (kde_gridsize - 1)
+        grid_weights = np.ones(len(positions)) if weights is None else weights
+        scaled = (positions - low) / delta
+        left = np.clip(np.floor(scaled).astype(int), 0, kde_gridsize - 2)
+        fraction = scaled - left
+        binned = (np.bincount(left, grid_weights * (1 - fraction), kde_gridsize) +
+                  np.bincount(left + 1, grid_weights * fraction, kde_gridsize))
+
+        # Convolve with the Gaussian kernel using the FFT
+        reach = min(kde_gridsize - 1, int(np.ceil(4 * bandwidth / delta)))
+        offsets = np.arange(-reach, reach + 1) * delta
+        kernel = np.exp(-0.5 * (offsets / bandwidth) ** 2) / (np.sqrt(2 * np.pi) * bandwidth * count)
+        size = 1 << int(np.ceil(np.log2(kde_gridsize + 2 * reach + 1)))
+        smoothed = np.fft.irfft(np.fft.rfft(binned, size) * np.fft.rfft(kernel, size), size)
+        smoothed = smoothed[reach:reach + kde_gridsize]
+
+        support = np.linspace(low, high, gridsize)
+        grid = np.linspace(low, high, kde_gridsize)
+        density = np.interp(support, grid, smoothed) * (heights * np.diff(edges)).sum()
+        return edges, heights, support, density
+
+    @traced(rows=lambda self, *args, **kwargs: len(self.data))
+    def generate_year_line(self):
+        """
+        Generate a line graph of Trends of sighting.
+        """
+        return self.generate_dashboard_chart('year_line')
+
+    @traced(rows=lambda self, *args, **kwargs: len(self.data))
+    def generate_top_cities_bar_chart(self):
+        """
+        Generate a bar chart for the top 5 cities with the most reports.
+        """
+        return self.generate_dashboard_chart('top_cities_bar_chart')
+
+    @traced(rows=lambda self, *args, **kwargs: len(self.data))
     def generate_pie_chart_ufo_shape(self):
         """
         Generate a pie chart for UFO shapes.
         :return: The figure and axis objects.
         """
-        def autopct_more_than_4(pct):
-            return ('%1.f%%' % pct) if pct > 4 else ''
-
-        count = self.data['UFO_shape'].value_counts()
-        percentages = 100 * count / count.sum()  # Calculate percentages
-        labels_with_percentage = [f'{label} ({percentage:.0f}%)'
-                                  for label, percentage in zip(count.index, percentages)]
-
-        fig, ax = plt.subplots(figsize=(8.5, 3), tight_layout=True)
-        with sns.axes_style('whitegrid'):
-            wedges, _, autotexts = ax.pie(count, autopct=autopct_more_than_4, startangle=90)
-            plt.legend(wedges, labels_with_percentage, loc='center right',
-                       bbox_to_anchor=(2.2, 0.5), ncol=2)
-            ax.set_title('')
-        return fig, ax
+        return self.generate_dashboard_chart('pie_chart_ufo_shape')
 
-    def generate_correlation_graph(self):
+    @traced(rows=lambda self, *args, **kwargs: len(self.data))
+    def generate_correlation_graph(self, ci_mode: str = 'analytic', sample_size: int = None, seed: int = 0):
         """
         Generate a correlation graph for length_of_encounter_seconds and distance_to_nearest_airport_km.
+
+        :param ci_mode: 'analytic' for a closed-form OLS 95% confidence band computed once per data
+            version, or 'bootstrap' for seaborn's bootstrapped band.
+        :param sample_size: Fit and draw a random sample of at most this many rows (default is all rows).
+        :param seed: Seed for the random sample.
+        :return: The figure and axis objects.
         """
+        x_column, y_column = 'distance_to_nearest_airport_km', 'length_of_encounter_seconds'
         fig, ax = plt.subplots()
-        sns.regplot(data=self.data, x="distance_to_nearest_airport_km", y="length_of_encounter_seconds",
-                    line_kws=dict(color="orange"))
+        if ci_mode == 'bootstrap':
+            data = self.data
+            if sample_size is not None and len(data) > sample_size:
+                data = data.sample(n=sample_size, random_state=seed)
+            if data[[x_column, y_column]].dropna().empty:
+                self.draw_no_reports(ax)
+            else:
+                sns.regplot(data=data, x=x_column, y=y_column, line_kws=dict(color="orange"), seed=seed)
+        else:
+            fit = self.data_processor.get_cached(
+                ('regression', x_column, y_column, sample_size, seed) + self.data_key,
+                lambda: self.compute_regression(self.data[x_column], self.data[y_column], sample_size, seed),
+                self.data_version, scope=self.scope)
+            if len(fit['x']):
+                self.draw_regression(ax, fit, color='orange')
+            else:
+                self.draw_no_reports(ax)
 
         ax.set_title('')
         ax.set_xlabel('Length of Encounter (seconds)')
         ax.set_ylabel('Distance to the nearest Airport (kilometer)')
         return fig, ax
 
+    @staticmethod
+    @traced(rows=lambda x_values, *args, **kwargs: len(x_values))
+    def compute_regression(x_values, y_values, sample_size: int = None, seed: int = 0,
+                           gridsize: int = 100) -> dict:
+        """
+        Fit an ordinary least squares line with a closed-form 95% confidence band.
+
+        :param x_values: Values of the independent variable.
+        :param y_values: Values of the dependent variable.
+        :param sample_size: Fit on a random sample of at most this many rows (default is all rows).
+        :param seed: Seed for the random sample.
+        :param gridsize: Number of points the line and the band are evaluated at.
+        :return: The fitted points, slope, intercept, and the grid, line and band arrays. Without points the
+            arrays are empty.
+        :rtype: dict
+        """
+        points = pd.DataFrame({'x': x_values, 'y': y_values}).dropna()
+        if sample_size is not None and len(points) > sample_size:
+            rng = np.random.default_rng(seed)
+            points = points.iloc[np.sort(rng.choice(len(points), size=sample_size, replace=False))]
+        x = points['x'].to_numpy(dtype=float)
+        y = points['y'].to_numpy(dtype=float)
+        count = len(x)
+        if count == 0:
+            return {'x': x, 'y': y, 'slope': 0.0, 'intercept': 0.0,
+                    'grid': np.empty(0), 'line': np.empty(0), 'band': None}
+        x_mean, y_mean = x.mean(), y.mean()
+        sxx = ((x - x_mean) ** 2).sum()
+        slope = ((x - x_mean) * (y - y_mean)).sum() / sxx if sxx > 0 else 0.0
+        intercept = y_mean - slope * x_mean
+
+        grid = np.linspace(x.min(), x.max(), gridsize)
+        line = intercept + slope * grid
+        band = None
+        if count > 2 and sxx > 0:
+            residual = y - (intercept + slope * x)
+            scale = np.sqrt((residual ** 2).sum() / (count - 2))
+            error = scale * np.sqrt(1 / count + (grid - x_mean) ** 2 / sxx)
+            margin = GraphGenerator.t_quantile(0.975, count - 2) * error
+            band = (line - margin, line + margin)
+        return {'x': x, 'y': y, 'slope': slope, 'intercept': intercept,
+                'grid': grid, 'line': line, 'band': band}
+
+    @staticmethod
+    def draw_regression(ax, fit: dict, color):
+        """
+        Draw a precomputed regression the way ``sns.regplot`` does.
+
+        :param ax: The axis to draw on.
+        :param fit: The result of compute_regression.
+        :param color: The color of the line and the confidence band.
+        """
+        cycle, = ax.plot([], [])
+        scatter_color = cycle.get_color()
+        cycle.remove()
+        ax.scatter(fit['x'], fit['y'], color=scatter_color, alpha=.8,
+                   linewidths=plt.rcParams['lines.markeredgewidth'])
+        ax.plot(fit['grid'], fit['line'], color=color, linewidth=plt.rcParams['lines.linewidth'] * 1.5)
+        if fit['band'] is not None:
+            ax.fill_between(fit['grid'], *fit['band'], facecolor=color, alpha=.15)
+
+    @staticmethod
+    def t_quantile(probability: float, dof: int) -> float:
+        """
+        Approximate a quantile of Student's t distribution without scipy.
+
+        Uses the normal quantile with a Cornish-Fisher expansion in 1/dof.
+
+        :param probability: The probability, e.g. 0.975.
+        :param dof: Degrees of freedom.
+        :return: The approximate quantile.
+        :rtype: float
+        """
+        z = NormalDist().inv_cdf(probability)
+        return (z + (z ** 3 + z) / (4 * dof) + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * dof ** 2) +
+                (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / (384 * dof ** 3))
+
     @staticmethod
     def remove_all_outliers(data):
         """
-        Remove outliers from the data.
+        Remove outliers from the data with Tukey's fences (see OutlierFilter).
 
         :param data: The DataFrame containing the data.
         :return: DataFrame without outliers.
         """
-        for column in data.select_dtypes(include='number').columns:
-            q1 = data[column].quantile(0.25)
-            q3 = data[column].quantile(0.75)
-            iqr = q3 - q1
-
-            lower_bound = q1 - 1.5 * iqr
-            upper_bound = q3 + 1.5 * iqr
-
-            data = data[(data[column] >= lower_bound) & (data[column] <= upper_bound)]
-        return data
+        return OutlierFilter('iqr').clean(data)
@@ -0,0 +1,317 @@
+from collections import OrderedDict
+import numpy as np
+from matplotlib import colormaps
+from PIL import Image, ImageTk
+from instrumentation import traced
+
+
+class HeatmapRenderer:
+    """
+    A class to render the density of sightings as a semi-transparent raster in map pixels.
+
+    Points are projected once to Web Mercator, the projection of the map tiles, and sorted by x. A raster
+    covers a region of the map at one zoom level: the sightings in the region are binned with histogram2d
+    into cells a few screen pixels wide, colored on a log scale and scaled up to the size of the region.
+    The work per raster is bounded by the number of cells and the points inside the region, not by the
+    number of sightings.
+    """
+    def __init__(self, latitudes, longitudes, tile_size: int = 256, cell_pixels: int = 8,
+                 max_raster_pixels: int = 2048, opacity: float = 0.7, colormap: str = 'inferno'):
+        """
+        Initialize the HeatmapRenderer.
+
+        :param latitudes: Latitudes of the sightings in degrees.
+        :param longitudes: Longitudes of the sightings in degrees.
+        :param tile_size: Size of a map tile in pixels.
+        :param cell_pixels: Width of a grid cell in screen pixels.
+        :param max_raster_pixels: Largest width or height of a raster. Regions are limited to this size.
+        :param opacity: Opacity of the densest cells; empty cells are transparent.
+        :param colormap: Name of the matplotlib colormap.
+        """
+        latitudes = np.asarray(latitudes, dtype=float)
+        longitudes = np.asarray(longitudes, dtype=float)
+        valid = np.isfinite(latitudes) & np.isfinite(longitudes) & (np.abs(latitudes) < 85.05)
+        x, y = self.project(latitudes[valid], longitudes[valid])
+        order = np.argsort(x, kind='stable')
+        self.x, self.y = x[order], y[order]
+        self.y_range = (self.y.min(), self.y.max()) if len(self.y) else (0.0, 0.0)
+        self.tile_size = tile_size
+        self.cell_pixels = cell_pixels
+        self.max_raster_pixels = max_raster_pixels
+        self.opacity = opacity
+        self.colors = colormaps[colormap](np.linspace(0.15, 1.0, 256), bytes=True)
+
+    def __len__(self) -> int:
+        return len(self.x)
+
+    def add(self, latitudes, longitudes) -> tuple:
+        """
+        Add sightings, keeping the points sorted by x.
+
+        :param latitudes: Latitudes of the sightings in degrees.
+        :param longitudes: Longitudes of the sightings in degrees.
+        :return: The x and y coordinates of the added sightings that have a valid position.
+        :rtype: tuple
+        """
+        latitudes = np.atleast_1d(np.asarray(latitudes, dtype=float))
+        longitudes = np.atleast_1d(np.asarray(longitudes, dtype=float))
+        valid = np.isfinite(latitudes) & np.isfinite(longitudes) & (np.abs(latitudes) < 85.05)
+        x, y = self.project(latitudes[valid], longitudes[valid])
+        order = np.argsort(x, kind='stable')
+        x, y = x[order], y[order]
+        if len(x):
+            positions = np.searchsorted(self.x, x, side='right')
+            self.x, self.y = np.insert(self.x, positions, x), np.insert(self.y, positions, y)
+            self.y_range = (self.y.min(), self.y.max())
+        return x, y
+
+    @staticmethod
+    def project(latitudes: np.ndarray, longitudes: np.ndarray) -> tuple:
+        """
+        Project positions to Web Mercator coordinates between 0 and 1, x to the east and y to the south.
+
+        :return: The x and y coordinates.
+        :rtype: tuple
+        """
+        lat_rad = np.radians(latitudes)
+        x = (longitudes + 180.0) / 360.0
+        y = (1.0 - np.log(np.tan(lat_rad) + 1 / np.cos(lat_rad)) / np.pi) / 2.0
+        return x, y
+
+    def scale(self, zoom: int) -> float:
+        """
+        Get the width of the world in map pixels at a zoom level.
+        """
+        return self.tile_size * 2.0 ** zoom
+
+    def extent(self, zoom: int) -> tuple:
+        """
+        Get the region holding all sightings at a zoom level, padded by one cell.
+
+        :return: (left, top, right, bottom) in map pixels, snapped to the cell grid.
+        :rtype: tuple
+        """
+        if not len(self):
+            return 0, 0, 0, 0
+        scale, cell = self.scale(zoom), self.cell_pixels
+        return (int(np.floor(self.x[0] * scale / cell) - 1) * cell,
+                int(np.floor(self.y_range[0] * scale / cell) - 1) * cell,
+                int(np.ceil(self.x[-1] * scale / cell) + 1) * cell,
+                int(np.ceil(self.y_range[1] * scale / cell) + 1) * cell)
+
+    def region_for(self, zoom: int, viewport: tuple) -> tuple:
+        """
+        Choose the region to render for a viewport. If all sightings fit in one raster the region holds all
+        of them, so one raster serves every view at the zoom level. Otherwise it is the viewport with a
+        margin on every side, clipped to the sightings, so small pans reuse the raster.
+
+        :param zoom: The zoom level.
+        :param viewport: (left, top, right, bottom) of the visible map in map pixels.
+        :return: (left, top, right, bottom) in map pixels, snapped to the cell grid.
+        :rtype: tuple
+        """
+        left, top, right, bottom = self.extent(zoom)
+        if right - left <= self.max_raster_pixels and bottom - top <= self.max_raster_pixels:
+            return left, top, right, bottom
+        cell = self.cell_pixels
+        view_left, view_top, view_right, view_bottom = viewport
+        margin_x = min(view_right - view_left, (self.max_raster_pixels - (view_right - view_left)) // 2)
+        margin_y = min(view_bottom - view_top, (self.max_raster_pixels - (view_bottom - view_top)) // 2)
+        return (max(left, int(view_left - max(margin_x, 0)) // cell * cell),
+                max(top, int(view_top - max(margin_y, 0)) // cell * cell),
+                min(right, -(-int(view_right + max(margin_x, 0)) // cell) * cell),
+                min(bottom, -(-int(view_bottom + max(margin_y, 0)) // cell) * cell))
+
+    @traced(rows=lambda self, *args, **kwargs: len(self))
+    def render(self, zoom: int, region: tuple) -> Image.Image:
+        """
+        Render the density of the sightings in a region.
+
+        :param zoom: The zoom level.
+        :param region: (left, top, right, bottom) in map pixels, on the cell grid.
+        :return: An RGBA image of the size of the region, or None if the region holds no sighting.
+        :rtype: PIL.Image.Image
+        """
+        left, top, right, bottom = region
+        if right <= left or bottom <= top:
+            return None
+        scale, cell = self.scale(zoom), self.cell_pixels
+        start, stop = np.searchsorted(self.x, [left / scale, right / scale])
+        y = self.y[start:stop]
+        inside = (y >= top / scale) & (y < bottom / scale)
+        if not inside.any():
+            return None
+        columns, rows = (right - left) // cell, (bottom - top) // cell
+        counts, _, _ = np.histogram2d(y[inside] * scale, self.x[start:stop][inside] * scale, bins=(rows, columns),
+                                      range=((top, bottom), (left, right)))
+        counts = self.smooth(counts)
+        level = np.log1p(counts) / np.log1p(counts.max())
+        rgba = self.colors[np.minimum((level * 255).astype(np.intp), 255)]
+        rgba[..., 3] = np.where(counts > 0.05, (255 * self.opacity * (0.3 + 0.7 * level)).astype(np.uint8), 0)
+        # Scaling the small grid up is what keeps the cost independent of the number of sightings
+        return Image.fromarray(rgba, 'RGBA').resize((right - left, bottom - top), Image.BILINEAR)
+
+    @staticmethod
+    def smooth(counts: np.ndarray) -> np.ndarray:
+        """
+        Spread the counts to the neighbouring cells with a 3x3 binomial kernel, so isolated sightings show
+        as soft spots.
+        """
+        padded = np.pad(counts, 1)
+        rows = padded[:-2] * 0.25 + padded[1:-1] * 0.5 + padded[2:] * 0.25
+        return rows[:, :-2] * 0.25 + rows[:, 1:-1] * 0.5 + rows[:, 2:] * 0.25
+
+
+class HeatmapLayer:
+    """
+    A class to show a HeatmapRenderer raster on a TkinterMapView.
+
+    The raster is a single image item on the map canvas, moved along when the map is panned. The map has
+    no event for pans and zooms, so the view is polled while the layer is shown. Rendered rasters are kept
+    per zoom level and region until the sightings change.
+    """
+    def __init__(self, map_view, poll_interval: int = 100, cache_size: int = 24, **kwargs):
+        """
+        Initialize the HeatmapLayer.
+
+        :param map_view: The TkinterMapView to draw on.
+        :param poll_interval: Milliseconds between checks of the view.
+        :param cache_size: Number of rasters kept.
+        :param kwargs: Passed on to HeatmapRenderer.
+        """
+        self.map_view = map_view
+        self.poll_interval = poll_interval
+        self.cache_size = cache_size
+        self.options = kwargs
+        self.renderer = None
+        self.cache = OrderedDict()
+        self.item = None
+        self.shown = None
+        self.view = None
+        self.polling = None
+
+    def set_points(self, latitudes, longitudes):
+        """
+        Show the density of these sightings, dropping the rasters of the previous ones.
+
+        :param latitudes: Latitudes of the sightings in degrees.
+        :param longitudes: Longitudes of the sightings in degrees.
+        """
+        self.renderer = HeatmapRenderer(latitudes, longitudes, tile_size=self.map_view.tile_size, **self.options)
+        self.cache.clear()
+        self.view = None
+
+    def add_points(self, latitudes, longitudes):
+        """
+        Add sightings to the heatmap. Only the cached rasters the new sightings fall in are rendered again.
+
+        :param latitudes: Latitudes of the sightings in degrees.
+        :param longitudes: Longitudes of the sightings in degrees.
+        """
+        if self.renderer is None:
+            self.set_points(latitudes, longitudes)
+            return
+        x, y = self.renderer.add(latitudes, longitudes)
+        if not len(x):
+            return
+        for key in list(self.cache):
+            zoom, (left, top, right, bottom) = key
+            scale, margin = self.renderer.scale(zoom), self.renderer.cell_pixels
+            # Smoothing spreads a sighting to the neighbouring cells
+            if np.any((x * scale >= left - margin) & (x * scale < right + margin) &
+                      (y * scale >= top - margin) & (y * scale < bottom + margin)):
+                del self.cache[key]
+        self.view = None
+
+    def show(self):
+        """
+        Draw the raster and follow the view of the map until hide is called.
+        """
+        if self.polling is None:
+            self.refresh()
+
+    def viewport(self) -> tuple:
+        """
+        Get the zoom level used by the map tiles and the visible part of the map in map pixels.
+        """
+        tile_size = self.map_view.tile_size
+        upper_left, lower_right = self.map_view.upper_left_tile_pos, self.map_view.lower_right_tile_pos
+        return round(self.map_view.zoom), (upper_left[0] * tile_size, upper_left[1] * tile_size,
+                                           lower_right[0] * tile_size, lower_right[1] * tile_size)
+
+    def raster(self, zoom: int, viewport: tuple) -> tuple:
+        """
+        Get the raster for a view from the cache, rendering it if no cached raster covers the view.
+
+        :return: The region of the raster and its PhotoImage (None if there is nothing to show).
+        :rtype: tuple
+        """
+        # Only the part of the view holding sightings has to be covered
+        extent = self.renderer.extent(zoom)
+        left, top = max(viewport[0], extent[0]), max(viewport[1], extent[1])
+        right, bottom = min(viewport[2], extent[2]), min(viewport[3], extent[3])
+        if right <= left or bottom <= top:
+            return None, None
+        for key, photo in reversed(self.cache.items()):
+            cached_zoom, region = key
+            if (cached_zoom == zoom and region[0] <= left and region[1] <= top and
+                    region[2] >= right and region[3] >= bottom):
+                self.cache.move_to_end(key)
+                return region, photo
+        region = self.renderer.region_for(zoom, viewport)
+        image = self.renderer.render(zoom, region)
+        photo = ImageTk.PhotoImage(image, master=self.map_view.canvas) if image is not None else None
+        self.cache[(zoom, region)] = photo
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return region, photo
+
+    def refresh(self):
+        """
+        Redraw the raster if the view changed, and check again after poll_interval.
+        """
+        self.polling = None
+        if self.renderer is None:
+            return
+        zoom, viewport = self.viewport()
+        if (zoom, viewport) != self.view:
+            self.view = (zoom, viewport)
+            self.draw(zoom, viewport)
+        self.polling = self.map_view.after(self.poll_interval, self.refresh)
+
+    def draw(self, zoom: int, viewport: tuple):
+        """
+        Place the raster covering the view on the map canvas.
+        """
+        region, photo = self.raster(zoom, viewport)
+        canvas = self.map_view.canvas
+        if photo is None:
+            if self.item is not None:
+                canvas.delete(self.item)
+                self.item, self.shown = None, None
+            return
+        view_left, view_top, view_right, view_bottom = viewport
+        x = (region[0] - view_left) / (view_right - view_left) * self.map_view.width
+        y = (region[1] - view_top) / (view_bottom - view_top) * self.map_view.height
+        if self.item is None:
+            self.item = canvas.create_image(x, y, image=photo, anchor='nw', tag='heatmap')
+        else:
+            canvas.coords(self.item, x, y)
+            if self.shown is not photo:
+                canvas.itemconfigure(self.item, image=photo)
+        self.shown = photo
+        # New tiles are created on top of the raster when the map moves
+        canvas.tag_raise(self.item)
+        self.map_view.manage_z_order()
+
+    def hide(self):
+        """
+        Remove the raster from the map and stop following the view. The cached rasters are kept.
+        """
+        if self.polling is not None:
+            self.map_view.after_cancel(self.polling)
+            self.polling = None
+        if self.item is not None:
+            self.map_view.canvas.delete(self.item)
+            self.item, self.shown = None, None
+        self.view = None
@@ -0,0 +1,166 @@
+"""
+Opt-in timing instrumentation for the hot paths of UFORadarSEA.
+
+Set the UFORADAR_TRACE environment variable to a file name before starting the application to record
+spans. On exit the spans are written to that file as Chrome trace-event JSON (open it in chrome://tracing
+or https://ui.perfetto.dev) and a summary table is printed. When UFORADAR_TRACE is not set, ``traced``
+returns the decorated function unchanged and ``span`` returns a shared no-op context manager.
+
+    UFORADAR_TRACE=trace.json python main.py
+"""
+import atexit
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+TRACE_FILE = os.environ.get('UFORADAR_TRACE', '')
+ENABLED = bool(TRACE_FILE)
+
+
+class Span:
+    """
+    A timed section of code.
+    """
+    def __init__(self, tracer, name: str, rows: int = None):
+        """
+        Initialize the Span.
+
+        :param tracer: The Tracer recording the span.
+        :param name: The name of the span.
+        :param rows: Number of rows processed, if known up front.
+        """
+        self.tracer = tracer
+        self.name = name
+        self.rows = rows
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.tracer.record(self.name, self.start, time.perf_counter(), self.rows)
+        return False
+
+
+class Tracer:
+    """
+    A class to collect spans and export them.
+    """
+    def __init__(self):
+        """
+        Initialize the Tracer.
+        """
+        self.origin = time.perf_counter()
+        self.events = []
+        self.stats = {}
+        self.lock = threading.Lock()
+
+    def record(self, name: str, start: float, end: float, rows: int = None):
+        """
+        Record a finished span.
+
+        :param name: The name of the span.
+        :param start: Start time from time.perf_counter.
+        :param end: End time from time.perf_counter.
+        :param rows: Number of rows processed, if known.
+        """
+        event = {'name': name, 'cat': name.split('.')[0], 'ph': 'X', 'pid': os.getpid(),
+                 'tid': threading.get_ident(), 'ts': (start - self.origin) * 1e6, 'dur': (end - start) * 1e6}
+        if rows is not None:
+            event['args'] = {'rows': rows}
+        with self.lock:
+            self.events.append(event)
+            calls, total, longest, row_count = self.stats.get(name, (0, 0.0, 0.0, 0))
+            self.stats[name] = (calls + 1, total + end - start, max(longest, end - start), row_count + (rows or 0))
+
+    def export_chrome_trace(self, path: str):
+        """
+        Write the recorded spans as Chrome trace-event JSON.
+
+        :param path: Path of the JSON file.
+        """
+        with self.lock:
+            events = list(self.events)
+        with open(path, 'w') as file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file)
+
+    def summary(self) -> str:
+        """
+        Build a table of call counts, wall times and rows processed per span, slowest first.
+
+        :return: The summary table.
+        :rtype: str
+        """
+        with self.lock:
+            stats = sorted(self.stats.items(), key=lambda item: item[1][1], reverse=True)
+        lines = [f"{'span':<50} {'calls':>7} {'total ms':>11} {'mean ms':>10} {'max ms':>10} {'rows':>12}"]
+        for name, (calls, total, longest, rows) in stats:
+            lines.append(f'{name:<50} {calls:>7} {total * 1000:>11.2f} {total * 1000 / calls:>10.2f} '
+                         f'{longest * 1000:>10.2f} {rows:>12,}')
+        return '\n'.join(lines)
+
+    def write_report(self):
+        """
+        Export the trace to TRACE_FILE and print the summary table.
+        """
+        self.export_chrome_trace(TRACE_FILE)
+        print(self.summary())
+        print(f'Trace written to {TRACE_FILE}')
+
+
+TRACER = Tracer()
+_NO_SPAN = contextlib.nullcontext()
+if ENABLED:
+    atexit.register(TRACER.write_report)
+
+
+def span(name: str, rows: int = None):
+    """
+    Time a block of code.
+
+        with span('FigureCanvasTkAgg.draw'):
+            canvas.draw()
+
+    :param name: The name of the span.
+    :param rows: Number of rows processed, if known.
+    :return: A context manager recording the span, or a no-op one when tracing is disabled.
+    """
+    if not ENABLED:
+        return _NO_SPAN
+    return Span(TRACER, name, rows)
+
+
+def traced(name: str = None, rows=None):
+    """
+    Decorate a function so that every call is recorded as a span.
+
+    :param name: The name of the span (default is the function's qualified name).
+    :param rows: A function taking the same arguments as the decorated function and returning
+        the number of rows processed. It is called after the decorated function returns.
+    :return: The decorator. When tracing is disabled it returns the function unchanged.
+    """
+    def decorate(function):
+        if not ENABLED:
+            return function
+        span_name = name or function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                end = time.perf_counter()
+                row_count = None
+                if rows is not None:
+                    try:
+                        row_count = rows(*args, **kwargs)
+                    except Exception:
+                        row_count = None
+                TRACER.record(span_name, start, end, row_count)
+        return wrapper
+    return decorate
@@ -0,0 +1,138 @@
+import numpy as np
+import pandas as pd
+from instrumentation import traced
+
+
+class OutlierFilter:
+    """
+    A class to keep the reports whose numerical values are not outliers.
+
+    A strategy fits lower and upper bounds per numerical column, and a report is kept if every value is
+    within the bounds of its column. The kept reports are held as a boolean mask over the reports. Appended
+    reports are checked against the fitted bounds, so keeping the mask up to date costs only the new rows.
+    Once the appended reports make up more than refit_fraction of the reports the bounds were fitted on, the
+    bounds are fitted again on all reports.
+
+    Strategies:
+        'iqr': Tukey's fences at 1.5 times the interquartile range, fitted one column after the other on
+            the reports kept so far.
+        'zscore': Within 3 standard deviations of the mean of each column.
+        'none': Keep every report.
+    """
+    STRATEGIES = ('iqr', 'zscore', 'none')
+
+    def __init__(self, strategy: str = 'iqr', refit_fraction: float = 0.01):
+        """
+        Initialize the OutlierFilter.
+
+        :param strategy: One of STRATEGIES.
+        :param refit_fraction: Fraction of appended reports after which the bounds are fitted again.
+        """
+        if strategy not in self.STRATEGIES:
+            raise ValueError(f"Unknown outlier strategy '{strategy}', use one of {', '.join(self.STRATEGIES)}")
+        self.strategy = strategy
+        self.refit_fraction = refit_fraction
+        self.bounds = None
+        self.mask = None
+        self.fitted_rows = 0
+        self.appended = 0
+
+    @traced(rows=lambda self, data: len(data))
+    def fit(self, data: pd.DataFrame):
+        """
+        Fit the bounds on the reports and mark the reports to keep.
+
+        :param data: DataFrame containing UFO sighting data.
+        """
+        fit_bounds = {'iqr': self.iqr_bounds, 'zscore': self.zscore_bounds, 'none': lambda _: {}}[self.strategy]
+        self.bounds = fit_bounds(data)
+        self.mask = self.within(data)
+        self.fitted_rows = len(data)
+        self.appended = 0
+
+    def within(self, data: pd.DataFrame) -> np.ndarray:
+        """
+        Check which reports are within the fitted bounds.
+
+        :param data: DataFrame containing UFO sighting data.
+        :return: True for the reports to keep.
+        :rtype: numpy.ndarray
+        """
+        mask = np.ones(len(data), dtype=bool)
+        for column, (lower_bound, upper_bound) in self.bounds.items():
+            values = pd.to_numeric(data[column], errors='coerce').to_numpy(dtype=float)
+            mask &= (values >= lower_bound) & (values <= upper_bound)
+        return mask
+
+    def extend(self, reports: pd.DataFrame):
+        """
+        Mark which of the reports appended to the fitted reports to keep. Does nothing before fit.
+
+        :param reports: The appended reports.
+        """
+        if self.mask is None:
+            return
+        self.mask = np.concatenate([self.mask, self.within(reports)])
+        self.appended += len(reports)
+
+    def mask_for(self, data: pd.DataFrame) -> np.ndarray:
+        """
+        Get the reports to keep, fitting the bounds first if they were not fitted on these reports yet or too
+        many reports were appended since.
+
+        :param data: DataFrame containing UFO sighting data, the fitted reports followed by the appended ones.
+        :return: True for the reports to keep.
+        :rtype: numpy.ndarray
+        """
+        if self.stale(len(data)):
+            self.fit(data)
+        return self.mask
+
+    def stale(self, rows: int) -> bool:
+        """
+        Check whether the bounds have to be fitted before the mask can be used for this many reports.
+        """
+        return (self.mask is None or len(self.mask) != rows or
+                self.appended > self.refit_fraction * max(self.fitted_rows, 1))
+
+    def clean(self, data: pd.DataFrame) -> pd.DataFrame:
+        """
+        Fit the bounds on the reports and remove the outliers.
+
+        :param data: DataFrame containing UFO sighting data.
+        :return: DataFrame without outliers.
+        :rtype: pandas.DataFrame
+        """
+        self.fit(data)
+        return data[self.mask]
+
+    @staticmethod
+    def iqr_bounds(data: pd.DataFrame) -> dict:
+        """
+        Fit Tukey's fences per numerical column. Each column is fitted on the reports within the fences of
+        the columns before it.
+
+        :return: (lower bound, upper bound) per column.
+        :rtype: dict
+        """
+        bounds = {}
+        for column in data.select_dtypes(include='number').columns:
+            q1 = data[column].quantile(0.25)
+            q3 = data[column].quantile(0.75)
+            iqr = q3 - q1
+            bounds[column] = (q1 - 1.5 * iqr, q3 + 1.5 * iqr)
+            data = data[(data[column] >= bounds[column][0]) & (data[column] <= bounds[column][1])]
+        return bounds
+
+    @staticmethod
+    def zscore_bounds(data: pd.DataFrame, threshold: float = 3.0) -> dict:
+        """
+        Fit bounds at threshold standard deviations around the mean of every numerical column.
+
+        :return: (lower bound, upper bound) per column.
+        :rtype: dict
+        """
+        numbers = data.select_dtypes(include='number')
+        means, deviations = numbers.mean(), numbers.std().fillna(0)
+        return {column: (means[column] - threshold * deviations[column],
+                         means[column] + threshold * deviations[column]) for column in numbers.columns}
@@ -0,0 +1,111 @@
+import tkinter as tk
+from instrumentation import span
+
+
+class PageManager:
+    """
+    A class to keep one instance of every page of an application and show one page at a time.
+
+    Pages are created on their first visit and shown again on later visits. A page may define these
+    methods, which are called when present:
+        enter(): Called every time the page is shown, e.g. to reset a form or redraw stale data.
+        leave(): Called every time the page is hidden, e.g. to stop work that only matters on screen.
+        release(): Called once the page has been hidden for its idle time, to free heavy resources while
+            keeping the page. Pages without it are destroyed instead and created again on the next visit.
+    """
+    def __init__(self, root: tk.Misc, idle_release_ms: int = 120000):
+        """
+        Initialize the PageManager.
+
+        :param root: The widget whose after is used to schedule releases.
+        :param idle_release_ms: Default milliseconds a page stays hidden before it is released, or None to
+            keep pages forever.
+        """
+        self.root = root
+        self.idle_release_ms = idle_release_ms
+        self.factories = {}
+        self.release_after = {}
+        self.pages = {}
+        self.timers = {}
+        self.current = None
+
+    def register(self, name: str, factory, idle_release_ms: int = -1):
+        """
+        Register a page.
+
+        :param name: The name of the page.
+        :param factory: A function without arguments that creates the page.
+        :param idle_release_ms: Milliseconds the page stays hidden before it is released, None to keep it
+            forever (default is the idle_release_ms of the manager).
+        """
+        self.factories[name] = factory
+        self.release_after[name] = self.idle_release_ms if idle_release_ms == -1 else idle_release_ms
+
+    def page(self, name: str) -> tk.Misc:
+        """
+        Get a page, creating it if it does not exist.
+
+        :param name: The name of the page.
+        :return: The page.
+        """
+        if name not in self.pages:
+            with span(f'PageManager.create.{name}'):
+                self.pages[name] = self.factories[name]()
+        return self.pages[name]
+
+    def show(self, name: str) -> tk.Misc:
+        """
+        Hide the current page and show another one.
+
+        :param name: The name of the page.
+        :return: The page.
+        """
+        if self.current is not None and self.current != name:
+            self.hide()
+        page = self.page(name)
+        timer = self.timers.pop(name, None)
+        if timer is not None:
+            self.root.after_cancel(timer)
+        page.pack(expand=True, fill=tk.BOTH)
+        if hasattr(page, 'enter'):
+            page.enter()
+        self.current = name
+        return page
+
+    def hide(self):
+        """
+        Hide the current page and schedule its release.
+        """
+        name, self.current = self.current, None
+        if name is None or name not in self.pages:
+            return
+        page = self.pages[name]
+        page.pack_forget()
+        if hasattr(page, 'leave'):
+            page.leave()
+        if self.release_after[name] is not None:
+            self.timers[name] = self.root.after(self.release_after[name], self.release, name)
+
+    def release(self, name: str):
+        """
+        Free the resources of a hidden page, destroying it if it has no release method.
+
+        :param name: The name of the page.
+        """
+        self.timers.pop(name, None)
+        page = self.pages.get(name)
+        if page is None or name == self.current:
+            return
+        if hasattr(page, 'release'):
+            page.release()
+        else:
+            del self.pages[name]
+            page.destroy()
+
+    def close(self):
+        """
+        Cancel the scheduled releases.
+        """
+        for timer in self.timers.values():
+            self.root.after_cancel(timer)
+        self.timers = {}
@@ -0,0 +1,221 @@
+"""
+Recompute distance_to_nearest_airport_km for every report after the airport data changes.
+
+The reports are split into chunks that are processed by a pool of worker processes, each running the
+vectorized nearest-airport search. A summary of the changed distances is printed and the reports file is
+replaced atomically: the new data is written to a temporary file next to it which is then renamed over it,
+so the file is never left half written. The file is replaced under an exclusive lock on
+'<reports file>.lock', so reports appended by the running application in the meantime are not lost.
+
+Usage:
+    python recompute_distances.py
+    python recompute_distances.py --reports data/nuforc_data.csv --airports data/gadb_country_declatlon.csv --dry-run
+"""
+import argparse
+import io
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from airport_store import AirportStore
+from data_processor import UFODataProcessor
+from file_lock import FileLock
+
+DISTANCE_COLUMN = 'distance_to_nearest_airport_km'
+_airports = None
+
+
+def load_airports(airports_file: str):
+    """
+    Memory-map the airport store once in each worker process. The workers share its pages.
+
+    :param airports_file: Path to the airports CSV file.
+    """
+    global _airports
+    _airports = AirportStore.open(airports_file)
+
+
+def chunk_distances(latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+    """
+    Compute the distances to the nearest airport for one chunk of reports in a worker process.
+    """
+    return UFODataProcessor.airport_distances(_airports, latitudes, longitudes)
+
+
+def compute_distances(latitudes: np.ndarray, longitudes: np.ndarray, airports_file: str, workers: int = None,
+                      chunk_size: int = 100000) -> np.ndarray:
+    """
+    Compute the distances to the nearest airport for all reports, chunk by chunk in a process pool.
+
+    :param latitudes: Latitudes of the reports in degrees.
+    :param longitudes: Longitudes of the reports in degrees.
+    :param airports_file: Path to the airports CSV file.
+    :param workers: Number of worker processes (default is the number of CPUs).
+    :param chunk_size: Number of reports per chunk.
+    :return: Distances in kilometers.
+    :rtype: numpy.ndarray
+    """
+    starts = range(0, len(latitudes), chunk_size)
+    if len(starts) <= 1 or workers == 1:
+        load_airports(airports_file)
+        return np.concatenate([chunk_distances(latitudes[start:start + chunk_size],
+                                               longitudes[start:start + chunk_size])
+                               for start in starts]) if len(starts) else np.array([], dtype=float)
+    with ProcessPoolExecutor(max_workers=workers, initializer=load_airports, initargs=(airports_file,)) as pool:
+        chunks = pool.map(chunk_distances, [latitudes[start:start + chunk_size] for start in starts],
+                          [longitudes[start:start + chunk_size] for start in starts])
+        return np.concatenate(list(chunks))
+
+
+def summarize(reports: pd.DataFrame, old: np.ndarray, new: np.ndarray, tolerance: float, top: int = 10) -> dict:
+    """
+    Summarize how the distances changed.
+
+    :param reports: DataFrame containing UFO sighting data.
+    :param old: The stored distances.
+    :param new: The recomputed distances.
+    :param tolerance: Changes up to this many kilometers are ignored.
+    :param top: Number of largest changes listed.
+    :return: Counts of changed, filled in and unchanged distances, statistics of the changes and the largest changes.
+    :rtype: dict
+    """
+    change = new - old
+    filled = np.isnan(old) & ~np.isnan(new)
+    changed = ~np.isnan(old) & (np.abs(change) > tolerance)
+    moved = np.abs(change[changed])
+    largest = np.flatnonzero(changed)[np.argsort(-moved, kind='stable')[:top]]
+    return {
+        'reports': len(old),
+        'changed': int(changed.sum()),
+        'filled_in': int(filled.sum()),
+        'unchanged': int(len(old) - changed.sum() - filled.sum()),
+        'closer': int((change[changed] < 0).sum()),
+        'farther': int((change[changed] > 0).sum()),
+        'mean_abs_change_km': float(moved.mean()) if len(moved) else 0.0,
+        'max_abs_change_km': float(moved.max()) if len(moved) else 0.0,
+        'largest': [(int(reports['report_no'].iloc[i]), float(old[i]), float(new[i])) for i in largest],
+    }
+
+
+def write_atomically(reports: pd.DataFrame, path: str):
+    """
+    Write the reports to a CSV file by writing a temporary file in the same directory and renaming it.
+
+    :param reports: DataFrame containing UFO sighting data.
+    :param path: Path of the CSV file.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    handle, temporary = tempfile.mkstemp(prefix='.nuforc_data-', suffix='.csv.tmp', dir=directory)
+    try:
+        with os.fdopen(handle, 'w', newline='', encoding='utf-8') as file:
+            reports.to_csv(file, index=False)
+            file.flush()
+            os.fsync(file.fileno())
+        if os.path.exists(path):
+            os.chmod(temporary, os.stat(path).st_mode & 0o7777)
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+
+def recompute_distances(reports_file: str, airports_file: str, workers: int = None, chunk_size: int = 100000,
+                        tolerance: float = 1e-6, dry_run: bool = False, lock_timeout: float = 60.0) -> dict:
+    """
+    Recompute distance_to_nearest_airport_km for every report and write the reports back.
+
+    :param reports_file: Path to the UFO reports CSV file.
+    :param airports_file: Path to the airports CSV file.
+    :param workers: Number of worker processes (default is the number of CPUs).
+    :param chunk_size: Number of reports per chunk.
+    :param tolerance: Changes up to this many kilometers are not counted as changes.
+    :param dry_run: Only summarize the changes without writing the reports.
+    :param lock_timeout: Maximum number of seconds to wait for the lock on the reports file.
+    :return: The summary of the changes (see summarize).
+    :rtype: dict
+    """
+    lock_path = f'{reports_file}.lock'
+    with FileLock(lock_path, shared=True, timeout=lock_timeout):
+        status = os.stat(reports_file)
+        reports = pd.read_csv(reports_file)
+    old, new = recompute(reports, airports_file, workers, chunk_size)
+    summary = summarize(reports, old, new, tolerance)
+    if dry_run or not (summary['changed'] or summary['filled_in']):
+        return summary
+    # Reports may have been appended while the distances were computed. They are read and recomputed
+    # under the exclusive lock, which keeps new reports from being appended until the file is replaced.
+    with FileLock(lock_path, timeout=lock_timeout):
+        current = os.stat(reports_file)
+        if current.st_ino != status.st_ino or current.st_size < status.st_size:
+            raise RuntimeError(f'{reports_file} was rewritten by another process, run the recompute again')
+        if current.st_size > status.st_size:
+            with open(reports_file, 'rb') as file:
+                file.seek(status.st_size)
+                appended = pd.read_csv(io.BytesIO(file.read()), header=None, names=reports.columns)
+            if len(appended):
+                appended_old, appended_new = recompute(appended, airports_file, 1, chunk_size)
+                reports = pd.concat([reports, appended], ignore_index=True)
+                old, new = np.concatenate((old, appended_old)), np.concatenate((new, appended_new))
+                summary = summarize(reports, old, new, tolerance)
+        reports[DISTANCE_COLUMN] = new
+        write_atomically(reports, reports_file)
+    return summary
+
+
+def recompute(reports: pd.DataFrame, airports_file: str, workers: int = None, chunk_size: int = 100000) -> tuple:
+    """
+    Recompute the distances of reports that have a position.
+
+    :param reports: DataFrame containing UFO sighting data.
+    :param airports_file: Path to the airports CSV file.
+    :param workers: Number of worker processes (default is the number of CPUs).
+    :param chunk_size: Number of reports per chunk.
+    :return: The stored and the recomputed distances.
+    :rtype: tuple
+    """
+    latitudes = pd.to_numeric(reports['latitude'], errors='coerce').to_numpy(dtype=float)
+    longitudes = pd.to_numeric(reports['longitude'], errors='coerce').to_numpy(dtype=float)
+    known = ~np.isnan(latitudes) & ~np.isnan(longitudes)
+    old = pd.to_numeric(reports[DISTANCE_COLUMN], errors='coerce').to_numpy(dtype=float)
+    new = old.copy()
+    new[known] = compute_distances(latitudes[known], longitudes[known], airports_file, workers, chunk_size)
+    return old, new
+
+
+def main():
+    """
+    Recompute the distances from the command line.
+    """
+    parser = argparse.ArgumentParser(description='Recompute the distance to the nearest airport of every report.')
+    parser.add_argument('--reports', default=os.path.join('data', 'nuforc_data.csv'))
+    parser.add_argument('--airports', default=os.path.join('data', 'gadb_country_declatlon.csv'))
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--chunk-size', type=int, default=100000)
+    parser.add_argument('--tolerance', type=float, default=1e-6,
+                        help='Changes up to this many kilometers are not counted as changes.')
+    parser.add_argument('--dry-run', action='store_true', help='Only print the summary, do not write the reports.')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    summary = recompute_distances(args.reports, args.airports, args.workers, args.chunk_size, args.tolerance,
+                                  args.dry_run)
+    print(f"Reports:   {summary['reports']:,}")
+    print(f"Changed:   {summary['changed']:,} ({summary['closer']:,} closer, {summary['farther']:,} farther)")
+    print(f"Filled in: {summary['filled_in']:,}")
+    print(f"Unchanged: {summary['unchanged']:,}")
+    if summary['changed']:
+        print(f"Mean change {summary['mean_abs_change_km']:.3f} km, largest change "
+              f"{summary['max_abs_change_km']:.3f} km")
+        print('Largest changes:')
+        for report_no, old, new in summary['largest']:
+            print(f'  Report No. {report_no}: {old:.3f} km -> {new:.3f} km')
+    action = 'Nothing written (dry run)' if args.dry_run else (
+        f'{args.reports} updated' if summary['changed'] or summary['filled_in'] else 'Nothing to update')
+    print(f'{action} in {time.perf_counter() - start:.1f} s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,230 @@
+import io
+import os
+import queue
+import threading
+from concurrent.futures import Future
+import pandas as pd
+from file_lock import FileLock
+from instrumentation import span
+
+_STOP = object()
+TAIL_BYTES = 512
+
+
+def file_signature(path: str) -> tuple:
+    """
+    Get the size, the inode number and the last bytes of a file, used to tell an append from a rewrite.
+    Inode numbers are reused when files are replaced quickly, so the last bytes are compared as well.
+
+    :param path: Path of the file.
+    :return: (size, inode, last bytes), or (0, None, b'') if the file does not exist.
+    :rtype: tuple
+    """
+    try:
+        with open(path, 'rb') as file:
+            size = file.seek(0, os.SEEK_END)
+            file.seek(max(size - TAIL_BYTES, 0))
+            return size, os.fstat(file.fileno()).st_ino, file.read()
+    except FileNotFoundError:
+        return 0, None, b''
+
+
+class ReportWriter:
+    """
+    A write-behind queue that appends submitted reports to the reports CSV file on a background thread.
+
+    Reports submitted in a burst are group-committed: the writer waits briefly for more reports, then
+    appends all of them with a single write followed by fsync. Every submission gets a Future that is
+    resolved once its report is durable, or fails with the error of the write.
+
+    Several processes may append to the same file. Every append holds an advisory lock on
+    '<reports file>.lock'. Under the lock the writer first reads the rows other processes appended
+    since its last look, then numbers the new reports after the highest report number in the file.
+    Rows appended by other processes are kept until take_changes collects them. A file that was replaced
+    or truncated is reported as rewritten.
+    """
+    def __init__(self, path: str, columns: list, signature: tuple, max_report_no: int, linger: float = 0.05,
+                 max_batch: int = 1000, lock_timeout: float = 10.0):
+        """
+        Initialize the ReportWriter.
+
+        :param path: Path of the reports CSV file.
+        :param columns: The columns of the reports, in file order.
+        :param signature: The file_signature of the file when its rows were loaded.
+        :param max_report_no: The highest report number in the loaded rows.
+        :param linger: Seconds to wait for more reports before writing a batch.
+        :param max_batch: Maximum number of reports written at once.
+        :param lock_timeout: Maximum number of seconds to wait for the file lock.
+        """
+        self.path = path
+        self.lock_path = f'{path}.lock'
+        self.columns = list(columns)
+        self.signature = signature
+        self.max_report_no = max_report_no
+        self.linger = linger
+        self.max_batch = max_batch
+        self.lock_timeout = lock_timeout
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+        self.sync_lock = threading.Lock()
+        self.changes = []
+        self.rewritten = False
+        self.max_lock_wait = 0.0
+
+    def submit(self, row: dict) -> Future:
+        """
+        Queue a report to be appended to the file.
+
+        :param row: The report, keyed by column.
+        :return: A Future resolved with the row once it is written.
+        :rtype: concurrent.futures.Future
+        """
+        future = Future()
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='ReportWriter', daemon=True)
+                self.thread.start()
+            self.queue.put((dict(row), future))
+        return future
+
+    def run(self):
+        """
+        Write queued reports in batches until close is called.
+        """
+        while True:
+            item = self.queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            stop = False
+            while len(batch) < self.max_batch:
+                try:
+                    item = self.queue.get(timeout=self.linger)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            self.commit(batch)
+            if stop:
+                return
+
+    def commit(self, batch: list):
+        """
+        Append a batch of reports with one durable write and resolve their futures.
+
+        :param batch: (row, future) pairs.
+        """
+        try:
+            with span('ReportWriter.commit', rows=len(batch)):
+                self.append([row for row, _ in batch])
+        except Exception as error:
+            for _, future in batch:
+                future.set_exception(error)
+        else:
+            for row, future in batch:
+                future.set_result(row)
+
+    def append(self, rows: list):
+        """
+        Number rows and append them to the reports CSV file under the file lock, then flush them to disk.
+
+        :param rows: The reports, keyed by column. Their report_no is replaced by the allocated number.
+        """
+        with self.sync_lock, FileLock(self.lock_path, timeout=self.lock_timeout) as lock:
+            self.max_lock_wait = max(self.max_lock_wait, lock.waited)
+            self.read_changes()
+            for row in rows:
+                self.max_report_no += 1
+                row['report_no'] = self.max_report_no
+            frame = pd.DataFrame(rows, columns=self.columns)
+            with open(self.path, 'a+b') as file:
+                size = file.seek(0, os.SEEK_END)
+                text = frame.to_csv(header=size == 0, index=False, lineterminator='\n')
+                if size:
+                    # The file may not end with a line break
+                    file.seek(size - 1)
+                    if file.read(1) != b'\n':
+                        text = '\n' + text
+                file.write(text.encode('utf-8'))
+                file.flush()
+                os.fsync(file.fileno())
+            self.signature = file_signature(self.path)
+
+    def read_changes(self):
+        """
+        Read the rows appended to the file by other processes since the last look. Must be called while
+        holding the file lock. If the file was replaced, or no longer starts with the rows read before, it was
+        rewritten and has to be reloaded completely.
+        """
+        signature = file_signature(self.path)
+        if signature == self.signature:
+            return
+        size, inode, _ = signature
+        synced_size, synced_inode, synced_tail = self.signature
+        appended = b''
+        if inode == synced_inode and size >= synced_size:
+            with open(self.path, 'rb') as file:
+                file.seek(synced_size - len(synced_tail))
+                appended = file.read(size - synced_size + len(synced_tail))
+        if not appended.startswith(synced_tail) or inode != synced_inode or size < synced_size:
+            reports = pd.read_csv(self.path, usecols=['report_no'])
+            self.max_report_no = int(reports['report_no'].max()) if len(reports) else 0
+            self.rewritten = True
+        else:
+            text = appended[len(synced_tail):]
+            if text.strip():
+                frame = pd.read_csv(io.BytesIO(text), header=None, names=self.columns)
+                self.max_report_no = max(self.max_report_no, int(frame['report_no'].max()))
+                with self.lock:
+                    self.changes.append(frame)
+        self.signature = signature
+
+    def reset(self, signature: tuple, max_report_no: int):
+        """
+        Start over from a complete reload of the file, dropping the changes read so far. Must be called while
+        holding sync_lock and the file lock.
+
+        :param signature: The file_signature of the file when it was reloaded.
+        :param max_report_no: The highest report number in the reloaded rows.
+        """
+        self.signature = signature
+        self.max_report_no = max_report_no
+        with self.lock:
+            self.changes = []
+            self.rewritten = False
+
+    def poll(self):
+        """
+        Look for rows appended by other processes without writing anything.
+        """
+        with self.sync_lock, FileLock(self.lock_path, shared=True, timeout=self.lock_timeout):
+            self.read_changes()
+
+    def take_changes(self) -> tuple:
+        """
+        Collect the rows appended by other processes that were read so far.
+
+        :return: The rows as a DataFrame (None if there are none), and whether the file was rewritten
+            and has to be reloaded completely.
+        :rtype: tuple
+        """
+        with self.lock:
+            changes, self.changes = self.changes, []
+            rewritten, self.rewritten = self.rewritten, False
+        return (pd.concat(changes, ignore_index=True) if changes else None), rewritten
+
+    def close(self, timeout: float = None):
+        """
+        Write the reports still queued and stop the background thread.
+
+        :param timeout: Seconds to wait for the pending writes (default is no limit).
+        """
+        with self.lock:
+            thread = self.thread
+            if thread is None or not thread.is_alive():
+                return
+            self.queue.put(_STOP)
+        thread.join(timeout)
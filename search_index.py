@@ -0,0 +1,195 @@
+import re
+import numpy as np
+import pandas as pd
+from instrumentation import traced
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+
+class SearchIndex:
+    """
+    An inverted index over the text of UFO sighting reports with BM25 ranking.
+
+    Postings are stored as sorted arrays: for term i, ``documents[offsets[i]:offsets[i + 1]]`` holds
+    the row positions of the reports containing it and ``frequencies`` the matching term counts.
+    Reports added after the index was built are kept in a small in-memory delta that is searched too.
+    """
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        """
+        Initialize an empty SearchIndex.
+
+        :param k1: BM25 term frequency saturation.
+        :param b: BM25 document length normalization.
+        """
+        self.k1 = k1
+        self.b = b
+        self.terms = np.array([], dtype=object)
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.documents = np.array([], dtype=np.int64)
+        self.frequencies = np.array([], dtype=np.int32)
+        self.doc_lengths = np.array([], dtype=np.int32)
+        self.delta = {}
+
+    @staticmethod
+    def tokenize(text) -> list:
+        """
+        Split text into lowercase alphanumeric tokens.
+
+        :param text: The text to tokenize.
+        :return: The tokens.
+        :rtype: list
+        """
+        if not isinstance(text, str):
+            return []
+        return TOKEN_PATTERN.findall(text.lower())
+
+    @classmethod
+    @traced(rows=lambda cls, reports, *args, **kwargs: len(reports))
+    def from_reports(cls, reports: pd.DataFrame, columns: tuple = ('description', 'location')) -> 'SearchIndex':
+        """
+        Build the index over the given text columns of the reports.
+
+        :param reports: DataFrame containing UFO sighting data.
+        :param columns: The text columns to index.
+        :return: The built index.
+        :rtype: SearchIndex
+        """
+        index = cls()
+        text = reports[columns[0]].fillna('').astype(str)
+        for column in columns[1:]:
+            text = text + ' ' + reports[column].fillna('').astype(str)
+        # Tokenize each distinct text once and count its terms
+        text_codes, unique_texts = pd.factorize(text)
+        token_lists = [cls.tokenize(value) for value in unique_texts]
+        unique_lengths = np.fromiter((len(doc) for doc in token_lists), dtype=np.int32, count=len(token_lists))
+        index.doc_lengths = unique_lengths[text_codes]
+        flat = pd.Series([token for doc in token_lists for token in doc], dtype=object)
+        if flat.empty:
+            return index
+        term_codes, terms = pd.factorize(flat, sort=True)
+        text_ids = np.repeat(np.arange(len(token_lists), dtype=np.int64), unique_lengths)
+        text_terms, counts = np.unique(text_ids * len(terms) + term_codes, return_counts=True)
+
+        # Expand distinct texts back to reports and sort the postings by term, then report
+        starts = np.searchsorted(text_terms // len(terms), np.arange(len(token_lists) + 1))
+        order = np.argsort(text_codes, kind='stable')
+        per_report = (starts[1:] - starts[:-1])[text_codes[order]]
+        pair_index = np.repeat(starts[:-1][text_codes[order]], per_report) + (
+            np.arange(per_report.sum()) - np.repeat(np.cumsum(per_report) - per_report, per_report))
+        docs = np.repeat(order.astype(np.int64), per_report)
+        term_ids = text_terms[pair_index] % len(terms)
+        postings_order = np.lexsort((docs, term_ids))
+        index.terms = np.asarray(terms, dtype=object)
+        index.documents = docs[postings_order]
+        index.frequencies = counts[pair_index][postings_order].astype(np.int32)
+        index.offsets = np.searchsorted(term_ids[postings_order], np.arange(len(terms) + 1)).astype(np.int64)
+        return index
+
+    def add(self, position: int, *texts):
+        """
+        Index a report appended after the index was built.
+
+        :param position: Row position of the report.
+        :param texts: The text fields of the report.
+        """
+        tokens = [token for text in texts for token in self.tokenize(text)]
+        if position >= len(self.doc_lengths):
+            self.doc_lengths = np.concatenate([self.doc_lengths, np.zeros(position + 1 - len(self.doc_lengths),
+                                                                          dtype=np.int32)])
+        self.doc_lengths[position] = len(tokens)
+        for token, count in pd.Series(tokens, dtype=object).value_counts().items():
+            self.delta.setdefault(token, []).append((position, count))
+
+    def postings(self, term: str) -> tuple:
+        """
+        Get the row positions and term frequencies of the reports containing a term.
+
+        :param term: The term.
+        :return: Row positions and term frequencies.
+        :rtype: tuple
+        """
+        i = np.searchsorted(self.terms, term)
+        if i < len(self.terms) and self.terms[i] == term:
+            docs = self.documents[self.offsets[i]:self.offsets[i + 1]]
+            freqs = self.frequencies[self.offsets[i]:self.offsets[i + 1]]
+        else:
+            docs, freqs = np.array([], dtype=np.int64), np.array([], dtype=np.int32)
+        extra = self.delta.get(term)
+        if extra:
+            docs = np.concatenate([docs, np.array([doc for doc, _ in extra], dtype=np.int64)])
+            freqs = np.concatenate([freqs, np.array([count for _, count in extra], dtype=np.int32)])
+        return docs, freqs
+
+    def expand(self, token: str) -> list:
+        """
+        Expand a query token into index terms. A token ending in '*' matches every term with that prefix.
+
+        :param token: The query token.
+        :return: The matching terms.
+        :rtype: list
+        """
+        if not token.endswith('*'):
+            return [token]
+        prefix = token[:-1]
+        start = np.searchsorted(self.terms, prefix, side='left')
+        stop = np.searchsorted(self.terms, prefix + '\uffff', side='left')
+        return list(self.terms[start:stop]) + [term for term in self.delta if term.startswith(prefix)]
+
+    @traced(rows=lambda self, *args, **kwargs: len(self.doc_lengths))
+    def search(self, query: str, limit: int = None, require_all: bool = True) -> np.ndarray:
+        """
+        Find the reports matching a keyword query, best matches first.
+
+        :param query: Keywords separated by spaces; 'lig*' matches every word starting with 'lig'.
+        :param limit: Maximum number of results (default is all).
+        :param require_all: Only return reports matching every keyword.
+        :return: Row positions of the matching reports ranked by BM25 score.
+        :rtype: numpy.ndarray
+        """
+        groups = [self.expand(token) for token in re.findall(r'[a-z0-9]+\*?', query.lower())]
+        if not groups or len(self.doc_lengths) == 0:
+            return np.array([], dtype=np.int64)
+        total = len(self.doc_lengths)
+        average_length = max(self.doc_lengths.mean(), 1e-9)
+        results = [self.score_group(terms, total, average_length) for terms in groups]
+        if require_all:
+            results.sort(key=lambda result: len(result[0]))
+            docs, scores = results[0]
+            for group_docs, group_scores in results[1:]:
+                found = np.minimum(np.searchsorted(group_docs, docs), max(len(group_docs) - 1, 0))
+                matched = (group_docs[found] == docs) if len(group_docs) else np.zeros(len(docs), dtype=bool)
+                docs, scores = docs[matched], scores[matched] + group_scores[found[matched]]
+        else:
+            docs, inverse = np.unique(np.concatenate([docs for docs, _ in results]), return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate([scores for _, scores in results]))
+        if limit is not None and len(docs) > limit:
+            top = np.argpartition(-scores, limit - 1)[:limit]
+            docs, scores = docs[top], scores[top]
+        order = np.lexsort((docs, -scores))
+        return docs[order]
+
+    def score_group(self, terms: list, total: int, average_length: float) -> tuple:
+        """
+        Score the reports containing any of the given terms with BM25.
+
+        :param terms: The terms of one query keyword.
+        :param total: Number of indexed reports.
+        :param average_length: Average number of tokens per report.
+        :return: Sorted row positions and their scores.
+        :rtype: tuple
+        """
+        all_docs, all_scores = [], []
+        for term in terms:
+            docs, freqs = self.postings(term)
+            if len(docs) == 0:
+                continue
+            idf = np.log(1 + (total - len(docs) + 0.5) / (len(docs) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[docs] / average_length)
+            all_docs.append(docs)
+            all_scores.append(idf * freqs * (self.k1 + 1) / (freqs + norm))
+        if not all_docs:
+            return np.array([], dtype=np.int64), np.array([], dtype=float)
+        if len(all_docs) == 1:
+            return all_docs[0], all_scores[0]
+        docs, inverse = np.unique(np.concatenate(all_docs), return_inverse=True)
+        return docs, np.bincount(inverse, weights=np.concatenate(all_scores))
@@ -0,0 +1,300 @@
+import numpy as np
+import pandas as pd
+from instrumentation import traced
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def haversine_km(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """
+    Calculate the Haversine distance between points given in degrees.
+
+    :return: Distances in kilometers.
+    :rtype: numpy.ndarray
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(value, dtype=float)) for value in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+class GridIndex:
+    """
+    A spatial index that buckets points into cells of a fixed size in degrees.
+
+    Candidates are taken from the cells overlapping a query and refined with exact Haversine
+    distances, so only the points near the query are compared. Nearest-neighbour queries search
+    rings of cells around the query point and stop once no unsearched cell can hold a closer point.
+    Longitudes are not wrapped around the antimeridian.
+    """
+    def __init__(self, latitudes, longitudes, cell_size: float = 1.0):
+        """
+        Initialize the GridIndex.
+
+        :param latitudes: Latitudes of the points in degrees.
+        :param longitudes: Longitudes of the points in degrees.
+        :param cell_size: Size of a grid cell in degrees.
+        """
+        # Points without a position keep their index but are not put into any cell
+        self.cell_size = cell_size
+        latitudes = np.asarray(latitudes, dtype=float)
+        longitudes = np.asarray(longitudes, dtype=float)
+        self.size = len(latitudes)
+        self._latitudes = latitudes.copy()
+        self._longitudes = longitudes.copy()
+        self.cells = {}
+        valid = np.isfinite(latitudes) & np.isfinite(longitudes)
+        rows, columns = self.cell_of(np.where(valid, latitudes, 0), np.where(valid, longitudes, 0))
+        order = np.flatnonzero(valid)[np.lexsort((columns[valid], rows[valid]))]
+        keys = np.column_stack((rows[order], columns[order]))
+        boundaries = np.flatnonzero(np.any(np.diff(keys, axis=0) != 0, axis=1)) + 1
+        for group in np.split(order, boundaries):
+            if len(group):
+                self.cells[(int(rows[group[0]]), int(columns[group[0]]))] = group
+        self.update_extent()
+
+    def __len__(self) -> int:
+        return self.size
+
+    @property
+    def latitudes(self) -> np.ndarray:
+        return self._latitudes[:self.size]
+
+    @property
+    def longitudes(self) -> np.ndarray:
+        return self._longitudes[:self.size]
+
+    def cell_of(self, latitudes, longitudes) -> tuple:
+        """
+        Get the grid row and column of points.
+        """
+        return (np.floor(np.asarray(latitudes, dtype=float) / self.cell_size).astype(np.int64),
+                np.floor(np.asarray(longitudes, dtype=float) / self.cell_size).astype(np.int64))
+
+    def update_extent(self):
+        """
+        Remember the range of occupied cells, which bounds how far a ring search has to go.
+        """
+        if self.cells:
+            keys = np.array(list(self.cells))
+            self.row_range = (keys[:, 0].min(), keys[:, 0].max())
+            self.column_range = (keys[:, 1].min(), keys[:, 1].max())
+        else:
+            self.row_range = self.column_range = (0, -1)
+
+    def add(self, latitude: float, longitude: float) -> int:
+        """
+        Add a point to the index. A point without a position keeps its index but is not put into any cell.
+
+        :param latitude: Latitude in degrees, NaN if unknown.
+        :param longitude: Longitude in degrees, NaN if unknown.
+        :return: Index of the new point.
+        :rtype: int
+        """
+        if self.size == len(self._latitudes):
+            capacity = max(2 * len(self._latitudes), 16)
+            self._latitudes = np.resize(self._latitudes, capacity)
+            self._longitudes = np.resize(self._longitudes, capacity)
+        position = self.size
+        self._latitudes[position] = latitude
+        self._longitudes[position] = longitude
+        self.size += 1
+        if not (np.isfinite(latitude) and np.isfinite(longitude)):
+            return position
+        row, column = (int(value) for value in self.cell_of(latitude, longitude))
+        group = self.cells.get((row, column))
+        self.cells[(row, column)] = np.array([position]) if group is None else np.append(group, position)
+        if len(self.cells) == 1:
+            self.row_range, self.column_range = (row, row), (column, column)
+        elif group is None:
+            self.row_range = (min(self.row_range[0], row), max(self.row_range[1], row))
+            self.column_range = (min(self.column_range[0], column), max(self.column_range[1], column))
+        return position
+
+    def candidates(self, lat_min: float, lat_max: float, lon_min: float, lon_max: float) -> np.ndarray:
+        """
+        Get the indices of the points in the cells overlapping a box.
+        """
+        (row_min, row_max), (column_min, column_max) = self.cell_of([lat_min, lat_max], [lon_min, lon_max])
+        row_min, row_max = max(row_min, self.row_range[0]), min(row_max, self.row_range[1])
+        column_min, column_max = max(column_min, self.column_range[0]), min(column_max, self.column_range[1])
+        if (row_max - row_min + 1) * (column_max - column_min + 1) > len(self.cells):
+            groups = [group for (row, column), group in self.cells.items()
+                      if row_min <= row <= row_max and column_min <= column <= column_max]
+        else:
+            groups = [self.cells[(row, column)] for row in range(row_min, row_max + 1)
+                      for column in range(column_min, column_max + 1) if (row, column) in self.cells]
+        return np.concatenate(groups) if groups else np.array([], dtype=np.int64)
+
+    def within_bbox(self, lat_min: float, lat_max: float, lon_min: float, lon_max: float) -> np.ndarray:
+        """
+        Find the points inside a box.
+
+        :param lat_min: Southern edge in degrees.
+        :param lat_max: Northern edge in degrees.
+        :param lon_min: Western edge in degrees.
+        :param lon_max: Eastern edge in degrees.
+        :return: Sorted point indices.
+        :rtype: numpy.ndarray
+        """
+        found = self.candidates(lat_min, lat_max, lon_min, lon_max)
+        latitudes, longitudes = self._latitudes[found], self._longitudes[found]
+        inside = (latitudes >= lat_min) & (latitudes <= lat_max) & (longitudes >= lon_min) & (longitudes <= lon_max)
+        return np.sort(found[inside])
+
+    def within_radius(self, latitude: float, longitude: float, radius_km: float) -> tuple:
+        """
+        Find the points within a distance of a position.
+
+        :param latitude: Latitude in degrees.
+        :param longitude: Longitude in degrees.
+        :param radius_km: Radius in kilometers.
+        :return: Point indices and distances in kilometers, nearest first.
+        :rtype: tuple
+        """
+        lat_span = np.degrees(radius_km / EARTH_RADIUS_KM)
+        widest = np.radians(min(abs(latitude) + lat_span, 90.0))
+        lon_span = 180.0 if np.cos(widest) < 1e-9 else min(lat_span / np.cos(widest), 180.0)
+        found = self.candidates(latitude - lat_span, latitude + lat_span, longitude - lon_span, longitude + lon_span)
+        distances = haversine_km(latitude, longitude, self._latitudes[found], self._longitudes[found])
+        inside = distances <= radius_km
+        found, distances = found[inside], distances[inside]
+        order = np.argsort(distances, kind='stable')
+        return found[order], distances[order]
+
+    def ring(self, row: int, column: int, radius: int) -> list:
+        """
+        Get the point indices in the cells at Chebyshev distance radius from a cell.
+        """
+        if radius == 0:
+            cells = [(row, column)]
+        else:
+            cells = [(row + i, column + j) for i in range(-radius, radius + 1) for j in (-radius, radius)]
+            cells += [(row + i, column + j) for i in (-radius, radius) for j in range(-radius + 1, radius)]
+        return [self.cells[cell] for cell in cells if cell in self.cells]
+
+    def min_distance_outside(self, latitude: float, radius: int) -> float:
+        """
+        Get a lower bound in kilometers of the distance from a point to any cell farther than radius rings away.
+        """
+        degrees = radius * self.cell_size
+        widest = np.radians(min(abs(latitude) + degrees + self.cell_size, 90.0))
+        return EARTH_RADIUS_KM * np.radians(degrees) * np.cos(widest)
+
+    def nearest(self, latitude: float, longitude: float, k: int = 1) -> tuple:
+        """
+        Find the k points nearest to a position.
+
+        :param latitude: Latitude in degrees.
+        :param longitude: Longitude in degrees.
+        :param k: Number of neighbours.
+        :return: Point indices and distances in kilometers, nearest first.
+        :rtype: tuple
+        """
+        if len(self) == 0 or k <= 0:
+            return np.array([], dtype=np.int64), np.array([], dtype=float)
+        row, column = (int(value) for value in self.cell_of(latitude, longitude))
+        max_radius = max(abs(row - self.row_range[0]), abs(row - self.row_range[1]),
+                         abs(column - self.column_range[0]), abs(column - self.column_range[1]))
+        found = []
+        for radius in range(max_radius + 1):
+            found += self.ring(row, column, radius)
+            if found and sum(len(group) for group in found) >= k:
+                candidates = np.concatenate(found)
+                distances = haversine_km(latitude, longitude, self._latitudes[candidates],
+                                         self._longitudes[candidates])
+                if np.partition(distances, k - 1)[k - 1] <= self.min_distance_outside(latitude, radius):
+                    break
+        candidates = np.concatenate(found) if found else np.array([], dtype=np.int64)
+        distances = haversine_km(latitude, longitude, self._latitudes[candidates], self._longitudes[candidates])
+        order = np.argsort(distances, kind='stable')[:k]
+        return candidates[order], distances[order]
+
+
+class ReverseGeocoder:
+    """
+    A class to find the country and nearest known location of a position from the reports.
+
+    Known locations are the distinct (country, location) pairs of the reports, placed at their mean
+    position. Country regions are the bounding boxes of each country's reports, padded by a margin.
+    """
+    def __init__(self, locations: pd.DataFrame, padding: float = 1.0, max_location_km: float = 50.0,
+                 max_country_km: float = 300.0, neighbours: int = 5):
+        """
+        Initialize the ReverseGeocoder.
+
+        :param locations: DataFrame with country, location, latitude and longitude columns.
+        :param padding: Margin in degrees added around each country's bounding box.
+        :param max_location_km: A location is only suggested if it is at most this far away.
+        :param max_country_km: Known locations farther than this do not vote for the country.
+        :param neighbours: Number of nearest known locations that vote for the country.
+        """
+        self.locations = locations.reset_index(drop=True)
+        self.max_location_km = max_location_km
+        self.max_country_km = max_country_km
+        self.neighbours = neighbours
+        self.grid = GridIndex(self.locations['latitude'], self.locations['longitude'])
+        bounds = self.locations.groupby('country').agg(lat_min=('latitude', 'min'), lat_max=('latitude', 'max'),
+                                                       lon_min=('longitude', 'min'), lon_max=('longitude', 'max'))
+        self.country_bounds = bounds + np.array([-padding, padding, -padding, padding])
+
+    @classmethod
+    @traced(rows=lambda cls, reports, *args, **kwargs: len(reports))
+    def from_reports(cls, reports: pd.DataFrame, **kwargs) -> 'ReverseGeocoder':
+        """
+        Build the reverse geocoder from UFO sighting reports.
+
+        :param reports: DataFrame containing UFO sighting data.
+        :return: The reverse geocoder.
+        :rtype: ReverseGeocoder
+        """
+        columns = ['country', 'location', 'latitude', 'longitude']
+        reports = reports[columns].dropna()
+        locations = reports.groupby(['country', 'location'], as_index=False)[['latitude', 'longitude']].mean()
+        return cls(locations, **kwargs)
+
+    def countries_at(self, latitude: float, longitude: float) -> list:
+        """
+        Get the countries whose region contains a position.
+        """
+        bounds = self.country_bounds
+        inside = ((bounds['lat_min'] <= latitude) & (latitude <= bounds['lat_max']) &
+                  (bounds['lon_min'] <= longitude) & (longitude <= bounds['lon_max']))
+        return bounds.index[inside].tolist()
+
+    @traced()
+    def reverse(self, latitude: float, longitude: float) -> dict:
+        """
+        Find the country and the nearest known location of a position.
+
+        The country is voted by the nearest known locations, weighted by inverse distance and
+        restricted to the countries whose region contains the position when there are any.
+
+        :param latitude: Latitude in degrees.
+        :param longitude: Longitude in degrees.
+        :return: The country (or None), the nearest location within max_location_km (or None)
+            and its distance in kilometers.
+        :rtype: dict
+        """
+        result = {'country': None, 'location': None, 'distance_km': None}
+        indices, distances = self.grid.nearest(latitude, longitude, self.neighbours)
+        if len(indices) == 0:
+            return result
+        if distances[0] <= self.max_location_km:
+            result['location'] = self.locations.at[indices[0], 'location']
+            result['distance_km'] = float(distances[0])
+
+        near = distances <= self.max_country_km
+        countries = self.locations['country'].to_numpy()[indices[near]]
+        regions = self.countries_at(latitude, longitude)
+        if regions:
+            in_region = np.isin(countries, regions)
+            if in_region.any():
+                countries, weights = countries[in_region], 1 / (distances[near][in_region] + 1e-6)
+            else:
+                return {**result, 'country': regions[0] if len(regions) == 1 else None}
+        else:
+            weights = 1 / (distances[near] + 1e-6)
+        if len(countries):
+            votes = pd.Series(weights).groupby(countries).sum()
+            result['country'] = votes.idxmax()
+        return result
@@ -0,0 +1,170 @@
+"""
+Stress test for concurrent writers of the reports file.
+
+Several processes each open the reports with their own UFODataProcessor and submit reports at random
+moments, while another process can rewrite the whole file the way recompute_distances.py does. The test
+runs on a copy of the data in a temporary directory and checks that no report is lost or duplicated, that
+the report numbers are unique and contiguous, that what every process sees in memory matches the file and
+that no process waited longer than the lock timeout.
+
+Usage:
+    python stress_writers.py --processes 8 --reports 50
+    python stress_writers.py --processes 4 --reports 200 --rewrites 5 --max-delay 0.01
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from data_processor import LOCK_TIMEOUT, UFODataProcessor
+from file_lock import FileLock
+from recompute_distances import write_atomically
+
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def write_reports(reports_file: str, airports_file: str, worker: int, count: int, max_delay: float,
+                  seed: int) -> dict:
+    """
+    Submit reports from one process, syncing now and then, and wait until all of them are written.
+
+    :param reports_file: Path to the UFO reports CSV file.
+    :param airports_file: Path to the airports CSV file.
+    :param worker: Number of the process, used in the descriptions of its reports.
+    :param count: Number of reports to submit.
+    :param max_delay: Maximum number of seconds to sleep before each report.
+    :param seed: Seed of the random delays and positions.
+    :return: The report numbers given to the reports, the longest wait for the file lock and what the
+        process sees after a final sync.
+    :rtype: dict
+    """
+    warnings.simplefilter(action='ignore', category=FutureWarning)
+    rng = random.Random(seed)
+    processor = UFODataProcessor(reports_file, airports_file)
+    submitted = []
+    for number in range(count):
+        time.sleep(rng.uniform(0, max_delay))
+        saved, _ = processor.submit_report('1/2/2020 21:00', 'Thailand', 'Bangkok', rng.uniform(13.5, 14.0),
+                                           rng.uniform(100.3, 100.8), 'Light', 60.0,
+                                           f'stress test report {worker}-{number}')
+        submitted.append(saved)
+        if rng.random() < 0.2:
+            processor.sync()
+    report_nos = [saved.result()['report_no'] for saved in submitted]
+    processor.close()
+    processor.sync()
+    reports = processor.get_ufo_data()
+    return {'report_nos': report_nos,
+            'max_lock_wait': processor.report_writer.max_lock_wait,
+            'rows_seen': len(reports),
+            'report_nos_seen': sorted(reports['report_no'].astype(int).tolist())}
+
+
+def rewrite_reports(reports_file: str, count: int, interval: float) -> float:
+    """
+    Rewrite the whole reports file atomically under the exclusive lock, like recompute_distances.py does.
+
+    :param reports_file: Path to the UFO reports CSV file.
+    :param count: Number of rewrites.
+    :param interval: Seconds between rewrites.
+    :return: The longest wait for the file lock.
+    :rtype: float
+    """
+    max_wait = 0.0
+    for _ in range(count):
+        time.sleep(interval)
+        with FileLock(f'{reports_file}.lock', timeout=LOCK_TIMEOUT) as lock:
+            max_wait = max(max_wait, lock.waited)
+            write_atomically(pd.read_csv(reports_file), reports_file)
+    return max_wait
+
+
+def run_stress(processes: int, count: int, rewrites: int = 0, max_delay: float = 0.02, seed: int = 0) -> list:
+    """
+    Run the writer processes on a copy of the data and check the result.
+
+    :param processes: Number of writer processes.
+    :param count: Number of reports submitted by each process.
+    :param rewrites: Number of whole-file rewrites done by another process meanwhile.
+    :param max_delay: Maximum number of seconds a process sleeps before each report.
+    :param seed: Seed of the random delays and positions.
+    :return: The problems found (empty if the test passed).
+    :rtype: list
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        reports_file = os.path.join(directory, 'nuforc_data.csv')
+        airports_file = os.path.join(directory, 'gadb_country_declatlon.csv')
+        shutil.copy(os.path.join(SOURCE_DIR, 'data', 'nuforc_data.csv'), reports_file)
+        shutil.copy(os.path.join(SOURCE_DIR, 'data', 'gadb_country_declatlon.csv'), airports_file)
+        initial = pd.read_csv(reports_file)
+
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=processes + 1) as pool:
+            writers = [pool.submit(write_reports, reports_file, airports_file, worker, count, max_delay,
+                                   seed + worker) for worker in range(processes)]
+            rewriter = pool.submit(rewrite_reports, reports_file, rewrites, max_delay * count / (rewrites + 1))
+            results = [writer.result() for writer in writers]
+            rewrite_wait = rewriter.result()
+        elapsed = time.perf_counter() - start
+        final = pd.read_csv(reports_file)
+
+    problems = []
+    expected_rows = len(initial) + processes * count
+    if len(final) != expected_rows:
+        problems.append(f'{len(final):,} rows in the file, expected {expected_rows:,}')
+    report_nos = final['report_no'].astype(int)
+    if report_nos.duplicated().any():
+        problems.append(f'{report_nos.duplicated().sum()} duplicated report numbers')
+    first = int(initial['report_no'].max()) + 1
+    if sorted(report_nos[len(initial):]) != list(range(first, first + processes * count)):
+        problems.append('the new report numbers are not contiguous')
+    descriptions = set(final['description'])
+    missing = [f'{worker}-{number}' for worker in range(processes) for number in range(count)
+               if f'stress test report {worker}-{number}' not in descriptions]
+    if missing:
+        problems.append(f'{len(missing)} reports missing, e.g. {missing[:5]}')
+    final_report_nos = set(report_nos.tolist())
+    for worker, result in enumerate(results):
+        written = final.set_index('report_no').loc[result['report_nos'], 'description']
+        if list(written) != [f'stress test report {worker}-{number}' for number in range(count)]:
+            problems.append(f'process {worker} was given report numbers of other reports')
+        seen = set(result['report_nos_seen'])
+        if (len(seen) != len(result['report_nos_seen']) or not seen <= final_report_nos or
+                not seen >= set(result['report_nos'])):
+            problems.append(f"process {worker} sees {result['rows_seen']:,} rows that do not match the file")
+    max_wait = max([result['max_lock_wait'] for result in results] + [rewrite_wait])
+    if max_wait > LOCK_TIMEOUT:
+        problems.append(f'a process waited {max_wait:.2f} s for the lock, more than {LOCK_TIMEOUT} s')
+
+    print(f'{processes} processes wrote {processes * count:,} reports with {rewrites} rewrites in {elapsed:.1f} s')
+    print(f'Longest wait for the lock: {max_wait * 1000:.1f} ms')
+    return problems
+
+
+def main():
+    """
+    Run the stress test from the command line.
+    """
+    parser = argparse.ArgumentParser(description='Stress test concurrent writers of the reports file.')
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--reports', type=int, default=50, help='Reports submitted by each process.')
+    parser.add_argument('--rewrites', type=int, default=3, help='Whole-file rewrites done meanwhile.')
+    parser.add_argument('--max-delay', type=float, default=0.02)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    problems = run_stress(args.processes, args.reports, args.rewrites, args.max_delay, args.seed)
+    for problem in problems:
+        print(f'FAIL: {problem}')
+    if problems:
+        sys.exit(1)
+    print('OK: no lost or duplicated reports.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+"""
+Seeded generator of synthetic UFO sighting reports in Southeast Asia for scale testing.
+
+Reports have exactly the columns written by UFODataProcessor.save_to_csv. Locations are drawn around the
+locations of the real reports and kept inside the bounding box of their country, the date, hour, shape,
+duration and description follow the real data, derived fields are computed the same way as save_to_csv
+and the distance to the nearest airport is computed against the airport data.
+
+Usage:
+    python synthetic_data.py --rows 5000000 --output data/synthetic_nuforc_data.csv
+"""
+import argparse
+import os
+import time
+import numpy as np
+import pandas as pd
+from data_processor import UFODataProcessor, Country
+
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+COLUMNS = ['report_no', 'date_documented', 'date_time_found', 'year_found', 'month', 'hour', 'season',
+           'country_code', 'country', 'location', 'latitude', 'longitude', 'UFO_shape',
+           'length_of_encounter_seconds', 'distance_to_nearest_airport_km', 'description']
+
+# Approximate bounding boxes (min latitude, max latitude, min longitude, max longitude) of each country.
+COUNTRY_BOUNDS = {
+    Country.BRUNEI: (4.0, 5.1, 114.0, 115.4),
+    Country.CAMBODIA: (10.4, 14.7, 102.3, 107.7),
+    Country.EAST_TIMOR: (-9.5, -8.1, 124.0, 127.4),
+    Country.INDONESIA: (-11.0, 6.1, 95.0, 141.0),
+    Country.LAOS: (13.9, 22.5, 100.1, 107.7),
+    Country.MALAYSIA: (0.8, 7.4, 99.6, 119.3),
+    Country.MYANMAR: (9.8, 28.6, 92.2, 101.2),
+    Country.PHILIPPINES: (4.6, 21.2, 116.9, 126.6),
+    Country.SINGAPORE: (1.15, 1.48, 103.6, 104.1),
+    Country.THAILAND: (5.6, 20.5, 97.3, 105.7),
+    Country.VIETNAM: (8.4, 23.4, 102.1, 109.5),
+}
+SEASONS = np.array([UFODataProcessor.month_to_season(month) for month in range(13)], dtype=object)
+
+
+class SightingGenerator:
+    """
+    A class to generate synthetic UFO sighting reports that look like the bundled data.
+    """
+    def __init__(self, data_processor: UFODataProcessor, seed: int = 0, spread: float = 0.1):
+        """
+        Initialize the SightingGenerator from the real reports and airports of a data processor.
+
+        :param data_processor: An instance of UFODataProcessor with the real data.
+        :param seed: Seed for the random generator.
+        :param spread: Standard deviation in degrees of the positions around a real location.
+        """
+        self.data_processor = data_processor
+        self.rng = np.random.default_rng(seed)
+        self.spread = spread
+        reports = data_processor.get_ufo_data()
+
+        # Real locations weighted by their number of reports, kept only if they lie inside their country
+        anchors = reports.groupby(['country', 'location', 'latitude', 'longitude']).size().reset_index(name='count')
+        inside = [self.in_country(row.country, row.latitude, row.longitude) for row in anchors.itertuples()]
+        self.anchors = anchors[inside].reset_index(drop=True)
+        self.anchor_bounds = np.array([self.country_bounds(country) for country in self.anchors['country']])
+        self.anchor_codes = np.array([Country.find_val(country, 1) for country in self.anchors['country']],
+                                     dtype=object)
+
+        # Empirical distributions of the real data
+        found = pd.to_datetime(reports['date_time_found'], format='mixed')
+        documented = pd.to_datetime(reports['date_documented'], format='mixed')
+        self.anchor_weights = self.frequencies(self.anchors['count'])
+        self.shapes, self.shape_weights = self.distribution(reports['UFO_shape'])
+        self.years, self.year_weights = self.distribution(found.dt.year)
+        self.months, self.month_weights = self.distribution(found.dt.month)
+        self.hours, self.hour_weights = self.distribution(found.dt.hour)
+        self.minutes, self.minute_weights = self.distribution(found.dt.minute)
+        self.durations, self.duration_weights = self.distribution(reports['length_of_encounter_seconds'])
+        self.delays = np.maximum((documented - found.dt.normalize()).dt.days.to_numpy(), 0)
+        self.descriptions = reports['description'].fillna('').to_numpy(dtype=object)
+
+    @staticmethod
+    def distribution(values: pd.Series) -> tuple:
+        """
+        Get the distinct values of a column and their relative frequencies.
+        """
+        counts = values.dropna().value_counts()
+        return counts.index.to_numpy(), SightingGenerator.frequencies(counts)
+
+    @staticmethod
+    def frequencies(counts: pd.Series) -> np.ndarray:
+        """
+        Normalize counts to probabilities.
+        """
+        counts = counts.to_numpy(dtype=float)
+        return counts / counts.sum()
+
+    @staticmethod
+    def country_bounds(country: str) -> tuple:
+        """
+        Get the bounding box of a country by name.
+        """
+        for member in Country:
+            if member.value[0] == country:
+                return COUNTRY_BOUNDS[member]
+        raise ValueError(f'Unknown country: {country}')
+
+    def in_country(self, country: str, latitude: float, longitude: float) -> bool:
+        """
+        Check whether a position lies inside the bounding box of a country.
+        """
+        lat_min, lat_max, lon_min, lon_max = self.country_bounds(country)
+        return lat_min <= latitude <= lat_max and lon_min <= longitude <= lon_max
+
+    def generate(self, rows: int, start_report_no: int = 1) -> pd.DataFrame:
+        """
+        Generate a chunk of synthetic reports.
+
+        :param rows: Number of reports.
+        :param start_report_no: Report number of the first report.
+        :return: DataFrame with the columns written by save_to_csv.
+        :rtype: pandas.DataFrame
+        """
+        rng = self.rng
+        anchor = rng.choice(len(self.anchors), size=rows, p=self.anchor_weights)
+        bounds = self.anchor_bounds[anchor]
+        latitude = np.clip(self.anchors['latitude'].to_numpy()[anchor] + rng.normal(0, self.spread, rows),
+                           bounds[:, 0], bounds[:, 1]).round(6)
+        longitude = np.clip(self.anchors['longitude'].to_numpy()[anchor] + rng.normal(0, self.spread, rows),
+                            bounds[:, 2], bounds[:, 3]).round(6)
+
+        year = rng.choice(self.years, size=rows, p=self.year_weights).astype(int)
+        month = rng.choice(self.months, size=rows, p=self.month_weights).astype(int)
+        hour = rng.choice(self.hours, size=rows, p=self.hour_weights).astype(int)
+        minute = rng.choice(self.minutes, size=rows, p=self.minute_weights).astype(int)
+        month_start = pd.to_datetime(pd.DataFrame({'year': year, 'month': month, 'day': 1}))
+        day = (rng.random(rows) * month_start.dt.days_in_month.to_numpy()).astype(int) + 1
+        found = month_start + pd.to_timedelta(day - 1, unit='D')
+        documented = found + pd.to_timedelta(rng.choice(self.delays, size=rows), unit='D')
+
+        chunk = pd.DataFrame({
+            'report_no': np.arange(start_report_no, start_report_no + rows),
+            'date_documented': self.format_dates(documented),
+            'date_time_found': self.format_dates(found) + ' ' + pd.Series(hour).map('{:02d}'.format) +
+            ':' + pd.Series(minute).map('{:02d}'.format),
+            'year_found': year,
+            'month': month,
+            'hour': hour,
+            'season': SEASONS[month],
+            'country_code': self.anchor_codes[anchor],
+            'country': self.anchors['country'].to_numpy()[anchor],
+            'location': self.anchors['location'].to_numpy()[anchor],
+            'latitude': latitude,
+            'longitude': longitude,
+            'UFO_shape': rng.choice(self.shapes, size=rows, p=self.shape_weights),
+            'length_of_encounter_seconds': rng.choice(self.durations, size=rows, p=self.duration_weights),
+            'distance_to_nearest_airport_km': self.data_processor.nearest_airport_distances(latitude, longitude),
+            'description': self.descriptions[rng.integers(0, len(self.descriptions), rows)],
+        })
+        return chunk[COLUMNS]
+
+    @staticmethod
+    def format_dates(dates: pd.Series) -> pd.Series:
+        """
+        Format dates like the bundled data, e.g. 4/1/1966.
+        """
+        dates = pd.Series(dates).reset_index(drop=True)
+        return (dates.dt.month.astype(str) + '/' + dates.dt.day.astype(str) + '/' +
+                dates.dt.year.astype(str))
+
+    def write_csv(self, path: str, rows: int, chunk_size: int = 250000, start_report_no: int = 1):
+        """
+        Stream synthetic reports to a CSV file chunk by chunk.
+
+        :param path: Path of the CSV file to write.
+        :param rows: Total number of reports.
+        :param chunk_size: Number of reports generated and written at a time.
+        :param start_report_no: Report number of the first report.
+        """
+        written = 0
+        with open(path, 'w', newline='', encoding='utf-8') as file:
+            while written < rows:
+                size = min(chunk_size, rows - written)
+                self.generate(size, start_report_no + written).to_csv(file, header=written == 0, index=False)
+                written += size
+
+
+def generate_reports(rows: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Generate synthetic reports from the bundled data.
+
+    :param rows: Number of reports.
+    :param seed: Seed for the random generator.
+    :return: DataFrame with the columns written by save_to_csv.
+    :rtype: pandas.DataFrame
+    """
+    data_processor = UFODataProcessor(os.path.join(SOURCE_DIR, 'data', 'nuforc_data.csv'),
+                                      os.path.join(SOURCE_DIR, 'data', 'gadb_country_declatlon.csv'))
+    return SightingGenerator(data_processor, seed).generate(rows)
+
+
+def main():
+    """
+    Write a synthetic dataset from the command line.
+    """
+    parser = argparse.ArgumentParser(description='Generate synthetic UFO sighting reports.')
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--output', default=os.path.join('data', 'synthetic_nuforc_data.csv'))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--chunk-size', type=int, default=250000)
+    args = parser.parse_args()
+
+    data_processor = UFODataProcessor(os.path.join(SOURCE_DIR, 'data', 'nuforc_data.csv'),
+                                      os.path.join(SOURCE_DIR, 'data', 'gadb_country_declatlon.csv'))
+    start = time.perf_counter()
+    SightingGenerator(data_processor, args.seed).write_csv(args.output, args.rows, args.chunk_size)
+    print(f'Wrote {args.rows:,} reports to {args.output} in {time.perf_counter() - start:.1f} s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+import numpy as np
+import pandas as pd
+from instrumentation import traced
+
+FOUND_FORMAT = '%m/%d/%Y %H:%M'
+DOCUMENTED_FORMAT = '%m/%d/%Y'
+# Season of every month, index 0 is unused. The reports file says 'Autumn', reports filed in the app 'Autumn/Fall'.
+SEASONS = np.array(['', 'Winter', 'Winter', 'Spring', 'Spring', 'Spring', 'Summer', 'Summer', 'Summer',
+                    'Autumn', 'Autumn', 'Autumn', 'Winter'], dtype=object)
+
+
+def parse_datetimes(values, date_format: str, fallback_cache: dict = None) -> np.ndarray:
+    """
+    Parse date strings with an explicit format, falling back to guessing the format of the strings that do
+    not match it, such as '8/15/1978  15:30:00'.
+
+    :param values: The date strings.
+    :param date_format: The strptime format most strings are in.
+    :param fallback_cache: A dict keeping the result of every string that needed the fallback, so it is
+        guessed only once (default is no cache).
+    :return: The times as datetime64[ns], NaT where a string cannot be parsed.
+    :rtype: numpy.ndarray
+    """
+    # Dates repeat a lot, so each distinct string is parsed once
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object).astype(str))
+    uniques = pd.Series(uniques, dtype=object)
+    times = pd.Series(pd.to_datetime(uniques, format=date_format, errors='coerce'), dtype='datetime64[ns]')
+    unparsed = times.isna().to_numpy()
+    if unparsed.any():
+        cache = {} if fallback_cache is None else fallback_cache
+        missing = [value for value in uniques[unparsed] if value not in cache]
+        if missing:
+            guessed = pd.to_datetime(pd.Series(missing, dtype=object), format='mixed', errors='coerce')
+            cache.update(zip(missing, guessed.astype('datetime64[ns]').to_numpy()))
+        times[unparsed] = [cache[value] for value in uniques[unparsed]]
+    times = times.to_numpy(dtype='datetime64[ns]')
+    return times[codes] if len(times) else np.full(len(codes), np.datetime64('NaT'), dtype='datetime64[ns]')
+
+
+class TimeIndex:
+    """
+    The parsed sighting and documentation times of UFO sighting reports, with time range queries.
+
+    found and documented hold one datetime64 value per report, in the order of the reports. The row positions
+    of the reports with a sighting time are also kept sorted by that time, so a time range is found with two
+    binary searches. Reports added after the index was built are inserted into the sorted order.
+    """
+    def __init__(self, found=(), documented=()):
+        """
+        Initialize the TimeIndex.
+
+        :param found: Sighting times as datetime64, one per report.
+        :param documented: Documentation dates as datetime64, one per report.
+        """
+        self.found = np.asarray(found, dtype='datetime64[ns]')
+        self.documented = np.asarray(documented, dtype='datetime64[ns]')
+        self.fallback_cache = {}
+        known = np.flatnonzero(~np.isnat(self.found))
+        self.order = known[np.argsort(self.found[known], kind='stable')]
+        self.sorted_times = self.found[self.order].view(np.int64)
+
+    def __len__(self) -> int:
+        return len(self.found)
+
+    @classmethod
+    @traced(rows=lambda cls, reports: len(reports))
+    def from_reports(cls, reports: pd.DataFrame) -> 'TimeIndex':
+        """
+        Parse the date_time_found and date_documented columns of the reports.
+
+        :param reports: DataFrame containing UFO sighting data.
+        :return: The built index.
+        :rtype: TimeIndex
+        """
+        index = cls()
+        index.add(reports)
+        return index
+
+    def add(self, reports: pd.DataFrame):
+        """
+        Parse the times of reports added at the end and insert them into the sorted order.
+
+        :param reports: The added reports.
+        """
+        start = len(self.found)
+        found = parse_datetimes(reports['date_time_found'], FOUND_FORMAT, self.fallback_cache)
+        documented = parse_datetimes(reports['date_documented'], DOCUMENTED_FORMAT, self.fallback_cache)
+        self.found = np.concatenate([self.found, found])
+        self.documented = np.concatenate([self.documented, documented])
+        known = np.flatnonzero(~np.isnat(found))
+        if not len(known):
+            return
+        known = known[np.argsort(found[known], kind='stable')]
+        times = found[known].view(np.int64)
+        # Inserted after equal times, so reports with the same time stay in the order they were added
+        at = np.searchsorted(self.sorted_times, times, side='right')
+        self.order = np.insert(self.order, at, start + known)
+        self.sorted_times = np.insert(self.sorted_times, at, times)
+
+    def between(self, start=None, end=None) -> np.ndarray:
+        """
+        Find the reports seen in a time range.
+
+        :param start: The first time of the range, as a Timestamp, datetime or string (default is no limit).
+        :param end: The time the range ends before (default is no limit).
+        :return: Sorted row positions of the reports.
+        :rtype: numpy.ndarray
+        """
+        first = 0 if start is None else np.searchsorted(self.sorted_times, pd.Timestamp(start).value, side='left')
+        last = (len(self.sorted_times) if end is None else
+                np.searchsorted(self.sorted_times, pd.Timestamp(end).value, side='left'))
+        return np.sort(self.order[first:last])
+
+    def seconds(self, start: int = 0) -> np.ndarray:
+        """
+        Get the sighting times as seconds since the epoch.
+
+        :param start: Row position of the first report (default is all reports).
+        :return: Seconds since the epoch, NaN where the time is unknown.
+        :rtype: numpy.ndarray
+        """
+        found = self.found[start:]
+        seconds = found.astype('datetime64[s]').astype(np.int64).astype(float)
+        seconds[np.isnat(found)] = np.nan
+        return seconds
+
+    @traced(rows=lambda self, reports, offset=0: len(reports))
+    def mismatches(self, reports: pd.DataFrame, offset: int = 0) -> dict:
+        """
+        Check the fields derived from the sighting time against the parsed time.
+
+        :param reports: The reports, or reports added at the end.
+        :param offset: Row position of the first of the reports in the index.
+        :return: Row positions of the reports whose year_found, month, hour or season differ from the sighting
+            time, per column. Reports whose time cannot be parsed are listed under date_time_found instead.
+        :rtype: dict
+        """
+        found = pd.DatetimeIndex(self.found[offset:offset + len(reports)])
+        known = ~found.isna()
+        expected = {'year_found': found.year, 'month': found.month, 'hour': found.hour}
+        result = {'date_time_found': np.flatnonzero(~known) + offset}
+        for column, values in expected.items():
+            actual = pd.to_numeric(reports[column], errors='coerce').to_numpy(dtype=float)
+            result[column] = np.flatnonzero(known & (actual != values.to_numpy(dtype=float))) + offset
+        seasons = SEASONS[np.where(known, found.month.fillna(0).to_numpy(dtype=int), 0)]
+        actual = reports['season'].astype(object).replace('Autumn/Fall', 'Autumn').to_numpy(dtype=object)
+        result['season'] = np.flatnonzero(known & (actual != seasons)) + offset
+        return result
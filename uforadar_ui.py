@@ -3,18 +3,34 @@ import os
 import tkinter as tk
 import tkinter.messagebox as messagebox
 from tkinter import ttk
-from tkinter.filedialog import asksaveasfile
+from tkinter.filedialog import asksaveasfile, asksaveasfilename
 import matplotlib
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from matplotlib.colors import LinearSegmentedColormap
+from matplotlib.figure import Figure
+import numpy as np
 import pandas as pd
 from PIL import Image, ImageTk
 from button import CreateButton
+from chart_renderer import ChartRenderer
 from data_processor import UFODataProcessor, Country
+from diagnostics import track_navigation
+from exporter import ExportCancelled, ReportExporter
+from filter_expression import FilterError
 from graph_generator import GraphGenerator
+from heatmap import HeatmapLayer
+from instrumentation import span, traced
+from page_manager import PageManager
 from tkintermapview import TkinterMapView
 matplotlib.use('TkAgg')
 
+SYNC_INTERVAL_MS = 2000
+GRAPH_REDRAW_DELAY_MS = 500
+# Hidden pages free their heavy resources after this long
+PAGE_RELEASE_MS = 120000
+HEATMAP_MARKER_LIMIT = 2000
+
 
 class MapPage(tk.Frame):
     """
@@ -27,11 +43,15 @@ class MapPage(tk.Frame):
         """
         super().__init__()
         self.parent = parent
-        self.data = self.parent.data_processor.get_ufo_data()
+        # The reports of the processor itself; the page only reads them
+        self.data = self.parent.data_processor.ufo_reports
+        self.applied_filter = None
+        self.listed_positions = []
         self.image = Image.open(os.path.join(os.getcwd(), 'images', 'marker_icon.png')).resize((40, 40))
         self.marker_icon = ImageTk.PhotoImage(self.image)
         self.configure(bg='#F8F8FF')
         self.init_components()
+        self.unsubscribe = self.parent.data_processor.subscribe(self.data_changed)
 
     def init_components(self):
         """
@@ -46,6 +66,14 @@ class MapPage(tk.Frame):
 
         # Fit bounding box to Southeast Asia
         self.map_view.fit_bounding_box((28.73, 91.20), (-9.5, 128.52))
+        self.radius_center = None
+        self.radius_circle = None
+        self.map_view.add_right_click_menu_command(label='Set radius filter center', command=self.set_radius_center,
+                                                   pass_coords=True)
+        self.heatmap = HeatmapLayer(self.map_view)
+        # Thousands of markers are slow and unreadable, so large datasets start as a heatmap
+        self.heatmap_var = tk.BooleanVar(value=len(self.data) > HEATMAP_MARKER_LIMIT)
+        self.shown_data = self.data
 
         # Add position markers for UFO sightings
         self.add_sighting_markers()
@@ -72,6 +100,32 @@ class MapPage(tk.Frame):
         self.filter_frame = tk.LabelFrame(self, text='Filter')
         self.filter_frame.grid(row=2, column=1, sticky=tk.NSEW)
 
+        # Keyword search over descriptions and locations
+        search_frame = tk.Frame(self.filter_frame)
+        search_frame.grid(row=0, column=0, columnspan=3, padx=5, pady=5, sticky=tk.EW)
+        self.search_var = tk.StringVar()
+        search_entry = ttk.Entry(search_frame, textvariable=self.search_var, width=30)
+        search_entry.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        search_entry.bind('<Return>', lambda event: self.apply_filter())
+        self.search_button = tk.Button(search_frame, text='Search', command=self.apply_filter)
+        self.search_button.pack(side=tk.LEFT, padx=5)
+
+        # Radius around a point picked with a right click on the map
+        radius_frame = tk.Frame(self.filter_frame)
+        radius_frame.grid(row=6, column=0, columnspan=3, padx=5, pady=5, sticky=tk.EW)
+        tk.Label(radius_frame, text='Radius (km):').pack(side=tk.LEFT)
+        self.radius_var = tk.StringVar()
+        ttk.Entry(radius_frame, textvariable=self.radius_var, width=8).pack(side=tk.LEFT, padx=5)
+        self.radius_center_label = tk.Label(radius_frame, text='Right-click the map to set the center.')
+        self.radius_center_label.pack(side=tk.LEFT)
+
+        results_frame = tk.Frame(self.filter_frame)
+        results_frame.grid(row=7, column=0, columnspan=3, padx=5, pady=5, sticky=tk.EW)
+        ttk.Checkbutton(results_frame, text='Show as heatmap', variable=self.heatmap_var,
+                        command=self.toggle_heatmap).pack(side=tk.LEFT)
+        self.export_button = tk.Button(results_frame, text='Export Results', command=self.export_results)
+        self.export_button.pack(side=tk.RIGHT)
+
         # Create a canvas for the radio buttons
         canvas = tk.Canvas(self.filter_frame, bg='white')
         canvas.grid(row=1, column=0, columnspan=3, sticky=tk.NSEW)
@@ -84,6 +138,7 @@ class MapPage(tk.Frame):
         # Create a frame to contain the radio buttons
         radiobutton_frame = tk.Frame(canvas)
         canvas.create_window((0, 0), window=radiobutton_frame, anchor=tk.NW)
+        self.filter_canvas, self.radiobutton_frame = canvas, radiobutton_frame
 
         # Country filter
         country_label = tk.Label(radiobutton_frame, text='Country:')
@@ -138,7 +193,20 @@ class MapPage(tk.Frame):
 
         self.progress = ttk.Progressbar(self.filter_frame, orient='horizontal', mode='indeterminate', length=275)
         self.progress.grid(row=3, column=0, columnspan=7, padx=10, pady=10, sticky=tk.W)
-
+        # Shown below the other controls while the markers are deleted
+        self.filtering_label = tk.Label(self.filter_frame, wraplength=200,
+                                        text="Filtering might take some time. Please be patient. :)")
+
+        # Filter expression over any columns, e.g. length_of_encounter_seconds > 60
+        where_frame = tk.Frame(self.filter_frame)
+        where_frame.grid(row=4, column=0, columnspan=3, padx=5, pady=5, sticky=tk.EW)
+        tk.Label(where_frame, text='Where:').pack(side=tk.LEFT)
+        self.where_var = tk.StringVar()
+        where_entry = ttk.Entry(where_frame, textvariable=self.where_var, width=30)
+        where_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        where_entry.bind('<Return>', lambda event: self.apply_filter())
+
+    @traced()
     def clear_filter(self):
         """
         Clear the applied filters.
@@ -147,35 +215,198 @@ class MapPage(tk.Frame):
         selected_year = self.year_var.get()
         selected_shape = self.shape_var.get()
         self.results_listbox.delete(0, tk.END)
-        if selected_year != 'All' or selected_country != 'All' or selected_shape != 'All':
+        self.listed_positions = []
+        if (selected_year != 'All' or selected_country != 'All' or selected_shape != 'All' or self.search_var.get()
+                or self.where_var.get().strip() or self.radius_filter() is not None):
+            self.search_var.set('')
+            self.where_var.set('')
+            self.radius_var.set('')
+            if self.radius_circle is not None:
+                self.radius_circle.delete()
+                self.radius_circle = None
             self.country_var.set('All')
             self.year_var.set('All')
             self.shape_var.set('All')
+            self.applied_filter = None
             self.delete_markers()
             self.add_sighting_markers()
             self.map_view.fit_bounding_box((28.73, 91.20), (-9.5, 128.52))
+        self.publish_selection()
 
+    @traced()
     def apply_filter(self):
         """
-        Apply the selected filters.
+        Apply the selected filters. Reports matching the search keywords are listed best matches first,
+        otherwise reports within the radius are listed nearest first.
         """
-        selected_country = self.country_var.get()
-        selected_year = self.year_var.get()
-        selected_shape = self.shape_var.get()
-        filtered_data = self.data
-        if selected_country != 'All':
-            filtered_data = filtered_data[filtered_data['country'] == selected_country]
-        if selected_year != 'All':
-            start_year, end_year = map(int, selected_year.split('-'))
-            filtered_data = filtered_data[(filtered_data['year_found'] >= start_year) &
-                                          (filtered_data['year_found'] <= end_year)]
-        if selected_shape != 'All':
-            filtered_data = filtered_data[filtered_data['UFO_shape'] == selected_shape]
-
-        if selected_year != 'All' or selected_country != 'All' or selected_shape != 'All':
+        selection = UFODataProcessor.selection_expression(self.country_var.get(), self.year_var.get(),
+                                                          self.shape_var.get())
+        where = self.where_var.get().strip()
+        expression = ' and '.join(f'({condition})' for condition in (selection, where) if condition)
+        query = self.search_var.get().strip()
+        radius = self.radius_filter()
+        applied_filter = (expression, query, radius, self.radius_center)
+        try:
+            filtered_data = self.filter_data(self.data, applied_filter)
+        except FilterError as error:
+            messagebox.showerror('Error', f'Invalid filter: {error}')
+            return
+        if radius is not None:
+            self.draw_radius_circle(radius)
+
+        if expression or query or radius is not None:
+            self.applied_filter = applied_filter
             self.update_map_markers(filtered_data)
             self.update_results_list(filtered_data)
+            self.publish_selection()
+
+    def publish_selection(self):
+        """
+        Share the reports matching the applied filter with the graph pages, which can draw only those.
+        """
+        self.parent.map_selection = (None if self.applied_filter is None else
+                                     np.asarray(self.listed_positions, dtype=np.intp))
+
+    def filter_data(self, data: pd.DataFrame, applied_filter: tuple) -> pd.DataFrame:
+        """
+        Keep the reports matching a filter, in the order they are listed.
+
+        :param data: Reports of self.data, e.g. all of them or the ones just added.
+        :param applied_filter: The filter expression, search keywords, radius and radius center.
+        :return: The matching reports.
+        :rtype: pandas.DataFrame
+        :raises FilterError: If the filter expression is invalid.
+        """
+        expression, query, radius, radius_center = applied_filter
+        processor = self.parent.data_processor
+        # The mask over all reports is cached by the processor, added reports are checked on their own
+        data = data[processor.filter_mask(expression, None if data is processor.ufo_reports else data)]
+        if radius is not None:
+            positions = processor.sightings_within_radius(*radius_center, radius)
+            data = self.data.iloc[positions[np.isin(positions, data.index)]]
+        if query:
+            positions = processor.search(query)
+            data = self.data.iloc[positions[np.isin(positions, data.index)]]
+        return data
+
+    def data_changed(self, change):
+        """
+        Bring the map, the filter options and the results list up to date with a change of the reports.
+        Added reports are checked against the applied filter on their own and shown if they match.
+
+        :param change: A DataChange of the data processor.
+        """
+        self.data = change.reports
+        if change.kind == 'reload':
+            self.add_filter_options(self.data)
+            self.delete_markers()
+            if self.applied_filter is None:
+                self.add_sighting_markers()
+            else:
+                filtered_data = self.filter_data(self.data, self.applied_filter)
+                self.update_map_markers(filtered_data)
+                self.update_results_list(filtered_data)
+                self.publish_selection()
+        elif change.kind == 'update':
+            changed = set(change.positions.tolist())
+            for line, position in enumerate(self.listed_positions):
+                if position in changed:
+                    self.results_listbox.delete(line)
+                    self.results_listbox.insert(line, self.result_text(self.data.iloc[position]))
+        else:
+            reports = change.rows
+            self.add_filter_options(reports)
+            if self.applied_filter is None:
+                self.shown_data = self.data
+                self.add_markers(reports)
+            else:
+                reports = self.filter_data(reports, self.applied_filter)
+                self.shown_data = pd.concat([self.shown_data, reports])
+                self.add_markers(reports, text=True)
+                if reports.empty:
+                    return
+                if not self.listed_positions:
+                    self.results_listbox.delete(0, tk.END)
+                for position, row in reports.iterrows():
+                    self.results_listbox.insert(tk.END, self.result_text(row))
+                    self.listed_positions.append(position)
+                self.publish_selection()
+
+    def add_markers(self, reports: pd.DataFrame, text: bool = False):
+        """
+        Add sightings to the markers or the heatmap shown on the map.
+
+        :param reports: UFO sighting data.
+        :param text: Label the markers with the UFO shape.
+        """
+        if self.heatmap_var.get():
+            self.heatmap.add_points(pd.to_numeric(reports['latitude'], errors='coerce'),
+                                    pd.to_numeric(reports['longitude'], errors='coerce'))
+            return
+        for _, row in reports.iterrows():
+            self.map_view.set_marker(float(row['latitude']), float(row['longitude']),
+                                     text=row['UFO_shape'] if text else None, icon=self.marker_icon)
+
+    def add_filter_options(self, reports: pd.DataFrame):
+        """
+        Add radio buttons for the countries and shapes of reports that have none yet.
+
+        :param reports: UFO sighting data.
+        """
+        for column, radios, variable, grid_column in (('country', self.country_radios, self.country_var, 0),
+                                                      ('UFO_shape', self.shape_radios, self.shape_var, 2)):
+            known = {str(radio.cget('value')) for radio in radios}
+            for value in reports[column].dropna().unique().tolist():
+                if value in known:
+                    continue
+                radio = ttk.Radiobutton(self.radiobutton_frame, text=value, variable=variable, value=value)
+                radio.grid(row=len(radios) + 1, column=grid_column, sticky=tk.W, padx=10)
+                radios.append(radio)
+                known.add(value)
+        self.filter_canvas.config(scrollregion=self.filter_canvas.bbox('all'))
 
+    def radius_filter(self):
+        """
+        Get the radius of the radius filter.
+
+        :return: The radius in kilometers, or None if the radius or its center is not set.
+        """
+        try:
+            radius = float(self.radius_var.get())
+        except ValueError:
+            return None
+        if self.radius_center is None or radius <= 0:
+            return None
+        return radius
+
+    def set_radius_center(self, coordinates_tuple):
+        """
+        Set the center of the radius filter from a right click on the map.
+
+        :param coordinates_tuple: The coordinates of the click.
+        """
+        self.radius_center = coordinates_tuple
+        self.radius_center_label.configure(text=f'Center: {coordinates_tuple[0]:.3f}, {coordinates_tuple[1]:.3f}')
+        radius = self.radius_filter()
+        if radius is not None:
+            self.draw_radius_circle(radius)
+
+    def draw_radius_circle(self, radius: float):
+        """
+        Draw the outline of the radius filter on the map.
+
+        :param radius: The radius in kilometers.
+        """
+        if self.radius_circle is not None:
+            self.radius_circle.delete()
+        latitude, longitude = self.radius_center
+        angles = np.linspace(0, 2 * np.pi, 64, endpoint=False)
+        lat_span = np.degrees(radius / 6371.0)
+        lon_span = lat_span / max(np.cos(np.radians(latitude)), 1e-6)
+        points = list(zip(latitude + lat_span * np.sin(angles), longitude + lon_span * np.cos(angles)))
+        self.radius_circle = self.map_view.set_polygon(points, outline_color='red', fill_color=None, border_width=2)
+
+    @traced(rows=lambda self, data: len(data))
     def update_results_list(self, data: pd.DataFrame):
         """
         Update the list of filtered results.
@@ -184,13 +415,21 @@ class MapPage(tk.Frame):
         :type data: pandas.DataFrame
         """
         self.results_listbox.delete(0, tk.END)
+        self.listed_positions = data.index.tolist()
         if data.empty:
             self.results_listbox.insert(tk.END, 'No result found.')
         else:
             for index, row in data.iterrows():
-                self.results_listbox.insert(tk.END, f"Report No. {row['report_no']} - "
-                                            f"{row['country']} - {row['year_found']} - {row['UFO_shape']}")
+                self.results_listbox.insert(tk.END, self.result_text(row))
 
+    @staticmethod
+    def result_text(row) -> str:
+        """
+        Get the line of a report in the results list.
+        """
+        return f"Report No. {row['report_no']} - {row['country']} - {row['year_found']} - {row['UFO_shape']}"
+
+    @traced(rows=lambda self, filtered_data: len(filtered_data))
     def update_map_markers(self, filtered_data: pd.DataFrame):
         """
         Update map markers based on filtered data.
@@ -199,36 +438,131 @@ class MapPage(tk.Frame):
         :type filtered_data: pandas.DataFrame
         """
         self.delete_markers()
-        for index, row in filtered_data.iterrows():
-            latitude = float(row['latitude'])
-            longitude = float(row['longitude'])
-            shape = row['UFO_shape']
-            self.map_view.set_marker(latitude, longitude, text=shape, icon=self.marker_icon)
-
+        self.shown_data = filtered_data
+        if self.heatmap_var.get():
+            self.show_heatmap(filtered_data)
+            return
+        with span('MapPage.set_marker', rows=len(filtered_data)):
+            for index, row in filtered_data.iterrows():
+                latitude = float(row['latitude'])
+                longitude = float(row['longitude'])
+                shape = row['UFO_shape']
+                self.map_view.set_marker(latitude, longitude, text=shape, icon=self.marker_icon)
+
+    @traced()
     def delete_markers(self):
         """
         Delete all map markers.
         """
         self.progress.start()
-        label = tk.Label(self.filter_frame, text="Filtering might take some time. Please be patient. :)",
-                         wraplength=200)
-        label.grid(row=4, column=0)
+        self.filtering_label.grid(row=8, column=0, columnspan=3)
         self.apply_button.configure(state='disabled')
         self.clear_button.configure(state='disabled')
         self.map_view.delete_all_marker()
         self.progress.stop()
+        self.filtering_label.grid_forget()
         self.apply_button.configure(state='normal')
         self.clear_button.configure(state='normal')
 
+    @traced(rows=lambda self: len(self.data))
     def add_sighting_markers(self):
         """
         Add map markers for all UFO sightings.
         """
+        self.shown_data = self.data
+        if self.heatmap_var.get():
+            self.show_heatmap(self.data)
+            return
         for index, row in self.data.iterrows():
             latitude = float(row['latitude'])
             longitude = float(row['longitude'])
             self.map_view.set_marker(latitude, longitude, icon=self.marker_icon)
 
+    def show_heatmap(self, data: pd.DataFrame):
+        """
+        Show the density of the sightings as a heatmap instead of markers.
+
+        :param data: UFO sighting data.
+        :type data: pandas.DataFrame
+        """
+        self.heatmap.set_points(pd.to_numeric(data['latitude'], errors='coerce'),
+                                pd.to_numeric(data['longitude'], errors='coerce'))
+        self.heatmap.show()
+
+    def toggle_heatmap(self):
+        """
+        Switch the sightings on the map between markers and a heatmap.
+        """
+        if self.heatmap_var.get():
+            self.map_view.delete_all_marker()
+            self.show_heatmap(self.shown_data)
+        else:
+            self.heatmap.hide()
+            if self.shown_data is self.data:
+                self.add_sighting_markers()
+            else:
+                self.update_map_markers(self.shown_data)
+
+    def enter(self):
+        """
+        Follow the view of the map with the heatmap again when the page is shown.
+        """
+        if self.heatmap_var.get() and self.heatmap.renderer is not None:
+            self.heatmap.show()
+
+    def leave(self):
+        """
+        Stop following the view of the map with the heatmap while the page is hidden.
+        """
+        self.heatmap.hide()
+
+    def release(self):
+        """
+        Drop the cached heatmap rasters of the hidden page; they are rendered again when needed.
+        """
+        self.heatmap.cache.clear()
+
+    def export_results(self):
+        """
+        Export the reports shown on the map to CSV, GeoJSON or Parquet on a background thread.
+        """
+        filename = asksaveasfilename(initialfile='ufo_reports.csv', defaultextension='.csv',
+                                     filetypes=[('CSV', '*.csv'), ('GeoJSON', '*.geojson'), ('Parquet', '*.parquet')])
+        if not filename:
+            return
+        try:
+            ReportExporter.format_of(filename)
+        except ValueError as error:
+            messagebox.showerror('Error', str(error))
+            return
+        # The shown reports are exported by position, chunk by chunk, without another filtered copy
+        exporter = ReportExporter(self.data, self.data.index.get_indexer(self.shown_data.index))
+        saved = exporter.start(filename)
+        self.progress.configure(mode='determinate', maximum=max(len(exporter), 1), value=0)
+        self.export_button.configure(text='Cancel Export', command=exporter.cancel)
+        self.after(100, self.check_export, exporter, saved)
+
+    def check_export(self, exporter: ReportExporter, saved):
+        """
+        Show the progress of an export and tell the user the outcome once it is done.
+
+        :param exporter: The running ReportExporter.
+        :param saved: The Future of the export.
+        """
+        self.progress.configure(value=exporter.written)
+        if not saved.done():
+            self.after(100, self.check_export, exporter, saved)
+            return
+        self.progress.configure(mode='indeterminate', value=0)
+        self.export_button.configure(text='Export Results', command=self.export_results)
+        error = saved.exception()
+        if isinstance(error, ExportCancelled):
+            return
+        if error is not None:
+            messagebox.showerror('Error', f'The reports could not be exported: {error}')
+        else:
+            messagebox.showinfo('Success', f'{len(exporter):,} reports exported to {saved.result()}.')
+
     def show_result_details(self, event):
         """
         Show detailed information about a selected result.
@@ -298,6 +632,7 @@ class GraphsPage(tk.Frame):
     """
     A frame for the graphs page.
     """
+    @traced()
     def __init__(self, parent):
         """
         Initialize GraphsPage.
@@ -309,6 +644,7 @@ class GraphsPage(tk.Frame):
         self.graph_gen = GraphGenerator(self.parent.data_processor)
         self.configure(bg='#F8F8FF')
         self.init_components()
+        self.unsubscribe = self.parent.data_processor.subscribe(self.data_changed)
 
     def init_components(self):
         """
@@ -348,6 +684,13 @@ class GraphsPage(tk.Frame):
         stats_button = CreateButton(self).button(img1='stats_2.png', img2='stats_1.png',
                                                  bg='#F8F8FF', command=self.statistic_popup)
         stats_button.grid(row=0, column=0, sticky=tk.W, padx=165, columnspan=2)
+        create_graph_button = CreateButton(self).button(img1='create_graph2.png', img2='create_graph1.png',
+                                                        bg='#F8F8FF', command=self.parent.show_user_create_graph_page)
+        create_graph_button.grid(row=0, column=0, sticky=tk.W)
+        self.cross_filter_var = tk.BooleanVar(value=True)
+        self.cross_filter_button = tk.Checkbutton(self, text='Only reports selected on the map', bg='#F8F8FF',
+                                                  variable=self.cross_filter_var, command=self.render_graphs)
+        self.cross_filter_button.grid(row=0, column=1, sticky=tk.E, padx=10)
         self.create_and_display_graphs()
 
         # Configure grid weights
@@ -358,35 +701,142 @@ class GraphsPage(tk.Frame):
         self.rowconfigure(2, weight=1)
         self.rowconfigure(3, weight=1)
 
+    @traced()
     def create_and_display_graphs(self):
         """
-        Create and display graphs.
+        Show a placeholder for every graph and start drawing the graphs in the background. Each graph replaces
+        its placeholder as soon as it is done (see show_rendered_graphs).
+        """
+        self.graph_canvases = {'histogram1': self.histogram_canvas, 'histogram2': self.histogram_canvas2,
+                               'pie_chart_ufo_shape': self.pie_graph_canvas,
+                               'top_cities_bar_chart': self.bar_graph_canvas, 'year_line': self.line_graph_canvas}
+        self.graph_images = {}
+        self.rendering = {}
+        self.polling = None
+        self.redraw_pending = None
+        self.drawn = None
+        self.render_graphs()
+
+    def show_placeholders(self, text: str = 'Loading graph...'):
+        """
+        Show a placeholder of the size of its image in place of every graph.
+
+        :param text: The text of the placeholders.
+        """
+        renderer = self.parent.chart_renderer
+        for name, canvas in self.graph_canvases.items():
+            width, height = renderer.size(name)
+            canvas.delete('placeholder', 'graph')
+            canvas.configure(width=width, height=height, bg='white', highlightthickness=0)
+            canvas.create_text(width // 2, height // 2, text=text, fill='grey', tag='placeholder')
+
+    def selection(self):
+        """
+        Get the reports to draw: those selected on the map page if the graphs follow its filter.
+
+        :return: Row positions of the reports, or None for all reports.
+        """
+        return self.parent.map_selection if self.cross_filter_var.get() else None
+
+    def render_graphs(self):
+        """
+        Start drawing the graphs in the background. The graphs shown stay until their new version is done.
+        When the map selection leaves no reports to draw, placeholders say so instead.
         """
-        fig_hist1, ax_hist1 = self.graph_gen.generate_histogram1()
-        hist1_canvas = FigureCanvasTkAgg(fig_hist1, master=self.histogram_canvas)
-        hist1_canvas.draw()
-        hist1_canvas.get_tk_widget().pack(expand=True, fill=tk.BOTH)
+        self.redraw_pending = None
+        for future in self.rendering.values():
+            future.cancel()
+        selection = self.selection()
+        self.drawn = (self.parent.data_processor.data_version, selection)
+        self.cross_filter_button.configure(text='Only reports selected on the map' if selection is None else
+                                           f'Only the {len(selection):,} reports selected on the map')
+        # A generator per render, so a render in the background keeps its selection
+        self.graph_gen = GraphGenerator(self.parent.data_processor, selection=selection)
+        if selection is not None and not self.graph_gen.row_mask().any():
+            self.rendering = {}
+            self.graph_images = {}
+            self.show_placeholders('No reports selected')
+            return
+        if not self.graph_images:
+            self.show_placeholders()
+        self.rendering = self.parent.chart_renderer.render(self.graph_gen, self.graph_canvases)
+        if self.polling is None:
+            self.show_rendered_graphs()
 
-        fig_hist2, ax_hist2 = self.graph_gen.generate_histogram2()
-        hist2_canvas = FigureCanvasTkAgg(fig_hist2, master=self.histogram_canvas2)
-        hist2_canvas.draw()
-        hist2_canvas.get_tk_widget().pack(expand=True, fill=tk.BOTH)
+    def data_changed(self, change):
+        """
+        Draw the graphs again shortly after the reports changed, once for a burst of changes. A hidden page
+        is drawn again when it is shown (see enter).
 
-        fig_pie, ax_pie = self.graph_gen.generate_pie_chart_ufo_shape()
-        pie_canvas = FigureCanvasTkAgg(fig_pie, master=self.pie_graph_canvas)
-        pie_canvas.draw()
-        pie_canvas.get_tk_widget().pack(expand=True, fill=tk.BOTH)
+        :param change: A DataChange of the data processor.
+        """
+        if self.redraw_pending is None and self.winfo_manager():
+            self.redraw_pending = self.after(GRAPH_REDRAW_DELAY_MS, self.render_graphs)
 
-        fig_bar, ax_bar = self.graph_gen.generate_top_cities_bar_chart()
-        bar_canvas = FigureCanvasTkAgg(fig_bar, master=self.bar_graph_canvas)
-        bar_canvas.draw()
-        bar_canvas.get_tk_widget().pack(expand=True, fill=tk.BOTH)
+    def enter(self):
+        """
+        Draw the graphs again if the reports or the selection on the map changed while the page was hidden or
+        released.
+        """
+        if (self.drawn is None or self.drawn[0] != self.parent.data_processor.data_version or
+                self.drawn[1] is not self.selection()):
+            self.render_graphs()
 
-        fig_line, ax_line = self.graph_gen.generate_year_line()
-        line_canvas = FigureCanvasTkAgg(fig_line, master=self.line_graph_canvas)
-        line_canvas.draw()
-        line_canvas.get_tk_widget().pack(expand=True, fill=tk.BOTH)
+    def release(self):
+        """
+        Drop the images of the graphs of the hidden page; they are drawn again on the next visit.
+        """
+        self.cancel_rendering()
+        self.graph_images = {}
+        self.drawn = None
+        self.show_placeholders()
 
+    def cancel_rendering(self):
+        """
+        Stop drawing the graphs that were not started yet and stop checking for finished ones.
+        """
+        for pending in (self.redraw_pending, self.polling):
+            if pending is not None:
+                self.after_cancel(pending)
+        self.redraw_pending, self.polling = None, None
+        for future in self.rendering.values():
+            future.cancel()
+        self.rendering = {}
+
+    def show_rendered_graphs(self):
+        """
+        Replace the placeholders or old versions of the graphs that are done, and check again shortly until all
+        are shown.
+        """
+        self.polling = None
+        for name, future in list(self.rendering.items()):
+            if not future.done():
+                continue
+            del self.rendering[name]
+            canvas = self.graph_canvases[name]
+            canvas.delete('placeholder', 'graph')
+            try:
+                _, size, data = future.result()
+            except Exception as error:
+                canvas.create_text(int(canvas['width']) // 2, int(canvas['height']) // 2, fill='grey',
+                                   text=f'Could not draw the graph: {error}', width=int(canvas['width']) - 20)
+                continue
+            with span('GraphsPage.show_graph'):
+                self.graph_images[name] = ImageTk.PhotoImage(Image.frombuffer('RGBA', size, data, 'raw', 'RGBA', 0, 1),
+                                                             master=canvas)
+                canvas.create_image(0, 0, image=self.graph_images[name], anchor=tk.NW, tag='graph')
+        if self.rendering:
+            self.polling = self.after(50, self.show_rendered_graphs)
+
+    def destroy(self):
+        """
+        Stop following the reports and drawing the graphs that were not started yet, then destroy the page.
+        """
+        self.unsubscribe()
+        self.cancel_rendering()
+        super().destroy()
+
+    @traced()
     def statistic_popup(self):
         """
         Opens a popup window to display summary statistics for numerical attributes.
@@ -413,13 +863,15 @@ class GraphsPage(tk.Frame):
         scatter_plot_frame.pack()
         self.scatter_plot_canvas = tk.Canvas(scatter_plot_frame)
         self.scatter_plot_canvas.pack()
-        fig_scatter, ax_scatter = self.graph_gen.generate_correlation_graph()
+        fig_scatter, ax_scatter = self.graph_gen.generate_correlation_graph(sample_size=5000)
         fig_scatter.set_size_inches(5, 3.5)
         scatter_canvas = FigureCanvasTkAgg(fig_scatter, master=self.scatter_plot_canvas)
-        scatter_canvas.draw()
+        with span('FigureCanvasTkAgg.draw'):
+            scatter_canvas.draw()
         scatter_canvas.get_tk_widget().pack(expand=True, fill=tk.BOTH)
         plt.tight_layout()
 
+    @traced()
     def display_statistics(self, event):
         """
         Displays summary statistics for the selected numerical attribute.
@@ -433,6 +885,7 @@ class CreateYourOwnGraphPage(tk.Frame):
     """
     A frame for creating custom graphs based on UFO sighting data.
     """
+    @traced()
     def __init__(self, parent):
         """
         Initialize the CreateYourOwnGraphPage.
@@ -492,19 +945,38 @@ class CreateYourOwnGraphPage(tk.Frame):
         create_button = tk.Button(self, text='Create Graph', command=self.error_handling)
         create_button.grid(row=4, column=1, rowspan=3, pady=10)
 
+        # Only the reports matching this filter expression are drawn, e.g. country == 'Thailand'
+        self.where_var = tk.StringVar()
+        where_label = tk.Label(self, text='Where:', bg='#F8F8FF')
+        where_label.grid(row=7, column=1)
+        where_entry = ttk.Entry(self, textvariable=self.where_var, width=40)
+        where_entry.grid(row=8, column=1)
+        self.cross_filter_var = tk.BooleanVar(value=True)
+        tk.Checkbutton(self, text='Only reports selected on the map', variable=self.cross_filter_var,
+                       bg='#F8F8FF').grid(row=9, column=1)
+
         export_button = CreateButton(self).button(img1='export_1.png', img2='export_2.png',
                                                   bg='#F8F8FF', command=self.export_graph)
         export_button.grid(row=20, column=0, sticky=tk.W, padx=170, columnspan=2)
+        back_to_graph = CreateButton(self).button(img1='back_graph_1.png', img2='back_graph_2.png', bg='#F8F8FF',
+                                                  command=self.parent.show_graphs_page)
+        back_to_graph.grid(row=20, column=0, sticky=tk.W)
 
         self.graph_canvas = tk.Canvas(self, bg='white', width=600, height=400)
         self.graph_canvas.grid(row=15, column=0, columnspan=2, sticky=tk.NSEW)
 
+        # One figure and canvas serve every preview: they are cleared and redrawn, never recreated
+        self.fig = Figure()
+        self.figure_canvas = FigureCanvasTkAgg(self.fig, master=self.graph_canvas)
+        self.graph_key = None
+
         self.columnconfigure(0, weight=1)
         self.columnconfigure(1, weight=1)
         self.columnconfigure(2, weight=1)
         self.rowconfigure(7, weight=1)
         self.rowconfigure(12, weight=1)
 
+    @traced()
     def create_graph(self):
         """
         Generate the selected graph based on user inputs.
@@ -518,33 +990,73 @@ class CreateYourOwnGraphPage(tk.Frame):
 
         if attribute_count == "1":
             y_column = None
+        self.graph_gen.where = self.where_var.get().strip()
+        self.graph_gen.select(self.parent.map_selection if self.cross_filter_var.get() else None)
+
+        # When only the color or the legend changed, the artists of the shown graph are updated in place
+        graph_key = (graph_type, x_column, y_column, self.graph_gen.data_key, self.graph_gen.data_version)
+        if graph_key == self.graph_key:
+            self.restyle_graph(color, show_legend)
+            self.display_graph()
+            return
+        if self.graph_gen.data.empty:
+            tk.messagebox.showerror('Error', 'No reports match the filter.')
+            return
 
+        self.fig.clear()
+        ax = self.fig.add_subplot()
         if graph_type == 'Histogram':
             self.graph_gen.generate_histogram(attribute=x_column, xlabel=x_column, ylabel='Frequency',
-                                              title=f'Histogram of {x_column}', color=color)
+                                              title=f'Histogram of {x_column}', color=color, ax=ax)
         elif graph_type == 'Pie Chart':
             self.graph_gen.generate_pie_chart(attribute=x_column, title=f'Pie Chart of {x_column}',
-                                              legend=show_legend)
+                                              legend=show_legend, ax=ax)
         elif graph_type == 'Line Graph':
             self.graph_gen.generate_line_graph(x_column=x_column, y_column=y_column,
                                                title=f'Line Graph of {x_column} and {y_column}'
                                                if y_column else f'Line Graph of {x_column}',
                                                xlabel=x_column, ylabel=y_column if y_column else 'Frequency',
-                                               color=color)
+                                               color=color, ax=ax)
         elif graph_type == 'Scatter Plot':
             self.graph_gen.generate_scatter_plot(x_column=x_column, y_column=y_column,
                                                  title=f'Scatter Plot of {x_column} and {y_column}'
                                                  if y_column else f'Scatter Plot of {x_column}',
                                                  xlabel=x_column, ylabel=y_column if y_column else 'Frequency',
-                                                 color=color)
+                                                 color=color, ax=ax)
         elif graph_type == 'Bar Graph':
             self.graph_gen.generate_bar_graph(x_column=x_column, y_column=y_column,
                                               title=f'Bar Graph of {x_column} and {y_column}'
                                               if y_column else f'Bar Graph of {x_column}',
                                               xlabel=x_column, ylabel=y_column if y_column else 'Frequency',
-                                              color=color)
+                                              color=color, ax=ax)
+        self.graph_key = graph_key
         self.display_graph()
 
+    def restyle_graph(self, color: str, show_legend: bool):
+        """
+        Change the color and the legend of the shown graph without drawing it again from the data.
+
+        :param color: The new color of the bars, lines or markers.
+        :param show_legend: Whether the pie chart shows its legend.
+        """
+        ax = self.fig.axes[0]
+        if self.graph_key[0] == 'Pie Chart':
+            if show_legend and ax.get_legend() is None:
+                ax.legend(loc='best')
+            elif not show_legend and ax.get_legend() is not None:
+                ax.get_legend().remove()
+            return
+        for patch in ax.patches:
+            patch.set_facecolor(color)
+        for line in ax.lines:
+            line.set_color(color)
+        for collection in ax.collections:
+            # Scatter plots use the one-letter color code, hexbin densities a colormap up to it
+            if collection.get_array() is not None:
+                collection.set_cmap(LinearSegmentedColormap.from_list('density', ['white', color[0]]))
+            else:
+                collection.set_facecolor(color[0])
+
     def graph_type_selected(self, event):
         """
         Handle selection of graph type from combobox.
@@ -622,17 +1134,26 @@ class CreateYourOwnGraphPage(tk.Frame):
             tk.messagebox.showerror('Error', 'Please fill in all the empty fields.')
             self.color_combobox.focus_set()
         else:
-            self.create_graph()
+            try:
+                self.create_graph()
+            except FilterError as error:
+                tk.messagebox.showerror('Error', f'Invalid filter: {error}')
 
+    @traced()
     def display_graph(self):
         """
         Display the generated graph on the canvas.
         """
-        self.graph_canvas.delete('all')
-        self.fig = plt.gcf()
-        self.fig.canvas = FigureCanvasTkAgg(self.fig, master=self.graph_canvas)
-        self.fig.canvas.draw()
-        self.fig.canvas.get_tk_widget().grid(row=0, column=0, sticky=tk.NSEW)
+        with span('FigureCanvasTkAgg.draw'):
+            self.figure_canvas.draw()
+        self.figure_canvas.get_tk_widget().grid(row=0, column=0, sticky=tk.NSEW)
+
+    def destroy(self):
+        """
+        Release the figure of the previews together with the page.
+        """
+        self.fig.clear()
+        super().destroy()
 
     def export_graph(self):
         """
@@ -653,6 +1174,7 @@ class ReportPage(tk.Frame):
     """
     A frame for submitting UFO sighting reports.
     """
+    @traced()
     def __init__(self, parent):
         """
         Initialize the ReportPage.
@@ -662,6 +1184,8 @@ class ReportPage(tk.Frame):
         super().__init__()
         self.parent = parent
         self.data_processor = self.parent.data_processor
+        self.data_processor.prepare_duplicate_detector()
+        self.suggested_location = ''
         self.configure(bg='#F8F8FF')
         self.init_components()
 
@@ -740,6 +1264,19 @@ class ReportPage(tk.Frame):
         for i in range(15):
             self.grid_rowconfigure(i, weight=1)
 
+    def enter(self):
+        """
+        Start every visit with an empty form.
+        """
+        for variable in (self.date_time_input, self.country_input, self.location_input, self.ufo_shape_input,
+                         self.length_of_encounter_input):
+            variable.set('')
+        self.lat_input.set('Click on the map.')
+        self.long_input.set('Click on the map.')
+        self.description_entry.delete('1.0', tk.END)
+        self.suggested_location = ''
+        self.map_view.fit_bounding_box((28.73, 91.20), (-9.5, 128.52))
+
     def set_country_combobox_value(self):
         """
         Set values for the country entry combobox.
@@ -779,6 +1316,23 @@ class ReportPage(tk.Frame):
         """
         self.lat_input.set(coordinates_tuple[0])
         self.long_input.set(coordinates_tuple[1])
+        self.autofill_place(*coordinates_tuple)
+
+    @traced()
+    def autofill_place(self, latitude: float, longitude: float):
+        """
+        Fill in the country and suggest the nearest known location of the clicked position.
+        A location typed by the user is not overwritten.
+
+        :param latitude: Latitude of the clicked position.
+        :param longitude: Longitude of the clicked position.
+        """
+        place = self.data_processor.reverse_geocode(latitude, longitude)
+        if place['country'] is not None:
+            self.country_input.set(place['country'])
+        if self.location_input.get() in ('', self.suggested_location):
+            self.suggested_location = place['location'] or ''
+            self.location_input.set(self.suggested_location)
 
     @staticmethod
     def validate_date(date_str) -> bool:
@@ -794,6 +1348,7 @@ class ReportPage(tk.Frame):
         except ValueError:
             return False
 
+    @traced()
     def submit_report(self):
         """
         Submit the UFO sighting report.
@@ -825,9 +1380,29 @@ class ReportPage(tk.Frame):
                                         'The "Encounter Duration" must contain only numerical values.')
                 return
 
-        tk.messagebox.showinfo('Report submitted', 'Report submitted successfully!')
-        self.data_processor.save_to_csv(date_time, country, location, latitude, longitude, ufo_shape,
-                                        length_of_encounter_seconds, description)
+        saved, duplicates = self.data_processor.submit_report(date_time, country, location, latitude, longitude,
+                                                              ufo_shape, length_of_encounter_seconds, description)
+        self.after(50, self.check_saved, saved, duplicates)
+
+    def check_saved(self, saved, duplicates: list):
+        """
+        Tell the user whether a submitted report was written, once the background writer is done.
+
+        :param saved: The Future of the submitted report.
+        :param duplicates: Report numbers of the reports that the submitted report likely duplicates.
+        """
+        if not saved.done():
+            self.after(50, self.check_saved, saved, duplicates)
+            return
+        self.data_processor.update_written()
+        if saved.exception() is not None:
+            tk.messagebox.showerror('Error', f'The report could not be saved: {saved.exception()}')
+            return
+        message = f"Report No. {saved.result()['report_no']} submitted successfully!"
+        if duplicates:
+            message += ('\n\nIt looks like the same sighting as report No. '
+                        f"{', '.join(str(report_no) for report_no in duplicates)}.")
+        tk.messagebox.showinfo('Report submitted', message)
 
 
 class UFOApp(tk.Tk):
@@ -849,8 +1424,36 @@ class UFOApp(tk.Tk):
         self.main_bg = ImageTk.PhotoImage(self.main_bg_image)
         self.title('UFORadarSEA')
         self.data_processor = data_processor
+        self.chart_renderer = ChartRenderer()
+        self.chart_renderer.start()
+        # Row positions of the reports matching the filter of the map page, or None without a filter
+        self.map_selection = None
         self.configure(bg='#354662')
         self.init_components()
+        self.after(SYNC_INTERVAL_MS, self.sync_reports)
+
+    def sync_reports(self):
+        """
+        Pick up the reports written by other running instances of the application, every few seconds. The
+        file is read on a background thread, so waiting for a lock held by another instance or reading a
+        rewritten file does not freeze the window.
+        """
+        self.check_synced(self.data_processor.start_sync())
+
+    def check_synced(self, fetching):
+        """
+        Bring the data up to date once the reports file was read, then wait for the next look.
+
+        :param fetching: The Future of UFODataProcessor.start_sync.
+        """
+        if not fetching.done():
+            self.after(50, self.check_synced, fetching)
+            return
+        try:
+            self.data_processor.sync(fetching.result())
+        except (OSError, TimeoutError):
+            pass
+        self.after(SYNC_INTERVAL_MS, self.sync_reports)
 
     def init_components(self):
         """
@@ -884,10 +1487,14 @@ class UFOApp(tk.Tk):
 
         self.main_menu.pack(expand=True)
 
-        self.map_page = MapPage(self)
-        self.report_page = ReportPage(self)
-        self.graphs_page = GraphsPage(self)
-        self.user_create_graph_page = CreateYourOwnGraphPage(self)
+        self.pages = PageManager(self, PAGE_RELEASE_MS)
+        self.pages.register('map', lambda: MapPage(self))
+        self.pages.register('report', lambda: ReportPage(self))
+        self.pages.register('graphs', lambda: GraphsPage(self))
+        self.pages.register('create_graph', lambda: CreateYourOwnGraphPage(self))
+        # Built up front so the first visit of every page is as quick as the later ones
+        for name in ('map', 'report', 'graphs', 'create_graph'):
+            self.pages.page(name)
 
         self.main_menu.grid_rowconfigure(0, weight=1)
         self.main_menu.grid_rowconfigure(1, weight=1)
@@ -895,41 +1502,41 @@ class UFOApp(tk.Tk):
         self.main_canvas.grid_columnconfigure(1, weight=1)
         self.main_canvas.grid_columnconfigure(2, weight=1)
 
+    @traced()
+    @track_navigation('map')
     def show_map_page(self):
         """
         Switch to the map page.
         """
-        self.map_page.pack(expand=True, fill=tk.BOTH)
+        self.pages.show('map')
         self.main_menu.pack_forget()
         self.configure(bg='#F8F8FF')
         self.back_button.pack(anchor=tk.W, expand=True)
 
+    @traced()
+    @track_navigation('report')
     def show_report_page(self):
         """
-        Switch to the report page.
+        Switch to the report page, with an empty form.
         """
-        self.report_page = ReportPage(self)
-        self.report_page.pack(expand=True, fill=tk.BOTH)
+        self.pages.show('report')
         self.main_menu.pack_forget()
         self.configure(bg='#F8F8FF')
         self.back_button.pack(anchor=tk.W, expand=True)
 
+    @traced()
+    @track_navigation('graphs')
     def show_graphs_page(self):
         """
         Switch to the graphs page.
         """
-        self.graphs_page = GraphsPage(self)
-        self.graphs_page.pack(expand=True, fill=tk.BOTH)
+        self.pages.show('graphs')
         self.main_menu.pack_forget()
-        self.user_create_graph_page.pack_forget()
         self.configure(bg='#F8F8FF')
         self.back_button.pack(anchor=tk.W, expand=True)
-        create_graph_button = CreateButton(self.graphs_page).button(img1='create_graph2.png',
-                                                                    img2='create_graph1.png',
-                                                                    bg='#F8F8FF',
-                                                                    command=self.show_user_create_graph_page)
-        create_graph_button.grid(row=0, column=0, sticky=tk.W)
 
+    @traced()
+    @track_navigation('main_menu')
     def show_main_menu(self):
         """
         Switch to the main menu.
@@ -938,28 +1545,25 @@ class UFOApp(tk.Tk):
             self.main_menu.pack(expand=True)
             self.configure(bg='#354662')
             matplotlib.pyplot.close('all')
-        self.map_page.pack_forget()
-        self.graphs_page.pack_forget()
-        self.report_page.pack_forget()
+        self.pages.hide()
         self.back_button.pack_forget()
 
+    @traced()
+    @track_navigation('create_graph')
     def show_user_create_graph_page(self):
         """
         Switch to the custom graph creation page.
         """
-        self.graphs_page.pack_forget()
+        self.pages.show('create_graph')
         self.back_button.pack_forget()
-        self.user_create_graph_page.pack(expand=True, fill=tk.BOTH)
-        self.back_to_graph = CreateButton(self.user_create_graph_page).button(img1='back_graph_1.png',
-                                                                              img2='back_graph_2.png',
-                                                                              bg='#F8F8FF',
-                                                                              command=self.show_graphs_page)
-        self.back_to_graph.grid(row=20, column=0, sticky=tk.W)
 
     def on_close(self):
         """
         Close the application.
         """
+        self.pages.close()
+        self.data_processor.close()
+        self.chart_renderer.close()
         matplotlib.pyplot.close('all')
         self.quit()
 